@@ -77,17 +77,20 @@ def commentFile( filename = '' ):
 			return
 		filename = unmodified[ 0 ]
 	print >> sys.stderr, ( 'File ' + filename + ' is being commented.' )
-	fileText = gcodec.getFileText( filename )
-	gcodec.writeFileMessageEnd( '_comment.gcode', filename, getCommentGcode( fileText ), 'The commented file is saved as ' )
+	gcodeFile = gcodec.getFileForReading( filename )
+	if gcodeFile == None:
+		return
+	gcodec.writeFileMessageEnd( '_comment.gcode', filename, getCommentGcode( gcodeFile ), 'The commented file is saved as ' )
+	gcodeFile.close()
 
 def getCommentGcode( gcodeText ):
-	"Get gcode text with added comments."
+	"Get gcode text with added comments, from a gcode text, toolpath or file."
 	skein = commentSkein()
 	skein.parseGcode( gcodeText )
 	return skein.output.getvalue()
 
 def getStatisticGcode( gcodeText ):
-	"Get statistics for a gcode text."
+	"Get statistics for a gcode text, toolpath or file."
 	skein = statisticSkein()
 	skein.parseGcode( gcodeText )
 	return skein.output.getvalue()
@@ -105,8 +108,11 @@ def statisticFile( filename = '' ):
 			return
 		filename = unmodified[ 0 ]
 	print >> sys.stderr, ( 'Statistics are being generated for the file ' + filename )
-	fileText = gcodec.getFileText( filename )
-	gcodec.writeFileMessageEnd( '.txt', filename, getStatisticGcode( fileText ), 'The statistics file is saved as ' )
+	gcodeFile = gcodec.getFileForReading( filename )
+	if gcodeFile == None:
+		return
+	gcodec.writeFileMessageEnd( '.txt', filename, getStatisticGcode( gcodeFile ), 'The statistics file is saved as ' )
+	gcodeFile.close()
 
 class commentSkein:
 	"A class to comment a gcode skein."
@@ -126,17 +132,16 @@ class commentSkein:
 
 	def parseGcode( self, gcodeText ):
 		"Parse gcode text and store the commented gcode."
-		lines = gcodec.getTextLines( gcodeText )
-		for line in lines:
-			self.parseLine( line )
+		for gcodeLine in gcodec.getGcodeLines( gcodeText ):
+			self.parseLine( gcodeLine )
 		print >> sys.stderr, ( self.output.getvalue() )
 
-	def parseLine( self, line ):
+	def parseLine( self, gcodeLine ):
 		"Parse a gcode line and add it to the commented gcode."
-		splitLine = line.split( ' ' )
+		splitLine = gcodeLine.splitLine
 		if len( splitLine ) < 1:
 			return
-		firstWord = splitLine[ 0 ]
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
 			self.linearMove( splitLine )
 		elif firstWord == 'G2':
@@ -165,21 +170,28 @@ class commentSkein:
 			self.addComment( "Turn fan on." )
 		elif firstWord == 'M107':
 			self.addComment( "Turn fan off." )
-		elif firstWord == '(<extrusionDiameter>':
+		else:
+			self.parseTag( gcodeLine )
+		self.output.write( gcodeLine.line + "\n" )
+
+	def parseTag( self, gcodeLine ):
+		"Comment a skeinforge tag line, for example '(<layerStart> 0.4 )'."
+		tag = gcodeLine.getTag()
+		splitLine = gcodeLine.splitLine
+		if tag == 'extrusionDiameter':
 			self.addComment( "Set extrusion diameter to " + str( gcodec.getDoubleAfterFirstLetter( splitLine[ 1 ] ) ) + " mm." )
-		elif firstWord == '(<extrusionWidth>':
+		elif tag == 'extrusionWidth':
 			self.addComment( "Set extrusion width to " + str( gcodec.getDoubleAfterFirstLetter( splitLine[ 1 ] ) ) + " mm." )
-		elif firstWord == '(<layerThickness>':
+		elif tag == 'layerThickness':
 			self.addComment( "Set layer thickness to " + str( gcodec.getDoubleAfterFirstLetter( splitLine[ 1 ] ) ) + " mm." )
-		elif firstWord == '(<procedureDone>':
+		elif tag == 'procedureDone':
 			self.addComment( "The " + splitLine[ 1 ][ 1 : ] + " procedure has been performed." )
-		elif firstWord == '(<extrusionStart>':
+		elif tag == 'extrusionStart':
 			self.addComment( "Initialization is finished, extrusion is starting." )
-		elif firstWord == '(<layerStart>':
+		elif tag == 'layerStart':
 			self.addComment( "New layer is starting." )
-		elif firstWord == '(<loop>':
+		elif tag == 'loop':
 			self.addComment( "Loop is starting." )
-		self.output.write( line + "\n" )
 
 	def setHelicalMoveEndpoint( self, splitLine ):
 		"Get the endpoint of a helical move."
@@ -217,22 +229,21 @@ class statisticSkein( commentSkein ):
 		self.extruderActive = active
 
 	def getLocationSetFeedrateToSplitLine( self, splitLine ):
-		location = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
-		indexOfF = gcodec.indexOfStartingWithSecond( "F", splitLine )
-		if indexOfF > 0:
-			self.feedrateMinute = gcodec.getDoubleAfterFirstLetter( splitLine[ indexOfF ] )
-		return location
+		"Get the location and set the feedrate from a single parse of the split line."
+		parsedMove = gcodec.getParsedMove( splitLine )
+		self.feedrateMinute = parsedMove.getFeedrateMinute( self.feedrateMinute )
+		return parsedMove.getLocation( self.oldLocation )
 
-	def helicalMove( self, isCounterclockwise, splitLine ):
+	def helicalMove( self, isCounterclockwise, gcodeLine ):
 		"Get statistics for a helical move."
 		if self.oldLocation == None:
 			return
-		location = self.getLocationSetFeedrateToSplitLine( splitLine )
+		location = self.getLocationSetFeedrateToSplitLine( gcodeLine.splitLine )
 		location.add( self.oldLocation )
 		center = Vec3().getFromVec3( self.oldLocation )
-		indexOfR = gcodec.indexOfStartingWithSecond( "R", splitLine )
-		if indexOfR > 0:
-			radius = gcodec.getDoubleAfterFirstLetter( splitLine[ indexOfR ] )
+		wordTable = gcodeLine.getWordTable()
+		if 'R' in wordTable:
+			radius = wordTable[ 'R' ]
 			halfLocationMinusOld = location.minus( self.oldLocation )
 			halfLocationMinusOld.scale( 0.5 )
 			halfLocationMinusOldLength = halfLocationMinusOld.length()
@@ -245,8 +256,8 @@ class statisticSkein( commentSkein ):
 			else:
 				center.setToVec3( halfLocationMinusOld.minus( centerMinusMidpoint ) )
 		else:
-			center.x = gcodec.getDoubleForLetter( "I", splitLine )
-			center.y = gcodec.getDoubleForLetter( "J", splitLine )
+			center.x = wordTable[ 'I' ]
+			center.y = wordTable[ 'J' ]
 		curveSection = 0.5
 		center.add( self.oldLocation )
 		afterCenterSegment = location.minus( center )
@@ -285,9 +296,8 @@ class statisticSkein( commentSkein ):
 		self.totalBuildTime = 0.0
 		self.totalDistanceExtruded = 0.0
 		self.totalDistanceTraveled = 0.0
-		lines = gcodec.getTextLines( gcodeText )
-		for line in lines:
-			self.parseLine( line )
+		for gcodeLine in gcodec.getGcodeLines( gcodeText ):
+			self.parseLine( gcodeLine )
 		averageFeedrate = self.totalDistanceTraveled / self.totalBuildTime
 		self.characters += self.numberOfLines
 		kilobytes = round( self.characters / 1024.0 )
@@ -323,33 +333,40 @@ class statisticSkein( commentSkein ):
 		print >> sys.stderr, ( self.output.getvalue() )
 		print >> sys.stderr, ( '' )
 
-	def parseLine( self, line ):
+	def parseLine( self, gcodeLine ):
 		"Parse a gcode line and add it to the commented gcode."
-		self.characters += len( line )
+		self.characters += len( gcodeLine.line )
 		self.numberOfLines += 1
-		splitLine = line.split( ' ' )
+		splitLine = gcodeLine.splitLine
 		if len( splitLine ) < 1:
 			return
-		firstWord = splitLine[ 0 ]
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
 			self.linearMove( splitLine )
 		elif firstWord == 'G2':
-			self.helicalMove( False, splitLine )
+			self.helicalMove( False, gcodeLine )
 		elif firstWord == 'G3':
-			self.helicalMove( True, splitLine )
+			self.helicalMove( True, gcodeLine )
 		elif firstWord == 'M100':
 			self.extruderSpeed = gcodec.getDoubleAfterFirstLetter( splitLine[ 1 ] )
 		elif firstWord == 'M101':
 			self.extruderSet( True )
 		elif firstWord == 'M103':
 			self.extruderSet( False )
-		elif firstWord == '(<extrusionDiameter>':
+		else:
+			self.parseTag( gcodeLine )
+
+	def parseTag( self, gcodeLine ):
+		"Get the extrusion and procedure statistics from a skeinforge tag line."
+		tag = gcodeLine.getTag()
+		splitLine = gcodeLine.splitLine
+		if tag == 'extrusionDiameter':
 			self.extrusionDiameter = gcodec.getDoubleAfterFirstLetter( splitLine[ 1 ] )
-		elif firstWord == '(<extrusionWidth>':
+		elif tag == 'extrusionWidth':
 			self.extrusionWidth = gcodec.getDoubleAfterFirstLetter( splitLine[ 1 ] )
-		elif firstWord == '(<layerThickness>':
+		elif tag == 'layerThickness':
 			self.layerThickness = gcodec.getDoubleAfterFirstLetter( splitLine[ 1 ] )
-		elif firstWord == '(<procedureDone>':
+		elif tag == 'procedureDone':
 			self.procedures.append( splitLine[ 1 ][ 1 : ] )
 
 
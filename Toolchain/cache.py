@@ -0,0 +1,169 @@
+"""
+Cache is a script to save the toolpath of each procedure in the skeinforge chain, so that a procedure is only done again when its input text
+or its preferences change.
+
+The toolpath of each procedure is saved in the skeinforge_cache folder in the home directory, in a file named by the hash of the source
+code, the procedure name, the procedure preferences which change the toolpath and the input text.  If the 'Cache Toolpaths' preference is
+not chosen, nothing is read from or written to the cache.  When the files in the cache folder take more than the 'Maximum Cache Size'
+preference, the least recently used files are deleted until the rest fit.  The 'Clear Cache' button deletes all the cached toolpaths.  To
+change the preferences, in a shell type:
+> python cache.py
+
+To run cache, install python 2.x on your machine, which is avaliable from http://www.python.org/download/
+
+To use the preferences dialog you'll also need Tkinter, which probably came with the python installation.  If it did not, look for it at:
+www.tcl.tk/software/tcltk/
+
+"""
+
+import gcodec
+import hashlib
+import os
+import preferences
+import sys
+
+
+__author__ = "Enrique Perez (perez_enrique@yahoo.com)"
+__date__ = "$Date: 2008/21/04 $"
+__license__ = "GPL 3.0"
+
+
+globalCacheDirectory = os.path.join( os.path.expanduser( '~' ), 'skeinforge_cache' )
+globalSourceDigest = None
+
+def getCacheFilenames():
+	"Get the names of the cached toolpath files, from the least recently used to the most recently used."
+	if not os.path.isdir( globalCacheDirectory ):
+		return []
+	timeFilenames = []
+	for filename in os.listdir( globalCacheDirectory ):
+		if filename.endswith( '.gcode' ):
+			cacheFilename = os.path.join( globalCacheDirectory, filename )
+			try:
+				timeFilenames.append( ( os.path.getmtime( cacheFilename ), cacheFilename ) )
+			except OSError:
+				pass
+	timeFilenames.sort()
+	return [ timeFilename[ 1 ] for timeFilename in timeFilenames ]
+
+def getCacheKey( gcodeText, procedure, procedurePreferences ):
+	"""Get the hex digest of the source code, the procedure name, the procedure preferences which change the toolpath and the text, which names the cached toolpath.  The lines of a toolpath are digested one at a time, without joining them into a text.
+
+	Keyword arguments:
+	gcodeText -- gcode text, gnu triangulated surface text or toolpath
+	procedure -- name of the procedure, for example 'comb'
+	procedurePreferences -- preferences of the procedure"""
+	digest = hashlib.md5( getSourceDigest() )
+	digest.update( procedure + '\n' )
+	for preference in procedurePreferences.archive:
+		if preference not in procedurePreferences.nonOutputArchive:
+			digest.update( preference.name + '\t' + preference.getValueString() + '\n' )
+	if isinstance( gcodeText, gcodec.Toolpath ):
+		for gcodeLine in gcodeText.gcodeLines:
+			digest.update( gcodeLine.line + '\n' )
+	else:
+		digest.update( gcodeText )
+	return digest.hexdigest()
+
+def getCachedToolpath( gcodeText, procedure, procedurePreferences, toolpathFunction ):
+	"""Get the toolpath of a procedure from the cache if the procedure was already done on the same text with the same preferences, otherwise do the procedure and cache its toolpath.
+
+	Keyword arguments:
+	gcodeText -- gcode text, gnu triangulated surface text or toolpath
+	procedure -- name of the procedure, for example 'comb'
+	procedurePreferences -- preferences of the procedure
+	toolpathFunction -- function of the text and preferences which does the procedure"""
+	cachePreferences = CachePreferences()
+	preferences.readPreferences( cachePreferences )
+	if not cachePreferences.cacheToolpaths.value:
+		return toolpathFunction( gcodeText, procedurePreferences )
+	cacheKey = getCacheKey( gcodeText, procedure, procedurePreferences )
+	cacheFilename = os.path.join( globalCacheDirectory, cacheKey + '_' + procedure + '.gcode' )
+	if os.path.isfile( cacheFilename ):
+		cachedText = gcodec.getFileText( cacheFilename )
+		if cachedText.endswith( '\n' ):
+			cachedText = cachedText[ : - 1 ]
+		try:
+			os.utime( cacheFilename, None )
+		except OSError:
+			pass
+		return gcodec.getToolpath( cachedText )
+	toolpath = toolpathFunction( gcodeText, procedurePreferences )
+	writeCacheFile( cacheFilename, toolpath )
+	pruneCache( int( round( cachePreferences.maximumCacheSize.value * 1048576.0 ) ) )
+	return toolpath
+
+def getSourceDigest():
+	"Get the hex digest of the python files in the cache folder, so that the cached toolpaths are not used after the code changes."
+	global globalSourceDigest
+	if globalSourceDigest != None:
+		return globalSourceDigest
+	digest = hashlib.md5()
+	directory = os.path.dirname( os.path.abspath( __file__ ) )
+	for filename in sorted( os.listdir( directory ) ):
+		if filename.endswith( '.py' ):
+			digest.update( gcodec.getFileText( os.path.join( directory, filename ) ) )
+	globalSourceDigest = digest.hexdigest()
+	return globalSourceDigest
+
+def pruneCache( maximumBytes ):
+	"Delete the least recently used cached toolpaths until the rest take no more than the maximum number of bytes."
+	cacheFilenames = getCacheFilenames()
+	fileSizes = []
+	for cacheFilename in cacheFilenames:
+		try:
+			fileSizes.append( os.path.getsize( cacheFilename ) )
+		except OSError:
+			fileSizes.append( 0 )
+	totalSize = sum( fileSizes )
+	for cacheFilenameIndex in xrange( len( cacheFilenames ) ):
+		if totalSize <= maximumBytes:
+			return
+		try:
+			os.remove( cacheFilenames[ cacheFilenameIndex ] )
+		except OSError:
+			pass
+		totalSize -= fileSizes[ cacheFilenameIndex ]
+
+def writeCacheFile( cacheFilename, toolpath ):
+	"""Write a toolpath to a temporary file and then rename it to the cache filename, so that a partly written file is never read from the cache.
+
+	Keyword arguments:
+	cacheFilename -- name of the cached file
+	toolpath -- toolpath which will be cached"""
+	temporaryFilename = cacheFilename + '.' + str( os.getpid() )
+	try:
+		if not os.path.isdir( globalCacheDirectory ):
+			os.makedirs( globalCacheDirectory )
+		gcodec.writeToolpathFile( temporaryFilename, toolpath )
+		os.rename( temporaryFilename, cacheFilename )
+	except OSError:
+		print >> sys.stderr, ( 'The toolpath could not be cached in ' + cacheFilename )
+
+
+class CachePreferences:
+	"A class to handle the cache preferences."
+	def __init__( self ):
+		"Set the default preferences, execute title & preferences filename."
+		#Set the default preferences.
+		self.cacheToolpaths = preferences.BooleanPreference().getFromValue( 'Cache Toolpaths:', True )
+		self.maximumCacheSize = preferences.FloatPreference().getFromValue( 'Maximum Cache Size (megabytes):', 100.0 )
+		#Create the archive, title of the execute button, title of the dialog & preferences filename.
+		self.archive = [ self.cacheToolpaths, self.maximumCacheSize ]
+		self.executeTitle = 'Clear Cache'
+		self.filenamePreferences = 'cache.csv'
+		self.filenameHelp = 'cache.html'
+		self.title = 'Cache Preferences'
+
+	def execute( self ):
+		"Clear Cache button has been clicked."
+		pruneCache( 0 )
+		print >> sys.stderr, ( 'The cached toolpaths in ' + globalCacheDirectory + ' have been deleted.' )
+
+
+def main( hashtable = None ):
+	"Display the cache dialog."
+	preferences.displayDialog( CachePreferences() )
+
+if __name__ == "__main__":
+	main()
@@ -94,7 +94,7 @@ many lines of gcode
 """
 import sys
 from vec3 import Vec3
-import cStringIO
+import cache
 import euclidean
 import fill
 import gcodec
@@ -124,11 +124,11 @@ def combChainFile( filename = '' ):
 	preferences.readPreferences( combPreferences )
 	startTime = time.time()
 	print >> sys.stderr, ( 'File ' + gcodec.getSummarizedFilename( filename ) + ' is being chain combed.' )
-	gcodeText = gcodec.getFileText( filename )
+	gcodeText = gcodec.getFileText( filename, gcodec.getReadMode( filename ) )
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_comb.gcode'
-	gcodec.writeFileText( suffixFilename, getCombChainGcode( gcodeText, combPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getCombChainToolpath( gcodeText, combPreferences ) )
 	print >> sys.stderr, ( 'The combed file is saved as ' + gcodec.getSummarizedFilename( suffixFilename ) )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 	print >> sys.stderr, ( 'It took ' + str( int( round( time.time() - startTime ) ) ) + ' seconds to comb the file.' )
@@ -152,30 +152,42 @@ def combFile( filename = '' ):
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_comb.gcode'
-	gcodec.writeFileText( suffixFilename, getCombGcode( gcodeText, combPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getCombToolpath( gcodeText, combPreferences ) )
 	print >> sys.stderr, ( 'The combed file is saved as ' + suffixFilename )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 
 def getCombChainGcode( gcodeText, combPreferences = None ):
 	"Comb a gcode linear move text.  Chain comb the gcode if it is not already combed."
+	return getCombChainToolpath( gcodeText, combPreferences ).getvalue()
+
+def getCombChainToolpath( gcodeText, combPreferences = None ):
+	"Comb a gcode linear move text or toolpath into a toolpath.  Chain comb the gcode if it is not already combed."
 	if not gcodec.isProcedureDone( gcodeText, 'fill' ):
-		gcodeText = fill.getFillChainGcode( gcodeText )
-	return getCombGcode( gcodeText, combPreferences )
+		gcodeText = fill.getFillChainToolpath( gcodeText )
+	if combPreferences == None:
+		combPreferences = CombPreferences()
+		preferences.readPreferences( combPreferences )
+	return cache.getCachedToolpath( gcodeText, 'comb', combPreferences, getCombToolpath )
 
 def getCombGcode( gcodeText, combPreferences = None ):
 	"Comb a gcode linear move text."
-	if gcodeText == '':
-		return ''
-	if gcodec.isProcedureDone( gcodeText, 'comb' ):
-		return gcodeText
+	return getCombToolpath( gcodeText, combPreferences ).getvalue()
+
+def getCombToolpath( gcodeText, combPreferences = None ):
+	"Comb a gcode linear move text or toolpath into a toolpath."
+	toolpath = gcodec.getToolpath( gcodeText )
+	if len( toolpath.gcodeLines ) < 1:
+		return toolpath
+	if gcodec.isProcedureDone( toolpath, 'comb' ):
+		return toolpath
 	if combPreferences == None:
 		combPreferences = CombPreferences()
 		preferences.readPreferences( combPreferences )
 	if not combPreferences.comb.value:
-		return gcodeText
+		return toolpath
 	skein = CombSkein()
-	skein.parseGcode( gcodeText )
-	return skein.output.getvalue()
+	skein.parseGcode( toolpath )
+	return skein.output
 
 def isLoopNumberEqual( betweenX, betweenXIndex, loopNumber ):
 	"Determine if the loop number is equal."
@@ -187,6 +199,7 @@ class CombSkein:
 	"A class to comb a skein of extrusions."
 	def __init__( self ):
 		self.betweens = None
+		self.boundingBetweens = None
 		self.bridgeExtrusionWidthOverSolid = 1.0
 		self.extruderActive = False
 		self.fillInset = 0.18
@@ -201,23 +214,23 @@ class CombSkein:
 		self.loop = None
 		self.oldLocation = None
 		self.oldZ = None
-		self.output = cStringIO.StringIO()
+		self.output = gcodec.Toolpath()
 		self.pointTable = {}
 
 	def addGcodeMovement( self, point ):
 		"Add a movement to the output."#later add feedrate
-		self.addLine( "G1 X" + euclidean.getRoundedToThreePlaces( point.x ) + " Y" + euclidean.getRoundedToThreePlaces( point.y ) + " Z" + euclidean.getRoundedToThreePlaces( point.z ) )
+		self.output.addLinearMove( point )
 
-	def addIfTravel( self, splitLine ):
+	def addIfTravel( self, gcodeLine ):
 		"Add travel move around loops if this the extruder is off."
-		location = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
+		location = gcodec.getLocationFromGcodeLine( self.oldLocation, gcodeLine )
 		if not self.extruderActive and self.oldLocation != None:
 			self.insertPathsBetween( self.getOutloopLocation( location ), self.getOutloopLocation( self.oldLocation ) )
 		self.oldLocation = location
 
 	def addLine( self, line ):
 		"Add a line of text and a newline to the output."
-		self.output.write( line + "\n" )
+		self.output.addLine( line )
 
 	def addPathBetween( self, betweenFirst, betweenSecond, loopFirst ):
 		"Add a path between the perimeter and the fill."
@@ -254,7 +267,7 @@ class CombSkein:
 		self.isLoop = False
 		if self.loop != None:
 			self.loop.append( location )
-			self.pointTable[ str( location ) ] = True
+			self.pointTable[ location ] = True
 
 	def getBetweens( self ):
 		"Set betweens for the layer."
@@ -271,18 +284,36 @@ class CombSkein:
 					if euclidean.getMaximumSpan( inset ) > self.layerFillInset:
 						if euclidean.isPathInsideLoop( loop, inset ) != euclidean.isWiddershins( loop ):
 							self.betweens.append( inset )
+		self.boundingBetweens = []
+		for between in self.betweens:
+			self.boundingBetweens.append( euclidean.BoundingLoop().getFromLoop( between ) )
 		return self.betweens
 
+	def getBoundingBetweens( self ):
+		"Get the bounding loops of the betweens for the layer."
+		self.getBetweens()
+		return self.boundingBetweens
+
 	def getOutloopLocation( self, point ):
 		"Get location outside of loop."
-		if str( point ) not in self.pointTable:
+		if point not in self.pointTable:
 			return point
 		closestBetween = None
+		closestBetweenIndex = None
 		closestDistanceSquaredIndex = complex( 999999999999999999.0, - 1 )
-		for between in self.getBetweens():
-			distanceSquaredIndex = euclidean.getNearestDistanceSquaredIndex( point, between )
-			if distanceSquaredIndex.real < closestDistanceSquaredIndex.real:
-				closestBetween = between
+		betweens = self.getBetweens()
+		boundingDistancesSquared = []
+		for betweenIndex in range( len( betweens ) ):
+			boundingDistanceSquared = self.boundingBetweens[ betweenIndex ].getPlaneDistanceSquared( point )
+			boundingDistancesSquared.append( ( boundingDistanceSquared, betweenIndex ) )
+		boundingDistancesSquared.sort()
+		for boundingDistanceSquared, betweenIndex in boundingDistancesSquared:
+			if 0.999 * boundingDistanceSquared > closestDistanceSquaredIndex.real:
+				break
+			distanceSquaredIndex = euclidean.getNearestDistanceSquaredIndex( point, betweens[ betweenIndex ] )
+			if ( distanceSquaredIndex.real, betweenIndex ) < ( closestDistanceSquaredIndex.real, closestBetweenIndex ):
+				closestBetween = betweens[ betweenIndex ]
+				closestBetweenIndex = betweenIndex
 				closestDistanceSquaredIndex = distanceSquaredIndex
 		if closestBetween == None:
 			print >> sys.stderr, ( 'This should never happen, closestBetween should always exist.' )
@@ -308,10 +339,16 @@ class CombSkein:
 		nextBeginningRotated = euclidean.getRoundZAxisByPlaneAngle( segmentYMirror, nextBeginning )
 		y = pathEndRotated.y
 		z = pathEndRotated.z
-		for betweenIndex in range( len( self.getBetweens() ) ):
-			between = self.getBetweens()[ betweenIndex ]
-			betweenRotated = euclidean.getPathRoundZAxisByPlaneAngle( segmentYMirror, between )
-			euclidean.addXIntersections( betweenRotated, betweenIndex, switchX, y )
+		betweens = self.getBetweens()
+		boundingBetweens = self.getBoundingBetweens()
+		outsetComplex = complex( 0.01 * self.layerFillInset, 0.01 * self.layerFillInset )
+		segmentMaximum = euclidean.getComplexMaximum( nextBeginning.dropAxis( 2 ), pathEnd.dropAxis( 2 ) ) + outsetComplex
+		segmentMinimum = euclidean.getComplexMinimum( nextBeginning.dropAxis( 2 ), pathEnd.dropAxis( 2 ) ) - outsetComplex
+		for betweenIndex in range( len( betweens ) ):
+			if boundingBetweens[ betweenIndex ].isOverlapping( segmentMaximum, segmentMinimum ):
+				between = betweens[ betweenIndex ]
+				betweenRotated = euclidean.getPathRoundZAxisByPlaneAngle( segmentYMirror, between )
+				euclidean.addXIntersections( betweenRotated, betweenIndex, switchX, y )
 		switchX.sort( euclidean.compareSolidXByX )
 		maximumX = max( pathEndRotated.x, nextBeginningRotated.x )
 		minimumX = min( pathEndRotated.x, nextBeginningRotated.x )
@@ -330,31 +367,29 @@ class CombSkein:
 				self.addPathBetween( betweenFirst, betweenSecond, loopFirst )
 			betweenXIndex += 1
 
-	def linearMove( self, splitLine ):
+	def linearMove( self, gcodeLine ):
 		"Add a linear move to the loop."
-		location = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
+		location = gcodec.getLocationFromGcodeLine( self.oldLocation, gcodeLine )
 		if self.extruderActive:
 			self.addToLoop( location )
 		self.oldLocation = location
 
 	def parseGcode( self, gcodeText ):
-		"Parse gcode text and store the comb gcode."
-		self.lines = gcodec.getTextLines( gcodeText )
-		for line in self.lines:
-			self.parseLine( line )
+		"Parse gcode text or toolpath and store the comb gcode."
+		self.lines = gcodec.getToolpath( gcodeText ).gcodeLines
+		for gcodeLine in self.lines:
+			self.parseLine( gcodeLine )
 		self.oldLocation = None
 		for lineIndex in range( len( self.lines ) ):
-			line = self.lines[ lineIndex ]
-			self.parseAddTravel( line )
+			gcodeLine = self.lines[ lineIndex ]
+			self.parseAddTravel( gcodeLine )
 
-	def parseLine( self, line ):
+	def parseLine( self, gcodeLine ):
 		"Parse a gcode line."
-		splitLine = line.split( ' ' )
-		if len( splitLine ) < 1:
-			return 0
-		firstWord = splitLine[ 0 ]
+		splitLine = gcodeLine.splitLine
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
-			self.linearMove( splitLine )
+			self.linearMove( gcodeLine )
 		if firstWord == 'M101':
 			self.extruderActive = True
 		if firstWord == 'M103':
@@ -373,14 +408,12 @@ class CombSkein:
 		elif firstWord == '(<fillInset>':
 			self.fillInset = float( splitLine[ 1 ] )
 
-	def parseAddTravel( self, line ):
+	def parseAddTravel( self, gcodeLine ):
 		"Parse a gcode line and add it to the comb skein."
-		splitLine = line.split( ' ' )
-		if len( splitLine ) < 1:
-			return
-		firstWord = splitLine[ 0 ]
+		splitLine = gcodeLine.splitLine
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
-			self.addIfTravel( splitLine )
+			self.addIfTravel( gcodeLine )
 		elif firstWord == 'M101':
 			self.extruderActive = True
 		elif firstWord == 'M103':
@@ -393,7 +426,7 @@ class CombSkein:
 			self.layerZ = float( splitLine[ 1 ] )
 		elif firstWord == '(<bridgeLayer>':
 			self.layerFillInset = self.fillInset * self.bridgeExtrusionWidthOverSolid
-		self.addLine( line )
+		self.output.addGcodeLine( gcodeLine )
 
 
 class CombPreferences:
@@ -402,12 +435,15 @@ class CombPreferences:
 		"Set the default preferences, execute title & preferences filename."
 		#Set the default preferences.
 		self.comb = preferences.BooleanPreference().getFromValue( 'Comb Hair:', True )
+		self.directoryProcesses = preferences.IntPreference().getFromValue( 'Directory Processes (count):', 1 )
 		directoryRadio = []
 		self.directoryPreference = preferences.RadioLabel().getFromRadioLabel( 'Comb All Unmodified Files in a Directory', 'File or Directory Choice:', directoryRadio, False )
 		self.filePreference = preferences.Radio().getFromRadio( 'Comb File', directoryRadio, True )
-		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ) ], 'Open File to be Combed', '' )
+		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ), ( 'STL files', '*.stl' ) ], 'Open File to be Combed', '' )
 		#Create the archive, title of the execute button, title of the dialog & preferences filename.
-		self.archive = [ self.comb, self.directoryPreference, self.filePreference, self.filenameInput ]
+		self.archive = [ self.comb, self.directoryProcesses, self.directoryPreference, self.filePreference, self.filenameInput ]
+		#The preferences which do not change the toolpath are left out of the cache key.
+		self.nonOutputArchive = [ self.directoryProcesses, self.directoryPreference, self.filePreference, self.filenameInput ]
 		self.executeTitle = 'Comb'
 #		self.filename = getPreferencesFilePath( 'comb.csv' )
 		self.filenamePreferences = 'comb.csv'
@@ -417,8 +453,7 @@ class CombPreferences:
 	def execute( self ):
 		"Comb button has been clicked."
 		filenames = gcodec.getGcodeDirectoryOrFile( self.directoryPreference.value, self.filenameInput.value, self.filenameInput.wasCancelled )
-		for filename in filenames:
-			combChainFile( filename )
+		gcodec.processFiles( combChainFile, filenames, self.directoryProcesses.value )
 
 
 def main( hashtable = None ):
@@ -1,5 +1,6 @@
 import Image, ImageDraw, ImageChops
 from GifImagePlugin import getheader, getdata
+import gcodec
 
 # Get the entire text of a file.
 # @param  filename name of the file
@@ -71,6 +72,7 @@ class g2gif:
         self.last_pos = vec3()
         self.last_pos.z = 999
         self.do_move = 1
+        self.feedrateMinute = None
         fileText = getFileText( filename )
         textLines = getTextLines( fileText )
         self.images = []
@@ -94,27 +96,14 @@ class g2gif:
         if firstWord == 'M101':
             self.do_move = 1
 
-    # Set the feedrate to the gcode split line.
-    def setFeedrate( self, splitLine ):
-        indexOfF = indexOfStartingWithSecond( "F", splitLine )
-        if indexOfF > 0:
-            self.feedrateMinute = getDoubleAfterFirstLetter( splitLine[ indexOfF ] )
-
-    # Set a point to the gcode split line.
-    def setPointComponent( self, point, splitLine ):
-        point.x = getDoubleForLetter( "X", splitLine )
-        point.y = getDoubleForLetter( "Y", splitLine )
-        indexOfZ = indexOfStartingWithSecond( "Z", splitLine )
-        if indexOfZ > 0:
-            point.z = getDoubleAfterFirstLetter( splitLine[ indexOfZ ] )
-
     def scale(self, x, y):
         return x * 5 + 150, -y * 5 + 100
 
     def linearMove( self, splitLine ):
         location = vec3()
-        self.setFeedrate( splitLine )
-        self.setPointComponent( location, splitLine )
+        parsedMove = gcodec.getParsedMove( splitLine )
+        self.feedrateMinute = parsedMove.getFeedrateMinute( self.feedrateMinute )
+        parsedMove.setPointComponents( location )
         if location.z != self.last_pos.z:
             if self.image:
                 for i in range(10):
@@ -31,6 +31,7 @@ try:
 except:
 	pass
 from vec3 import Vec3
+import heapq
 import math
 
 
@@ -74,6 +75,26 @@ def addXIntersectionsFromLoops( loops, solidIndex, xIntersectionList, y ):
 	for loop in loops:
 		addXIntersections( loop, solidIndex, xIntersectionList, y )
 
+def addXIntersectionsToTable( loop, solidIndex, xIntersectionsTable, front, width ):
+	"Add the x intersections of the loop to the list of each line of the table, which is at the front plus the line index times the width."
+	numberOfLines = len( xIntersectionsTable )
+	solidIndexFloat = float( solidIndex )
+	for pointIndex in xrange( len( loop ) ):
+		pointFirst = loop[ pointIndex ]
+		pointSecond = loop[ ( pointIndex + 1 ) % len( loop ) ]
+		beginLine = max( int( math.floor( ( min( pointFirst.y, pointSecond.y ) - front ) / width ) ) - 1, 0 )
+		endLine = min( int( math.ceil( ( max( pointFirst.y, pointSecond.y ) - front ) / width ) ) + 2, numberOfLines )
+		for lineIndex in xrange( beginLine, endLine ):
+			y = front + float( lineIndex ) * width
+			if ( y > pointFirst.y ) != ( y > pointSecond.y ):
+				xIntersection = getXIntersection( pointFirst, pointSecond, y )
+				xIntersectionsTable[ lineIndex ].append( complex( xIntersection, solidIndexFloat ) )
+
+def addXIntersectionsToTableFromLoops( loops, solidIndex, xIntersectionsTable, front, width ):
+	"Add the x intersections of the loops to the list of each line of the table."
+	for loop in loops:
+		addXIntersectionsToTable( loop, solidIndex, xIntersectionsTable, front, width )
+
 def compareSolidXByX( solidXFirst, solidXSecond ):
 	if solidXFirst.real > solidXSecond.real:
 		return 1
@@ -102,12 +123,19 @@ def getAroundLoop( begin, end, loop ):
 
 def getAwayPath( path, radius ):
 	"Get a loop with only the points that are far enough away from each other."
-	away = []
 	overlapDistanceSquared = 0.0001 * radius * radius
-	for pointIndex in range( len( path ) ):
-		if not isClose( overlapDistanceSquared, path, pointIndex ):
-			point = path[ pointIndex ]
+	if overlapDistanceSquared <= 0.0:
+		return path[ : ]
+	away = []
+	cellTable = {}
+	cellWidth = 1.01 * math.sqrt( overlapDistanceSquared )
+	for point in path:
+		cellKey = ( int( math.floor( point.x / cellWidth ) ), int( math.floor( point.y / cellWidth ) ) )
+		if not isCloseToCellPoints( cellKey, cellTable, overlapDistanceSquared, point ):
 			away.append( point )
+		if cellKey not in cellTable:
+			cellTable[ cellKey ] = []
+		cellTable[ cellKey ].append( point )
 	return away
 
 def getComplexMaximum( firstComplex, secondComplex ):
@@ -132,11 +160,26 @@ def getComplexMinimumFromVec3List( vec3List ):
 		minimum = getComplexMinimum( minimum, point.dropAxis( 2 ) )
 	return minimum
 
+def getContainerTables( loops ):
+	"Get a table for each loop of the indexes of the other loops which it is inside."
+	boundingLoops = []
+	for loop in loops:
+		boundingLoops.append( BoundingLoop().getFromLoop( loop ) )
+	containerTables = []
+	for loopIndex in xrange( len( loops ) ):
+		containerTable = {}
+		leftPoint = getLeftPoint( loops[ loopIndex ] )
+		for containerIndex in xrange( len( boundingLoops ) ):
+			if containerIndex != loopIndex:
+				if boundingLoops[ containerIndex ].isPointInside( leftPoint ):
+					containerTable[ containerIndex ] = True
+		containerTables.append( containerTable )
+	return containerTables
+
 def getDistanceSquaredToPlaneSegment( segmentBegin, segmentEnd, point ):
 	"Get the distance squared from a point to the x & y components of a segment."
 	segmentDifference = segmentEnd.minus( segmentBegin )
-	pointMinusSegmentBegin = point.minus( segmentBegin )
-	beginPlaneDot = getPlaneDot( pointMinusSegmentBegin, segmentDifference )
+	beginPlaneDot = ( point.x - segmentBegin.x ) * segmentDifference.x + ( point.y - segmentBegin.y ) * segmentDifference.y
 	if beginPlaneDot <= 0.0:
 		return point.distance2( segmentBegin )
 	differencePlaneDot = getPlaneDot( segmentDifference, segmentDifference )
@@ -144,8 +187,8 @@ def getDistanceSquaredToPlaneSegment( segmentBegin, segmentEnd, point ):
 		return point.distance2( segmentEnd )
 	intercept = beginPlaneDot / differencePlaneDot
 	segmentDifference.scale( intercept )
-	interceptPerpendicular = segmentBegin.plus( segmentDifference )
-	return point.distance2( interceptPerpendicular )
+	segmentDifference.add( segmentBegin ) # the segment difference is now the intercept perpendicular, without allocating another Vec3
+	return point.distance2( segmentDifference )
 
 def getFillOfSurroundings( surroundingLoops ):
 	"Get extra fill loops of surrounding loops."
@@ -173,10 +216,11 @@ def getHalfSimplifiedLoop( loop, radius, remainder ):
 
 def getInsidesAddToOutsides( loops, outsides ):
 	"Add loops to either the insides or outsides."
+	containerTables = getContainerTables( loops )
 	insides = []
 	for loopIndex in range( len( loops ) ):
 		loop = loops[ loopIndex ]
-		if isInsideOtherLoops( loopIndex, loops ):
+		if len( containerTables[ loopIndex ] ) > 0:
 			insides.append( loop )
 		else:
 			outsides.append( loop )
@@ -225,14 +269,14 @@ def getNearestPathDistanceSquaredIndex( point, path ):
 
 def getNearestPointOnSegment( segmentBegin, segmentEnd, point ):
 	segmentDifference = segmentEnd.minus( segmentBegin )
-	pointMinusSegmentBegin = point.minus( segmentBegin )
-	beginPlaneDot = getPlaneDot( pointMinusSegmentBegin, segmentDifference )
+	beginPlaneDot = ( point.x - segmentBegin.x ) * segmentDifference.x + ( point.y - segmentBegin.y ) * segmentDifference.y
 	differencePlaneDot = getPlaneDot( segmentDifference, segmentDifference )
 	intercept = beginPlaneDot / differencePlaneDot
 	intercept = max( intercept, 0.0 )
 	intercept = min( intercept, 1.0 )
 	segmentDifference.scale( intercept )
-	return segmentBegin.plus( segmentDifference )
+	segmentDifference.add( segmentBegin )
+	return segmentDifference
 
 def getNumberOfIntersectionsToLeft( leftPoint, loop ):
 	"Get the number of intersections through the loop for the line starting from the left point and going left."
@@ -247,6 +291,19 @@ def getNumberOfIntersectionsToLeft( leftPoint, loop ):
 				numberOfIntersectionsToLeft += 1
 	return numberOfIntersectionsToLeft
 
+def getOverlappingLoops( boundingLoops, segmentBegin, segmentEnd, outset ):
+	"Get the loops whose bounding rectangles overlap the bounding rectangle of the segment outset by a distance."
+	outsetComplex = complex( outset, outset )
+	segmentBeginComplex = segmentBegin.dropAxis( 2 )
+	segmentEndComplex = segmentEnd.dropAxis( 2 )
+	segmentMaximum = getComplexMaximum( segmentBeginComplex, segmentEndComplex ) + outsetComplex
+	segmentMinimum = getComplexMinimum( segmentBeginComplex, segmentEndComplex ) - outsetComplex
+	overlappingLoops = []
+	for boundingLoop in boundingLoops:
+		if boundingLoop.isOverlapping( segmentMaximum, segmentMinimum ):
+			overlappingLoops.append( boundingLoop.loop )
+	return overlappingLoops
+
 def getPathLength( path ):
 	"Get the length of a path ( an open polyline )."
 	pathLength = 0.0
@@ -285,7 +342,9 @@ def getPointMinimum( firstPoint, secondPoint ):
 
 def getPointPlusSegmentWithLength( length, point, segment ):
 	"Get point plus a segment scaled to a given length."
-	return segment.times( length / segment.length() ).plus( point )
+	pointPlusSegment = segment.times( length / segment.length() )
+	pointPlusSegment.add( point )
+	return pointPlusSegment
 
 def getPolar( angle, radius ):
 	"""Get polar complex from counterclockwise angle from 1, 0 and radius.
@@ -405,8 +464,11 @@ def getSimplifiedLoop( loop, radius ):
 	maximumIndex = len( loop ) * simplificationMultiplication
 	pointIndex = 1
 	while pointIndex < maximumIndex:
+		oldLoopLength = len( loop )
 		loop = getHalfSimplifiedLoop( loop, simplificationRadius, 0 )
 		loop = getHalfSimplifiedLoop( loop, simplificationRadius, 1 )
+		if simplificationRadius == radius and len( loop ) == oldLoopLength:
+			return getAwayPath( loop, radius )
 		simplificationRadius += simplificationRadius
 		simplificationRadius = min( simplificationRadius, radius )
 		pointIndex += pointIndex
@@ -414,11 +476,33 @@ def getSimplifiedLoop( loop, radius ):
 
 def getSurroundingLoops( extrusionWidth, loops ):
 	"Get surrounding loops from loops."
-	outsides = []
-	insides = getInsidesAddToOutsides( loops, outsides )
+	return getSurroundingLoopsFromIndexes( getContainerTables( loops ), extrusionWidth, range( len( loops ) ), loops )
+
+def getSurroundingLoopsFromIndexes( containerTables, extrusionWidth, loopIndexes, loops ):
+	"Get surrounding loops from the loops at the indexes, nesting them by the tables of the loops each loop is inside."
+	loopIndexTable = {}
+	for loopIndex in loopIndexes:
+		loopIndexTable[ loopIndex ] = True
+	insideIndexes = []
+	outsideIndexes = []
+	for loopIndex in loopIndexes:
+		if isInsideTable( containerTables[ loopIndex ], loopIndexTable ):
+			insideIndexes.append( loopIndex )
+		else:
+			outsideIndexes.append( loopIndex )
 	surroundingLoops = []
-	for outside in outsides:
-		surroundingLoops.append( SurroundingLoop().getFromInsides( extrusionWidth, insides, outside ) )
+	for outsideIndex in outsideIndexes:
+		remainingIndexes = []
+		transferredIndexes = []
+		for insideIndex in insideIndexes:
+			if outsideIndex in containerTables[ insideIndex ]:
+				transferredIndexes.append( insideIndex )
+			else:
+				remainingIndexes.append( insideIndex )
+		insideIndexes = remainingIndexes
+		transferredIndexes.reverse()
+		innerSurroundings = getSurroundingLoopsFromIndexes( containerTables, extrusionWidth, transferredIndexes, loops )
+		surroundingLoops.append( SurroundingLoop().getFromInnerSurroundings( extrusionWidth, innerSurroundings, loops[ outsideIndex ] ) )
 	return surroundingLoops
 
 def getTransferClosestSurroundingLoop( oldOrderedLocation, remainingSurroundingLoops, skein ):
@@ -437,19 +521,26 @@ def getTransferClosestSurroundingLoop( oldOrderedLocation, remainingSurroundingL
 
 def getTransferredPaths( insides, loop ):
 	"Get transferred paths from inside paths."
+	boundingLoop = BoundingLoop().getFromLoop( loop )
 	transferredPaths = []
 	for insideIndex in range( len( insides ) - 1, - 1, - 1 ):
 		inside = insides[ insideIndex ]
-		if isPathInsideLoop( loop, inside ):
+		if boundingLoop.isPointInside( getLeftPoint( inside ) ):
 			transferredPaths.append( inside )
 			del insides[ insideIndex ]
 	return transferredPaths
 
 def getXIntersection( firstPoint, secondPoint, y ):
 	"Get where the line crosses y."
-	secondMinusFirst = secondPoint.minus( firstPoint )
 	yMinusFirst = y - firstPoint.y
-	return yMinusFirst / secondMinusFirst.y * secondMinusFirst.x + firstPoint.x
+	return yMinusFirst / ( secondPoint.y - firstPoint.y ) * ( secondPoint.x - firstPoint.x ) + firstPoint.x
+
+def getXIntersectionsTable( numberOfLines ):
+	"Get a table with an empty list of x intersections for each line."
+	xIntersectionsTable = []
+	for lineIndex in xrange( numberOfLines ):
+		xIntersectionsTable.append( [] )
+	return xIntersectionsTable
 
 def getWiddershinsDot( vec3First, vec3Second ):
 	"Get the magintude of the positive dot product plus one of the x and y components of a pair of Vec3s, with the reversed sign of the cross product."
@@ -471,10 +562,28 @@ def isClose( overlapDistanceSquared, loop, pointIndex ):
 			return True
 	return False
 
+def isCloseToCellPoints( cellKey, cellTable, overlapDistanceSquared, point ):
+	"Determine if the point is close to a point in the cell or in the eight cells around it."
+	for x in xrange( cellKey[ 0 ] - 1, cellKey[ 0 ] + 2 ):
+		for y in xrange( cellKey[ 1 ] - 1, cellKey[ 1 ] + 2 ):
+			neighborKey = ( x, y )
+			if neighborKey in cellTable:
+				for overlapPoint in cellTable[ neighborKey ]:
+					if overlapPoint.distance2( point ) < overlapDistanceSquared:
+						return True
+	return False
+
 def isInsideOtherLoops( loopIndex, loops ):
 	"Determine if a loop in a list is inside another loop in that list."
 	return isPathInsideLoops( loops[ : loopIndex ] + loops[ loopIndex + 1 : ], loops[ loopIndex ] )
 
+def isInsideTable( containerTable, loopIndexTable ):
+	"Determine if any of the container indexes are in the loop index table."
+	for containerIndex in containerTable:
+		if containerIndex in loopIndexTable:
+			return True
+	return False
+
 def isLineIntersectingInsideXSegment( segmentFirstX, segmentSecondX, vector3First, vector3Second, y ):
 	"Determine if the line is crossing inside the x segment."
 	isYAboveFirst = y > vector3First.y
@@ -599,6 +708,41 @@ def transferPathsToSurroundingLoops( paths, surroundingLoops ):
 		surroundingLoop.transferPaths( paths )
 
 
+class BoundingLoop:
+	"A loop with the minimum and maximum complexes of its bounding rectangle."
+	def __repr__( self ):
+		"Get the string representation of this bounding loop."
+		return '%s, %s, %s' % ( self.minimum, self.maximum, self.loop )
+
+	def getFromLoop( self, loop ):
+		"Get the bounding loop from a loop."
+		self.loop = loop
+		self.maximum = getComplexMaximumFromVec3List( loop )
+		self.minimum = getComplexMinimumFromVec3List( loop )
+		return self
+
+	def getPlaneDistanceSquared( self, point ):
+		"Get the square of the distance in the plane from the point to the bounding rectangle, which is zero inside the rectangle."
+		separationX = max( self.minimum.real - point.x, 0.0, point.x - self.maximum.real )
+		separationY = max( self.minimum.imag - point.y, 0.0, point.y - self.maximum.imag )
+		return separationX * separationX + separationY * separationY
+
+	def isOverlapping( self, maximum, minimum ):
+		"Determine if the bounding rectangle overlaps the rectangle from the minimum to the maximum."
+		if self.maximum.imag < minimum.imag or self.maximum.real < minimum.real:
+			return False
+		return self.minimum.imag <= maximum.imag and self.minimum.real <= maximum.real
+
+	def isPointInside( self, point ):
+		"Determine if the point is inside the loop, only counting intersections if the point is within the bounding rectangle."
+		if point.y <= self.minimum.imag or point.y > self.maximum.imag:
+			return False
+		roundingMargin = 0.000001 * ( abs( self.maximum ) + abs( self.minimum ) )
+		if point.x < self.minimum.real - roundingMargin or point.x > self.maximum.real + roundingMargin:
+			return False
+		return getNumberOfIntersectionsToLeft( point, self.loop ) % 2 == 1
+
+
 class Endpoint:
 	"The endpoint of a segment."
 	def __repr__( self ):
@@ -612,47 +756,38 @@ class Endpoint:
 		self.touched = False
 		return self
 
-	def getNearestEndpoint( self, endpoints ):
+	def getNearestEndpoint( self, endpointGrid ):
 		"Get nearest endpoint."
-		smallestDistanceSquared = 999999999999999999.0
-		nearestEndpoint = None
-		for endpoint in endpoints:
-			distanceSquared = self.point.distance2( endpoint.point )
-			if distanceSquared < smallestDistanceSquared:
-				smallestDistanceSquared = distanceSquared
-				nearestEndpoint = endpoint
-		return nearestEndpoint
+		for endpoint in endpointGrid.getNearestEndpoints( self.point ):
+			return endpoint
+		return None
 
-	def getNearestMiss( self, arounds, endpoints, extrusionWidth, path, stretchedXSegments ):
+	def getNearestMiss( self, aroundBoundingLoops, endpointGrid, extrusionWidth, path, stretchedXSegments ):
 		"Get the nearest endpoint which the segment to that endpoint misses the other extrusions."
-		smallestDistanceSquared = 999999999999999999.0
-		nearestMiss = None
 		penultimateMinusPoint = complex( 0.0, 0.0 )
 		if len( path ) > 1:
 			penultimateMinusPoint = path[ - 2 ].dropAxis( 2 ) - self.point.dropAxis( 2 )
 			if abs( penultimateMinusPoint ) > 0.0:
 				penultimateMinusPoint /= abs( penultimateMinusPoint )
-		for endpoint in endpoints:
+		for endpoint in endpointGrid.getNearestEndpoints( self.point ):
 			segment = endpoint.point.minus( self.point )
 			normalizedSegment = segment.dropAxis( 2 )
 			normalizedSegmentLength = abs( normalizedSegment )
 			if normalizedSegmentLength > 0.0:
 				normalizedSegment /= normalizedSegmentLength
-				segmentYMirror = complex( normalizedSegment.real, - normalizedSegment.imag )
-				segmentFirstPoint = getRoundZAxisByPlaneAngle( segmentYMirror, self.point )
-				segmentSecondPoint = getRoundZAxisByPlaneAngle( segmentYMirror, endpoint.point )
-				distanceSquared = self.point.distance2( endpoint.point )
-				if distanceSquared < smallestDistanceSquared:
-					if not isLoopListIntersectingInsideXSegment( arounds, segmentFirstPoint.x, segmentSecondPoint.x, segmentYMirror, segmentFirstPoint.y ):
+				if penultimateMinusPoint.real * normalizedSegment.real + penultimateMinusPoint.imag * normalizedSegment.imag < 0.8:
+					segmentYMirror = complex( normalizedSegment.real, - normalizedSegment.imag )
+					segmentFirstPoint = getRoundZAxisByPlaneAngle( segmentYMirror, self.point )
+					segmentSecondPoint = getRoundZAxisByPlaneAngle( segmentYMirror, endpoint.point )
+					overlappingArounds = getOverlappingLoops( aroundBoundingLoops, self.point, endpoint.point, 0.01 * extrusionWidth )
+					if not isLoopListIntersectingInsideXSegment( overlappingArounds, segmentFirstPoint.x, segmentSecondPoint.x, segmentYMirror, segmentFirstPoint.y ):
 						if not self.isPointIntersectingSegments( extrusionWidth, endpoint.point, stretchedXSegments ):
-							if penultimateMinusPoint.real * normalizedSegment.real + penultimateMinusPoint.imag * normalizedSegment.imag < 0.8:
-								smallestDistanceSquared = distanceSquared
-								nearestMiss = endpoint
+							return endpoint
 			else:
 				print >> sys.stderr, ( 'This should never happen, the endpoints are touching' )
 				print >> sys.stderr, ( endpoint )
 				print >> sys.stderr, ( path )
-		return nearestMiss
+		return None
 
 	def isOtherEndpointExtrudable( self, path ):
 		"Determine if the other endpoint is not touched and if it can be extruded without doubling back."
@@ -687,6 +822,94 @@ class Endpoint:
 		return False
 
 
+class EndpointGrid:
+	"A grid of endpoints, which are searched ring of cells by ring of cells outward from a point so that the nearest endpoints are found first."
+	def __init__( self ):
+		self.cellTable = {}
+		self.cellWidth = 0.0
+		self.maximumKey = ( 0, 0 )
+		self.minimumKey = ( 0, 0 )
+		self.numberOfEndpoints = 0
+
+	def __repr__( self ):
+		"Get the string representation of this EndpointGrid."
+		return str( self.cellWidth ) + ' ' + str( self.cellTable )
+
+	def getCellKey( self, point ):
+		"Get the key of the cell which the point is in."
+		if self.cellWidth <= 0.0:
+			return ( 0, 0 )
+		return ( int( math.floor( point.x / self.cellWidth ) ), int( math.floor( point.y / self.cellWidth ) ) )
+
+	def getFromEndpoints( self, endpoints, minimumCellWidth ):
+		"Initialize from endpoints, with cells about as wide as the average spacing of the endpoints."
+		if len( endpoints ) < 1:
+			return self
+		points = []
+		for endpoint in endpoints:
+			points.append( endpoint.point )
+		span = getComplexMaximumFromVec3List( points ) - getComplexMinimumFromVec3List( points )
+		self.cellWidth = max( math.sqrt( span.real * span.imag / float( len( endpoints ) ) ), minimumCellWidth )
+		self.maximumKey = self.getCellKey( points[ 0 ] )
+		self.minimumKey = self.maximumKey
+		for endpointIndex in xrange( len( endpoints ) ):
+			endpoint = endpoints[ endpointIndex ]
+			endpoint.gridIndex = endpointIndex
+			cellKey = self.getCellKey( endpoint.point )
+			self.maximumKey = ( max( self.maximumKey[ 0 ], cellKey[ 0 ] ), max( self.maximumKey[ 1 ], cellKey[ 1 ] ) )
+			self.minimumKey = ( min( self.minimumKey[ 0 ], cellKey[ 0 ] ), min( self.minimumKey[ 1 ], cellKey[ 1 ] ) )
+			if cellKey not in self.cellTable:
+				self.cellTable[ cellKey ] = []
+			self.cellTable[ cellKey ].append( endpoint )
+		self.numberOfEndpoints = len( endpoints )
+		return self
+
+	def getNearestEndpoints( self, point ):
+		"Get a generator of the endpoints ordered by distance from the point, with endpoints at the same distance in the order they were added."
+		cellKey = self.getCellKey( point )
+		maximumRing = max( cellKey[ 0 ] - self.minimumKey[ 0 ], self.maximumKey[ 0 ] - cellKey[ 0 ], cellKey[ 1 ] - self.minimumKey[ 1 ], self.maximumKey[ 1 ] - cellKey[ 1 ] )
+		candidates = []
+		numberOfSeenEndpoints = 0
+		for ring in xrange( maximumRing + 1 ):
+			for ringKey in self.getRingKeys( cellKey, ring ):
+				if ringKey in self.cellTable:
+					for endpoint in self.cellTable[ ringKey ]:
+						heapq.heappush( candidates, ( point.distance2( endpoint.point ), endpoint.gridIndex, endpoint ) )
+						numberOfSeenEndpoints += 1
+			if numberOfSeenEndpoints >= self.numberOfEndpoints:
+				break
+			unseenDistance = ring * self.cellWidth
+			unseenDistanceSquared = unseenDistance * unseenDistance
+			while len( candidates ) > 0 and candidates[ 0 ][ 0 ] < unseenDistanceSquared:
+				yield heapq.heappop( candidates )[ 2 ]
+		while len( candidates ) > 0:
+			yield heapq.heappop( candidates )[ 2 ]
+
+	def getRingKeys( self, cellKey, ring ):
+		"Get the keys of the cells in the square ring around the cell key, clipped to the cells which have held endpoints."
+		if ring == 0:
+			return [ cellKey ]
+		ringKeys = []
+		xBegin = max( cellKey[ 0 ] - ring, self.minimumKey[ 0 ] )
+		xEnd = min( cellKey[ 0 ] + ring, self.maximumKey[ 0 ] ) + 1
+		yBegin = max( cellKey[ 1 ] - ring + 1, self.minimumKey[ 1 ] )
+		yEnd = min( cellKey[ 1 ] + ring - 1, self.maximumKey[ 1 ] ) + 1
+		for y in ( cellKey[ 1 ] - ring, cellKey[ 1 ] + ring ):
+			if y >= self.minimumKey[ 1 ] and y <= self.maximumKey[ 1 ]:
+				for x in xrange( xBegin, xEnd ):
+					ringKeys.append( ( x, y ) )
+		for x in ( cellKey[ 0 ] - ring, cellKey[ 0 ] + ring ):
+			if x >= self.minimumKey[ 0 ] and x <= self.maximumKey[ 0 ]:
+				for y in xrange( yBegin, yEnd ):
+					ringKeys.append( ( x, y ) )
+		return ringKeys
+
+	def removeEndpoint( self, endpoint ):
+		"Remove an endpoint from the grid."
+		self.cellTable[ self.getCellKey( endpoint.point ) ].remove( endpoint )
+		self.numberOfEndpoints -= 1
+
+
 class SurroundingLoop:
 	"A loop that surrounds paths."
 	def __repr__( self ):
@@ -712,18 +935,22 @@ class SurroundingLoop:
 			fillLoops += getFillOfSurroundings( surroundingLoop.innerSurroundings )
 		return fillLoops
 
-	def getFromInsides( self, extrusionWidth, inputInsides, loop ):
-		"Initialize from inside loops."
+	def getFromInnerSurroundings( self, extrusionWidth, innerSurroundings, loop ):
+		"Initialize from the surrounding loops inside the loop."
 		self.extraLoops = []
 		self.extrusionHalfWidthSquared = 0.25 * extrusionWidth * extrusionWidth
 		self.extrusionWidth = extrusionWidth
 		self.loop = loop
-		transferredLoops = getTransferredPaths( inputInsides, loop )
-		self.innerSurroundings = getSurroundingLoops( extrusionWidth, transferredLoops )
+		self.innerSurroundings = innerSurroundings
 		self.lastFillLoops = None
 		self.paths = []
 		return self
 
+	def getFromInsides( self, extrusionWidth, inputInsides, loop ):
+		"Initialize from inside loops."
+		transferredLoops = getTransferredPaths( inputInsides, loop )
+		return self.getFromInnerSurroundings( extrusionWidth, getSurroundingLoops( extrusionWidth, transferredLoops ), loop )
+
 	def getLoopsToBeFilled( self ):
 		"Get last fill loops from the outside loop and the loops inside the inside loops."
 		if self.lastFillLoops != None:
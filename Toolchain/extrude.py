@@ -179,8 +179,11 @@ def display( filename = '' ):
 def displayFile( filename ):
 	"Parse a gcode file and display the commands."
 	print >> sys.stderr, ( 'File ' + filename + ' is being displayed.' )
-	fileText = gcodec.getFileText( filename )
-	gcodec.writeFileMessageSuffix( filename, displayText( fileText ), 'The gcode log file is saved as ', '_log' )
+	gcodeFile = gcodec.getFileForReading( filename )
+	if gcodeFile == None:
+		return
+	gcodec.writeFileMessageSuffix( filename, displayText( gcodeFile ), 'The gcode log file is saved as ', '_log' )
+	gcodeFile.close()
 
 def displayFiles( filenames ):
 	"Parse gcode files and display the commands."
@@ -188,7 +191,7 @@ def displayFiles( filenames ):
 		displayFile( filename )
 
 def displayText( gcodeText ):
-	"Parse a gcode text and display the commands."
+	"Parse a gcode text or file and display the commands."
 	skein = displaySkein()
 	skein.parseText( gcodeText )
 	return skein.output
@@ -205,8 +208,11 @@ def extrudeFile( filename ):
 	"""Parse a gcode file and send the commands to the extruder.
 	This function requires write access to the serial device, running as root is one way to get that access."""
 	print >> sys.stderr, ( 'File ' + filename + ' is being extruded.' )
-	fileText = gcodec.getFileText( filename )
-	gcodec.writeFileMessageSuffix( filename, extrudeText( fileText ), 'The gcode log file is saved as ', '_log' )
+	gcodeFile = gcodec.getFileForReading( filename )
+	if gcodeFile == None:
+		return
+	gcodec.writeFileMessageSuffix( filename, extrudeText( gcodeFile ), 'The gcode log file is saved as ', '_log' )
+	gcodeFile.close()
 
 def extrudeFiles( filenames ):
 	"""Parse gcode files and send the commands to the extruder.
@@ -215,7 +221,7 @@ def extrudeFiles( filenames ):
 		extrudeFile( filename )
 
 def extrudeText( gcodeText ):
-	"""Parse a gcode text and send the commands to the extruder.
+	"""Parse a gcode text or file and send the commands to the extruder.
 	This function requires write access to the serial device, running as root is one way to get that access."""
 	skein = extrudeSkein()
 	skein.parseText( gcodeText )
@@ -247,18 +253,19 @@ class displaySkein:
 		"Add an extruder command to the output."
 		self.addToOutput( command )
 
-	def helicalMove( self, isCounterclockwise, splitLine ):
+	def helicalMove( self, isCounterclockwise, gcodeLine ):
 		"Parse a helical move gcode line and send the commands to the extruder."
 		if self.oldLocation == None:
 			return
 		location = vec3().getFromVec3( self.oldLocation )
-		self.setFeedrate( splitLine )
-		setPointToSplitLine( location, splitLine )
+		parsedMove = gcodeLine.getParsedMove()
+		self.feedrateMinute = parsedMove.getFeedrateMinute( self.feedrateMinute )
+		parsedMove.setPointComponents( location )
 		location = location.plus( self.oldLocation )
 		center = vec3().getFromVec3( self.oldLocation )
-		indexOfR = indexOfStartingWithSecond( "R", splitLine )
-		if indexOfR > 0:
-			radius = getDoubleAfterFirstLetter( splitLine[ indexOfR ] )
+		wordTable = gcodeLine.getWordTable()
+		if 'R' in wordTable:
+			radius = wordTable[ 'R' ]
 			halfLocationMinusOld = location.minus( self.oldLocation )
 			halfLocationMinusOld.scale( 0.5 )
 			halfLocationMinusOldLength = halfLocationMinusOld.length()
@@ -271,8 +278,8 @@ class displaySkein:
 			else:
 				center.getFromVec3( halfLocationMinusOld.minus( centerMinusMidpoint ) )
 		else:
-			center.x = getDoubleForLetter( "I", splitLine )
-			center.y = getDoubleForLetter( "J", splitLine )
+			center.x = wordTable[ 'I' ]
+			center.y = wordTable[ 'J' ]
 		curveSection = 0.5
 		center = center.plus( self.oldLocation )
 		afterCenterSegment = location.minus( center )
@@ -300,8 +307,9 @@ class displaySkein:
 		location = vec3()
 		if self.oldLocation != None:
 			location = self.oldLocation
-		self.setFeedrate( splitLine )
-		setPointToSplitLine( location, splitLine )
+		parsedMove = gcodec.getParsedMove( splitLine )
+		self.feedrateMinute = parsedMove.getFeedrateMinute( self.feedrateMinute )
+		parsedMove.setPointComponents( location )
 		self.moveExtruder( location )
 		self.oldLocation = location
 
@@ -314,8 +322,8 @@ class displaySkein:
 		moveCommandString = 'reprap.cartesian.seek( ( ' + xMoveString + ', ' + yMoveString + ', ' + zMoveString + '), ' + moveSpeedString + ', True )'
 		self.evaluateCommand( moveCommandString )
 
-	def parseGCode( self, lines ):
-		"Parse gcode and send the commands to the extruder."
+	def parseGCode( self, gcodeLines ):
+		"Parse gcode lines and send the commands to the extruder."
 		self.evaluateCommand( 'reprap.serial = serial.Serial(0, 19200, timeout = 60)' )	# Initialise serial port, here the first port (0) is used.
 		self.evaluateCommand( 'reprap.cartesian.x.active = True' )	# These devices are present in network, will automatically scan in the future.
 		self.evaluateCommand( 'reprap.cartesian.y.active = True' )
@@ -327,24 +335,24 @@ class displaySkein:
 		self.evaluateCommand( 'reprap.cartesian.x.limit = 2523' )
 		self.evaluateCommand( 'reprap.cartesian.y.limit = 2000' )
 		self.homeReset()	# The module is now ready to receive commands
-		for line in lines:
-			self.parseLine( line )
+		for gcodeLine in gcodeLines:
+			self.parseLine( gcodeLine )
 		self.homeReset()
 		self.evaluateCommand( 'reprap.cartesian.free()' )	# Shut off power to all motors.
 
-	def parseLine( self, line ):
+	def parseLine( self, gcodeLine ):
 		"Parse a gcode line and send the command to the extruder."
-		self.addToOutput( line )
-		splitLine = line.split( ' ' )
+		self.addToOutput( gcodeLine.line )
+		splitLine = gcodeLine.splitLine
 		if len( splitLine ) < 1:
 			return 0
-		firstWord = splitLine[ 0 ]
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
 			self.linearMove( splitLine )
 		if firstWord == 'G2':
-			self.helicalMove( False, splitLine )
+			self.helicalMove( False, gcodeLine )
 		if firstWord == 'G3':
-			self.helicalMove( True, splitLine )
+			self.helicalMove( True, gcodeLine )
 		if firstWord == 'M101':
 			self.extruderActive = 1
 			self.evaluateCommand( 'reprap.extruder.setMotor(reprap.CMD_REVERSE, 150)' )
@@ -354,15 +362,12 @@ class displaySkein:
 			self.oldActiveLocation = None
 
 	def parseText( self, text ):
-		"Parse a gcode text and evaluate the commands."
-		textLines = getTextLines( text )
-		self.parseGCode( textLines )
+		"Parse a gcode text or file and evaluate the commands, reading a file one line at a time."
+		self.parseGCode( gcodec.getGcodeLines( text ) )
 
 	def setFeedrate( self, splitLine ):
 		"Set the feedrate to the gcode split line."
-		indexOfF = indexOfStartingWithSecond( "F", splitLine )
-		if indexOfF > 0:
-			self.feedrateMinute = getDoubleAfterFirstLetter( splitLine[ indexOfF ] )
+		self.feedrateMinute = gcodec.getFeedrateMinute( self.feedrateMinute, splitLine )
 
 
 class extrudeSkein( displaySkein ):
@@ -93,7 +93,7 @@ try:
 except:
 	pass
 from vec3 import Vec3
-import cStringIO
+import cache
 import euclidean
 import gcodec
 import intercircle
@@ -103,6 +103,10 @@ import slice
 import sys
 import time
 import vectorwrite
+try:
+	import multiprocessing
+except:
+	multiprocessing = None
 
 
 __author__ = "Enrique Perez (perez_enrique@yahoo.com)"
@@ -118,34 +122,29 @@ __license__ = "GPL 3.0"
 #later addAroundClosest around arounds
 #much afterwards make congajure multistep view, maybe simplify paths on top of loops; why?; actually I think we're already doing this
 #maybe bridge supports although staggered spans are probably better
-def addAroundClosest( arounds, layerExtrusionWidth, paths, removedEndpoint ):
+def addAroundClosest( aroundBoundingLoops, layerExtrusionWidth, pathGrid, removedEndpoint ):
 	"Add the closest removed endpoint to the path, with minimal twisting."
 	lessThanHalfInsetSquared = 0.2 * layerExtrusionWidth * layerExtrusionWidth #later maybe use layerFillInset
 	removedEndpointPoint = removedEndpoint.point
-	closestDistanceSquared = 999999999999999999.0
-	closestPathIndex = None
-	shortestPathLength = 999999999999999999.0
-	for pathIndex in range( len( paths ) ):
-		path = paths[ pathIndex ]
-		for pointIndex in range( len( path ) ):
-			point = path[ pointIndex ]
-			distanceSquared = point.distance2( removedEndpointPoint )
-			if distanceSquared < closestDistanceSquared:
-				closestDistanceSquared = distanceSquared
-				closestPathIndex = pathIndex
-	if closestPathIndex == None:
+	closestDistanceSquaredPathIndex = pathGrid.getNearestDistanceSquaredPathIndex( removedEndpointPoint )
+	if closestDistanceSquaredPathIndex == None:
 		return
-	closestPath = paths[ closestPathIndex ]
+	closestDistanceSquared = closestDistanceSquaredPathIndex[ 0 ]
+	closestPathIndex = closestDistanceSquaredPathIndex[ 1 ]
+	closestPath = pathGrid.paths[ closestPathIndex ]
 	if closestDistanceSquared < lessThanHalfInsetSquared:
 		return
 	closestPointIndex = getWithLeastLength( closestPath, removedEndpointPoint )
 	if closestPointIndex == 0 or closestPointIndex == len( closestPath ):
-		closestPath.insert( closestPointIndex, removedEndpointPoint )
+		pathGrid.insertPoint( closestPathIndex, closestPointIndex, removedEndpointPoint )
 		return
-	otherPaths = paths[ 0 : closestPathIndex ] + paths[ closestPathIndex + 1 : len( paths ) ]
-	if not isIntersectingLoopPathList( arounds, otherPaths, removedEndpointPoint, closestPath[ closestPointIndex - 1 ] ):
-		if not isIntersectingLoopPathList( arounds, otherPaths, removedEndpointPoint, closestPath[ closestPointIndex ] ):
-			closestPath.insert( closestPointIndex, removedEndpointPoint )
+	outset = 0.01 * layerExtrusionWidth
+	for pointEnd in closestPath[ closestPointIndex - 1 : closestPointIndex + 1 ]:
+		overlappingArounds = euclidean.getOverlappingLoops( aroundBoundingLoops, removedEndpointPoint, pointEnd, outset )
+		overlappingOtherPaths = pathGrid.getOverlappingOtherPaths( closestPathIndex, removedEndpointPoint, pointEnd, outset )
+		if isIntersectingLoopPathList( overlappingArounds, overlappingOtherPaths, removedEndpointPoint, pointEnd ):
+			return
+	pathGrid.insertPoint( closestPathIndex, closestPointIndex, removedEndpointPoint )
 
 	"""
 	removedSegment = removedEndpoint.otherEndpoint.point.minus( removedEndpointPoint )
@@ -278,11 +277,11 @@ def fillChainFile( filename = '' ):
 	fillPreferences = FillPreferences()
 	preferences.readPreferences( fillPreferences )
 	print >> sys.stderr, ( 'File ' + gcodec.getSummarizedFilename( filename ) + ' is being chain filled.' )
-	gcodeText = gcodec.getFileText( filename )
+	gcodeText = gcodec.getFileText( filename, gcodec.getReadMode( filename ) )
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_fill.gcode'
-	gcodec.writeFileText( suffixFilename, getFillChainGcode( gcodeText, fillPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getFillChainToolpath( gcodeText, fillPreferences ) )
 	print >> sys.stderr, ( 'The filled file is saved as ' + suffixFilename )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 	print >> sys.stderr, ( 'It took ' + str( int( round( time.time() - startTime ) ) ) + ' seconds to fill the file.' )
@@ -303,7 +302,7 @@ def fillFile( filename = '' ):
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_fill.gcode'
-	gcodec.writeFileText( suffixFilename, getFillGcode( gcodeText, fillPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getFillToolpath( gcodeText, fillPreferences ) )
 	print >> sys.stderr, ( 'The filled file is saved as ' + gcodec.getSummarizedFilename( suffixFilename ) )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 	print >> sys.stderr, ( 'It took ' + str( int( round( time.time() - startTime ) ) ) + ' seconds to fill the file.' )
@@ -328,43 +327,65 @@ def getExtraFillLoops( insideLoops, outsideLoop, radius ):
 
 def getFillChainGcode( gcodeText, fillPreferences = None ):
 	"Fill the slices of a gcode text.  Chain fill the gcode if it is not already sliced."
+	return getFillChainToolpath( gcodeText, fillPreferences ).getvalue()
+
+def getFillChainToolpath( gcodeText, fillPreferences = None ):
+	"Fill the slices of a gcode text or toolpath into a toolpath.  Chain fill the gcode if it is not already sliced."
 	if not gcodec.isProcedureDone( gcodeText, 'slice' ):
-		gcodeText = slice.getSliceGcode( gcodeText )
-	return getFillGcode( gcodeText, fillPreferences )
+		slicePreferences = slice.SlicePreferences()
+		preferences.readPreferences( slicePreferences )
+		gcodeText = cache.getCachedToolpath( gcodeText, 'slice', slicePreferences, slice.getSliceToolpath )
+	if fillPreferences == None:
+		fillPreferences = FillPreferences()
+		preferences.readPreferences( fillPreferences )
+	return cache.getCachedToolpath( gcodeText, 'fill', fillPreferences, getFillToolpath )
 
 def getFillGcode( gcodeText, fillPreferences = None ):
 	"Fill the slices of a gcode text."
-	if gcodeText == '':
-		return ''
-	if gcodec.isProcedureDone( gcodeText, 'fill' ):
-		return gcodeText
+	return getFillToolpath( gcodeText, fillPreferences ).getvalue()
+
+def getFillSurroundingLoops( layerIndexExtraShells ):
+	"Get the surrounding loops of a layer with the fill transferred to them, this is called in a fill process."
+	layerIndex, extraShells = layerIndexExtraShells
+	return globalFillSkein.getFillSurroundingLoops( extraShells, layerIndex )
+
+def getFillToolpath( gcodeText, fillPreferences = None ):
+	"Fill the slices of a gcode text or toolpath into a toolpath."
+	toolpath = gcodec.getToolpath( gcodeText )
+	if len( toolpath.gcodeLines ) < 1:
+		return toolpath
+	if gcodec.isProcedureDone( toolpath, 'fill' ):
+		return toolpath
 	if fillPreferences == None:
 		fillPreferences = FillPreferences()
 		preferences.readPreferences( fillPreferences )
 	skein = FillSkein()
-	skein.parseGcode( fillPreferences, gcodeText )
-	return skein.output.getvalue()
+	skein.parseGcode( fillPreferences, toolpath )
+	return skein.output
 
-def getHorizontalSegments( fillLoops, alreadyFilledArounds, y ):
-	"Get horizontal segments inside loops."
-	solidXIntersectionList = []
-	euclidean.addXIntersectionsFromLoops( fillLoops, - 1, solidXIntersectionList, y )
+def getHorizontalSegmentsTable( alreadyFilledArounds, fillLoops, front, numberOfFillLines, width, z ):
+	"Get the horizontal segments inside the loops for each fill line, going through each edge once."
+	xIntersectionsTable = euclidean.getXIntersectionsTable( numberOfFillLines )
+	euclidean.addXIntersectionsToTableFromLoops( fillLoops, - 1, xIntersectionsTable, front, width )
 	for alreadyFilledAroundIndex in range( len( alreadyFilledArounds ) ):
 		alreadyFilledLoops = alreadyFilledArounds[ alreadyFilledAroundIndex ]
-		for alreadyFilledLoopIndex in range( len( alreadyFilledLoops ) ):
-			alreadyFilledLoop = alreadyFilledLoops[ alreadyFilledLoopIndex ]
-			euclidean.addXIntersections( alreadyFilledLoop, alreadyFilledAroundIndex, solidXIntersectionList, y )
-	return euclidean.getSegmentsFromIntersections( solidXIntersectionList, y, fillLoops[ 0 ][ 0 ].z )
-
-def getSurroundingXIntersections( alreadyFilledSize, doubleSolidSurfaceThickness, surroundingSlices, y ):
-	"Get x intersections from surrounding layers."
-	if len( surroundingSlices ) < doubleSolidSurfaceThickness:
-		return None
-	joinedX = []
+		euclidean.addXIntersectionsToTableFromLoops( alreadyFilledLoops, alreadyFilledAroundIndex, xIntersectionsTable, front, width )
+	horizontalSegmentsTable = []
+	for fillLine in xrange( numberOfFillLines ):
+		y = front + float( fillLine ) * width
+		horizontalSegmentsTable.append( euclidean.getSegmentsFromIntersections( xIntersectionsTable[ fillLine ], y, z ) )
+	return horizontalSegmentsTable
+
+def getJoinedXTable( front, numberOfFillLines, surroundingSlices, width ):
+	"Get the x intersections of the surrounding slices with each fill line, going through each edge once."
+	joinedXTable = euclidean.getXIntersectionsTable( numberOfFillLines )
+	for surroundingIndex in xrange( len( surroundingSlices ) ):
+		euclidean.addXIntersectionsToTableFromLoops( surroundingSlices[ surroundingIndex ], surroundingIndex, joinedXTable, front, width )
+	return joinedXTable
+
+def getSurroundingXIntersections( doubleSolidSurfaceThickness, joinedX ):
+	"Get x intersections from the joined x intersections of the surrounding layers."
 	solidXIntersectionList = []
-	for surroundingIndex in range( len( surroundingSlices ) ):
-		surroundingSlice = surroundingSlices[ surroundingIndex ]
-		euclidean.addXIntersectionsFromLoops( surroundingSlice, surroundingIndex, joinedX, y )
 	solidTable = {}
 	solid = False
 	joinedX.sort( euclidean.compareSolidXByX )
@@ -378,16 +399,20 @@ def getSurroundingXIntersections( alreadyFilledSize, doubleSolidSurfaceThickness
 	return solidXIntersectionList
 
 def getWithLeastLength( path, point ):
-	"Insert a point into a path, at the index at which the path would be shortest."
-	shortestPointIndex = None
-	shortestPathLength = 999999999999999999.0
-	for pointIndex in range( len( path ) + 1 ):
-		concatenation = path[ : ]
-		concatenation.insert( pointIndex, point )
-		concatenationLength = euclidean.getPathLength( concatenation )
-		if concatenationLength < shortestPathLength:
-			shortestPathLength = concatenationLength
+	"Get the index at which inserting the point into the path would add the least length."
+	if len( path ) < 1:
+		return 0
+	shortestPointIndex = 0
+	shortestAddedLength = point.distance( path[ 0 ] )
+	for pointIndex in xrange( 1, len( path ) ):
+		beginPoint = path[ pointIndex - 1 ]
+		endPoint = path[ pointIndex ]
+		addedLength = beginPoint.distance( point ) + point.distance( endPoint ) - beginPoint.distance( endPoint )
+		if addedLength < shortestAddedLength:
+			shortestAddedLength = addedLength
 			shortestPointIndex = pointIndex
+	if path[ - 1 ].distance( point ) < shortestAddedLength:
+		return len( path )
 	return shortestPointIndex
 
 def isIntersectingLoopPathList( loopList, otherPaths, pointBegin, pointEnd ):
@@ -442,6 +467,11 @@ def isSegmentInX( segment, xFirst, xSecond ):
 		return False
 	return max( segmentFirstX, segmentSecondX ) > min( xFirst, xSecond )
 
+def setGlobalFillSkein( fillSkein ):
+	"Set the fill skein which the fill process gets the layer fill from."
+	global globalFillSkein
+	globalFillSkein = fillSkein
+
 class FillSkein:
 	"A class to fill a skein of extrusions."
 	def __init__( self ):
@@ -450,27 +480,117 @@ class FillSkein:
 		self.lineIndex = 0
 		self.oldLocation = None
 		self.oldOrderedLocation = Vec3()
-		self.output = cStringIO.StringIO()
+		self.output = gcodec.Toolpath()
 		self.rotatedLayer = None
 		self.rotatedLayers = []
+		self.rotatedSliceTable = {}
 		self.shutdownLineIndex = sys.maxint
 		self.thread = None
 
 	def addFill( self, layerIndex ):
 		"Add fill to the slice layer."
-#		if layerIndex > 5:
-#			return
+		surroundingLoops = self.getFillSurroundingLoops( self.getExtraShells( layerIndex ), layerIndex )
+		self.addSurroundingLoops( layerIndex, surroundingLoops )
+
+	def addFillsByProcesses( self ):
+		"Add the fill of the layers, with the fill of each layer computed in parallel by a pool of fill processes."
+		layerIndexesExtraShells = []
+		for layerIndex in range( len( self.rotatedLayers ) ):
+			layerIndexesExtraShells.append( ( layerIndex, self.getExtraShells( layerIndex ) ) )
+		pool = multiprocessing.Pool( self.fillPreferences.fillProcesses.value, setGlobalFillSkein, ( self, ) )
+		try:
+			surroundingLoopsList = pool.map( getFillSurroundingLoops, layerIndexesExtraShells )
+		finally:
+			pool.terminate()
+			pool.join()
+		for layerIndex in range( len( self.rotatedLayers ) ):
+			self.addSurroundingLoops( layerIndex, surroundingLoopsList[ layerIndex ] )
+
+	def addGcodeMovement( self, point ):
+		"Add a movement to the output."
+		self.lastOutputPoint = point
+		self.output.addLinearMove( point, self.feedratePerMinute )
+
+	def addGcodeFromGcodeThread( self, gcode, thread ):
+		"Add a gcode thread to the output."
+		if len( thread ) > 0:
+			self.addGcodeMovement( thread[ 0 ] )
+		else:
+			print >> sys.stderr, ( "zero length vertex positions array which was skipped over, this should never happen" )
+		if len( thread ) < 2:
+			return
+		self.addLine( gcode )
+		for point in thread[ 1 : ]:
+			self.addGcodeMovement( point )
+		self.addLine( "M103" ) # Turn extruder off.
+
+	def addLine( self, line ):
+		"Add a line of text and a newline to the output."
+		self.output.addLine( line )
+
+	def addRotatedSlice( self, layerIndex, reverseRotationAroundZAngle, surroundingSlices ):
+		"Add a rotated slice to the surrounding slices."
+		if layerIndex < 0 or layerIndex >= len( self.rotatedLayers ):
+			return
+		rotatedSliceKey = ( layerIndex, reverseRotationAroundZAngle )
+		if rotatedSliceKey not in self.rotatedSliceTable:
+			layer = self.rotatedLayers[ layerIndex ].toBeginningLoops
+			rotatedSlice = []
+			for thread in layer:
+				planeRotatedLoop = euclidean.getPathRoundZAxisByPlaneAngle( reverseRotationAroundZAngle, thread[ 1 : ] )
+				rotatedSlice.append( planeRotatedLoop )
+			self.rotatedSliceTable[ rotatedSliceKey ] = rotatedSlice
+		surroundingSlices.append( self.rotatedSliceTable[ rotatedSliceKey ] )
+
+	def addShutdownToOutput( self ):
+		"Add shutdown gcode to the output."
+		for gcodeLine in self.lines[ self.shutdownLineIndex : ]:
+			self.output.addGcodeLine( gcodeLine )
+
+	def addSurroundingLoops( self, layerIndex, surroundingLoops ):
+		"Add the layer start and the threads of the surrounding loops of the slice layer to the output."
+		layer = self.rotatedLayers[ layerIndex ].toBeginningLoops
+		self.addLine( '(<layerStart> ' + str( layer[ 0 ][ 0 ].z ) + ' )' ) # Indicate that a new layer is starting.
+		if self.rotatedLayers[ layerIndex ].rotation != None:
+			self.addLine( '(<bridgeLayer> )' ) # Indicate that this is a bridge layer.
+		euclidean.addToThreadsRemoveFromSurroundings( self.oldOrderedLocation, surroundingLoops, self )
+
+	def addToThread( self, location ):
+		"Add a location to thread."
+		if self.oldLocation == None:
+			return
+		if self.thread == None:
+			self.thread = [ self.oldLocation ]
+			self.getRotatedLayer().toBeginningLoops.append( self.thread )
+		self.thread.append( location )
+
+	def getExtraShells( self, layerIndex ):
+		"Get the number of extra shells of the slice layer."
+		numberOfSurroundingSlices = 0
+		layerRemainder = layerIndex % int( round( self.fillPreferences.diaphragmPeriod.value ) )
+		if layerRemainder >= int( round( self.fillPreferences.diaphragmThickness.value ) ):
+			for surroundingIndex in range( 1, self.solidSurfaceThickness + 1 ):
+				for surroundingLayerIndex in ( layerIndex - surroundingIndex, layerIndex + surroundingIndex ):
+					if surroundingLayerIndex >= 0 and surroundingLayerIndex < len( self.rotatedLayers ):
+						numberOfSurroundingSlices += 1
+		extraShells = self.fillPreferences.extraShellsSparseLayer.value
+		if numberOfSurroundingSlices < self.doubleSolidSurfaceThickness:
+			if self.lastExtraShells != self.fillPreferences.extraShellsBase.value:
+				extraShells = self.fillPreferences.extraShellsBase.value
+		self.lastExtraShells = extraShells
+		return extraShells
+
+	def getFillSurroundingLoops( self, extraShells, layerIndex ):
+		"Get the surrounding loops of the slice layer, with the fill transferred to them."
 		alreadyFilledArounds = []
 		arounds = []
 		back = - 999999999.0
 		layerExtrusionWidth = self.extrusionWidth
 		layerFillInset = self.fillInset
 		layer = self.rotatedLayers[ layerIndex ].toBeginningLoops
-		self.addLine( '(<layerStart> ' + str( layer[ 0 ][ 0 ].z ) + ' )' ) # Indicate that a new layer is starting.
 		if self.rotatedLayers[ layerIndex ].rotation != None:
 			layerExtrusionWidth = self.extrusionWidth * self.bridgeExtrusionWidthOverSolid
 			layerFillInset = self.fillInset * self.bridgeExtrusionWidthOverSolid
-			self.addLine( '(<bridgeLayer> )' ) # Indicate that this is a bridge layer.
 		doubleExtrusionWidth = 2.0 * layerExtrusionWidth
 		muchGreaterThanLayerFillInset = 3.0 * layerFillInset
 		endpoints = []
@@ -486,16 +606,12 @@ class FillSkein:
 		for thread in layer:
 			loops.append( thread[ 1 : ] )
 		surroundingSlices = []
+		self.removeRotatedSlicesBelow( layerIndex - self.solidSurfaceThickness )
 		layerRemainder = layerIndex % int( round( self.fillPreferences.diaphragmPeriod.value ) )
 		if layerRemainder >= int( round( self.fillPreferences.diaphragmThickness.value ) ):
 			for surroundingIndex in range( 1, self.solidSurfaceThickness + 1 ):
 				self.addRotatedSlice( layerIndex - surroundingIndex, reverseRotationAroundZAngle, surroundingSlices )
 				self.addRotatedSlice( layerIndex + surroundingIndex, reverseRotationAroundZAngle, surroundingSlices )
-		extraShells = self.fillPreferences.extraShellsSparseLayer.value
-		if len( surroundingSlices ) < self.doubleSolidSurfaceThickness:
-			if self.lastExtraShells != self.fillPreferences.extraShellsBase.value:
-				extraShells = self.fillPreferences.extraShellsBase.value
-		self.lastExtraShells = extraShells
 		surroundingLoops = euclidean.getSurroundingLoops( layerExtrusionWidth, loops )
 		for extraShellIndex in range( extraShells ):
 			createFillForSurroundings( surroundingLoops )
@@ -524,20 +640,18 @@ class FillSkein:
 		halfFillRemainder = 0.5 * fillRemainder
 		back -= halfFillRemainder
 		front += halfFillRemainder
-		horizontalSegments = []
-		for fillLine in range( numberOfIntervals + 1 ):
-			y = front + float( fillLine ) * layerExtrusionWidth
-			lineSegments = getHorizontalSegments( rotatedExtruderLoops, alreadyFilledArounds, y )
-			horizontalSegments.append( lineSegments )
+		horizontalSegments = getHorizontalSegmentsTable( alreadyFilledArounds, rotatedExtruderLoops, front, numberOfIntervals + 1, layerExtrusionWidth, rotatedExtruderLoops[ 0 ][ 0 ].z )
 		removedEndpoints = []
+		joinedXTable = None
+		if len( surroundingSlices ) >= self.doubleSolidSurfaceThickness:
+			joinedXTable = getJoinedXTable( front, len( horizontalSegments ), surroundingSlices, layerExtrusionWidth )
 		for fillLine in range( len( horizontalSegments ) ):
-			y = front + float( fillLine ) * layerExtrusionWidth
-			horizontalEndpoints = horizontalSegments[ fillLine ]
-			surroundingXIntersections = getSurroundingXIntersections( len( alreadyFilledArounds ), self.doubleSolidSurfaceThickness, surroundingSlices, y )
+			surroundingXIntersections = None
+			if joinedXTable != None:
+				surroundingXIntersections = getSurroundingXIntersections( self.doubleSolidSurfaceThickness, joinedXTable[ fillLine ] )
 			addSparseEndpoints( doubleExtrusionWidth, endpoints, self.fillDensity, fillLine, horizontalSegments, removedEndpoints, surroundingXIntersections )
 		if len( endpoints ) < 1:
-			euclidean.addToThreadsRemoveFromSurroundings( self.oldOrderedLocation, surroundingLoops, self )
-			return
+			return surroundingLoops
 		stretchedXSegments = []
 		for beginningEndpoint in endpoints[ : : 2 ]:
 			beginningPoint = beginningEndpoint.point
@@ -547,86 +661,43 @@ class FillSkein:
 		endpoints.remove( endpointFirst )
 		otherEndpoint = endpointFirst.otherEndpoint
 		endpoints.remove( otherEndpoint )
+		aroundBoundingLoops = []
+		for around in arounds:
+			aroundBoundingLoops.append( euclidean.BoundingLoop().getFromLoop( around ) )
+		endpointGrid = euclidean.EndpointGrid().getFromEndpoints( endpoints, layerExtrusionWidth )
 		nextEndpoint = None
 		path = []
 		paths = []
-		if len( endpoints ) > 1:
-			nextEndpoint = otherEndpoint.getNearestMiss( arounds, endpoints, layerExtrusionWidth, path, stretchedXSegments )
+		if endpointGrid.numberOfEndpoints > 1:
+			nextEndpoint = otherEndpoint.getNearestMiss( aroundBoundingLoops, endpointGrid, layerExtrusionWidth, path, stretchedXSegments )
 			if nextEndpoint != None:
 				if nextEndpoint.point.distance2( endpointFirst.point ) < nextEndpoint.point.distance2( otherEndpoint.point ):
 					endpointFirst = endpointFirst.otherEndpoint
 					otherEndpoint = endpointFirst.otherEndpoint
 		path.append( endpointFirst.point )
 		path.append( otherEndpoint.point )
-		while len( endpoints ) > 1:
-			nextEndpoint = otherEndpoint.getNearestMiss( arounds, endpoints, layerExtrusionWidth, path, stretchedXSegments )
+		while endpointGrid.numberOfEndpoints > 1:
+			nextEndpoint = otherEndpoint.getNearestMiss( aroundBoundingLoops, endpointGrid, layerExtrusionWidth, path, stretchedXSegments )
 			if nextEndpoint == None:
 				paths.append( path )
 				path = []
-				nextEndpoint = otherEndpoint.getNearestEndpoint( endpoints )
+				nextEndpoint = otherEndpoint.getNearestEndpoint( endpointGrid )
 			path.append( nextEndpoint.point )
-			endpoints.remove( nextEndpoint )
+			endpointGrid.removeEndpoint( nextEndpoint )
 			if nextEndpoint.isOtherEndpointExtrudable( path ):
 				otherEndpoint = nextEndpoint.otherEndpoint
 				path.append( otherEndpoint.point )
-				endpoints.remove( otherEndpoint )
+				endpointGrid.removeEndpoint( otherEndpoint )
 			else:
 				otherEndpoint = nextEndpoint
 		paths.append( path )
+		pathGrid = PathGrid().getFromPaths( paths, layerExtrusionWidth )
 		for removedEndpoint in removedEndpoints:
-			addAroundClosest( arounds, layerExtrusionWidth, paths, removedEndpoint )
+			addAroundClosest( aroundBoundingLoops, layerExtrusionWidth, pathGrid, removedEndpoint )
 		for path in paths:
 			addPath( layerFillInset, fill, path, layerRotationAroundZAngle )
 		euclidean.transferPathsToSurroundingLoops( fill, surroundingLoops )
-		euclidean.addToThreadsRemoveFromSurroundings( self.oldOrderedLocation, surroundingLoops, self )
-
-	def addGcodeMovement( self, point ):
-		"Add a movement to the output."
-		self.lastOutputPoint = point
-		self.output.write( "G1 X" + euclidean.getRoundedToThreePlaces( point.x ) + " Y" + euclidean.getRoundedToThreePlaces( point.y ) )
-		self.addLine( " Z" + euclidean.getRoundedToThreePlaces( point.z ) + " F" + euclidean.getRoundedToThreePlaces( self.feedratePerMinute ) )
-
-	def addGcodeFromGcodeThread( self, gcode, thread ):
-		"Add a gcode thread to the output."
-		if len( thread ) > 0:
-			self.addGcodeMovement( thread[ 0 ] )
-		else:
-			print >> sys.stderr, ( "zero length vertex positions array which was skipped over, this should never happen" )
-		if len( thread ) < 2:
-			return
-		self.addLine( gcode )
-		for point in thread[ 1 : ]:
-			self.addGcodeMovement( point )
-		self.addLine( "M103" ) # Turn extruder off.
-
-	def addLine( self, line ):
-		"Add a line of text and a newline to the output."
-		self.output.write( line + "\n" )
-
-	def addRotatedSlice( self, layerIndex, reverseRotationAroundZAngle, surroundingSlices ):
-		"Add a rotated slice to the surrounding slices."
-		if layerIndex < 0 or layerIndex >= len( self.rotatedLayers ):
-			return
-		layer = self.rotatedLayers[ layerIndex ].toBeginningLoops
-		rotatedSlice = []
-		for thread in layer:
-			planeRotatedLoop = euclidean.getPathRoundZAxisByPlaneAngle( reverseRotationAroundZAngle, thread[ 1 : ] )
-			rotatedSlice.append( planeRotatedLoop )
-		surroundingSlices.append( rotatedSlice )
-
-	def addShutdownToOutput( self ):
-		"Add shutdown gcode to the output."
-		for line in self.lines[ self.shutdownLineIndex : ]:
-			self.addLine( line )
-
-	def addToThread( self, location ):
-		"Add a location to thread."
-		if self.oldLocation == None:
-			return
-		if self.thread == None:
-			self.thread = [ self.oldLocation ]
-			self.getRotatedLayer().toBeginningLoops.append( self.thread )
-		self.thread.append( location )
+		return surroundingLoops
 
 	def getLayerRoundZ( self, layerIndex ):
 		"Get the plane angle around z that the layer is rotated by."
@@ -642,17 +713,17 @@ class FillSkein:
 			self.rotatedLayers.append( self.rotatedLayer )
 		return self.rotatedLayer
 
-	def linearMove( self, splitLine ):
+	def linearMove( self, gcodeLine ):
 		"Add a linear move to the thread."
-		location = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
+		location = gcodec.getLocationFromGcodeLine( self.oldLocation, gcodeLine )
 		if self.extruderActive:
 			self.addToThread( location )
 		self.oldLocation = location
 
 	def parseGcode( self, fillPreferences, gcodeText ):
-		"Parse gcode text and store the bevel gcode."
+		"Parse gcode text or toolpath and store the fill gcode."
 		self.fillPreferences = fillPreferences
-		self.lines = gcodec.getTextLines( gcodeText )
+		self.lines = gcodec.getToolpath( gcodeText ).gcodeLines
 		self.parseInitialization()
 		self.feedratePerMinute = 60.0 * fillPreferences.feedratePerSecond.value
 		self.fillDensity = fillPreferences.fillDensity.value
@@ -662,18 +733,19 @@ class FillSkein:
 		self.doubleSolidSurfaceThickness = self.solidSurfaceThickness + self.solidSurfaceThickness
 		for lineIndex in range( self.lineIndex, len( self.lines ) ):
 			self.parseLine( lineIndex )
-		for layerIndex in range( len( self.rotatedLayers ) ):
-			self.addFill( layerIndex )
+		if multiprocessing != None and fillPreferences.fillProcesses.value > 1 and not multiprocessing.current_process().daemon:
+			self.addFillsByProcesses()
+		else:
+			for layerIndex in range( len( self.rotatedLayers ) ):
+				self.addFill( layerIndex )
 		self.addShutdownToOutput()
 
 	def parseInitialization( self ):
 		"Parse gcode initialization and store the parameters."
 		for self.lineIndex in range( len( self.lines ) ):
-			line = self.lines[ self.lineIndex ]
-			splitLine = line.split( ' ' )
-			firstWord = ''
-			if len( splitLine ) > 0:
-				firstWord = splitLine[ 0 ]
+			gcodeLine = self.lines[ self.lineIndex ]
+			splitLine = gcodeLine.splitLine
+			firstWord = gcodeLine.firstWord
 			if firstWord == '(<extrusionWidth>':
 				self.extrusionWidth = float( splitLine[ 1 ] )
 				self.fillInset = 0.5 * self.extrusionWidth * ( 2.0 - self.fillPreferences.infillPerimeterOverlap.value )
@@ -682,18 +754,17 @@ class FillSkein:
 				self.bridgeExtrusionWidthOverSolid = float( splitLine[ 1 ] )
 			elif firstWord == '(<extrusionStart>':
 				self.addLine( '(<procedureDone> fill )' )
-				self.addLine( line )
+				self.output.addGcodeLine( gcodeLine )
 				return
-			self.addLine( line )
+			self.output.addGcodeLine( gcodeLine )
 
 	def parseLine( self, lineIndex ):
 		"Parse a gcode line and add it to the fill skein."
-		splitLine = self.lines[ lineIndex ].split( ' ' )
-		if len( splitLine ) < 1:
-			return
-		firstWord = splitLine[ 0 ]
+		gcodeLine = self.lines[ lineIndex ]
+		splitLine = gcodeLine.splitLine
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
-			self.linearMove( splitLine )
+			self.linearMove( gcodeLine )
 		elif firstWord == 'M101':
 			self.extruderActive = True
 		elif firstWord == 'M103':
@@ -708,6 +779,12 @@ class FillSkein:
 		elif firstWord == '(<extruderShutDown>':
 			self.shutdownLineIndex = lineIndex
 
+	def removeRotatedSlicesBelow( self, layerIndex ):
+		"Remove the cached rotated slices of the layers below the layer index, which the fill has passed."
+		for rotatedSliceKey in self.rotatedSliceTable.keys():
+			if rotatedSliceKey[ 0 ] < layerIndex:
+				del self.rotatedSliceTable[ rotatedSliceKey ]
+
 class FillPreferences:
 	"A class to handle the fill preferences."
 	def __init__( self ):
@@ -718,12 +795,14 @@ class FillPreferences:
 		self.extraShellsBase = preferences.IntPreference().getFromValue( 'Extra Shells on Base (layers):', 0 )
 		self.extraShellsSparseLayer = preferences.IntPreference().getFromValue( 'Extra Shells on Sparse Layer (layers):', 1 )
 		self.feedratePerSecond = preferences.FloatPreference().getFromValue( 'Feedrate (mm/s):', 16.0 )
-		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ) ], 'Open File to be Filled', '' )
+		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ), ( 'STL files', '*.stl' ) ], 'Open File to be Filled', '' )
 		self.fillBeginRotation = preferences.FloatPreference().getFromValue( 'Fill Begin Rotation (degrees):', 45.0 )
 		self.fillDensity = preferences.FloatPreference().getFromValue( 'Fill Density (ratio):', 0.5 )
 		self.fillOddLayerExtraRotation = preferences.FloatPreference().getFromValue( 'Fill Odd Layer Extra Rotation (degrees):', 90.0 )
+		self.fillProcesses = preferences.IntPreference().getFromValue( 'Fill Processes (count):', 1 )
 		self.infillPerimeterOverlap = preferences.FloatPreference().getFromValue( 'Infill Perimeter Overlap (ratio):', 0.5 )
 		self.solidSurfaceThickness = preferences.IntPreference().getFromValue( 'Solid Surface Thickness (layers):', 3 )
+		self.directoryProcesses = preferences.IntPreference().getFromValue( 'Directory Processes (count):', 1 )
 		directoryRadio = []
 		self.directoryPreference = preferences.RadioLabel().getFromRadioLabel( 'Fill All Unmodified Files in a Directory', 'File or Directory Choice:', directoryRadio, False )
 		self.filePreference = preferences.Radio().getFromRadio( 'Fill File', directoryRadio, True )
@@ -738,10 +817,14 @@ class FillPreferences:
 			self.fillBeginRotation,
 			self.fillDensity,
 			self.fillOddLayerExtraRotation,
+			self.fillProcesses,
 			self.infillPerimeterOverlap,
 			self.solidSurfaceThickness,
+			self.directoryProcesses,
 			self.directoryPreference,
 			self.filePreference ]
+		#The preferences which do not change the toolpath are left out of the cache key.
+		self.nonOutputArchive = [ self.fillProcesses, self.directoryProcesses, self.directoryPreference, self.filePreference, self.filenameInput ]
 		self.executeTitle = 'Fill'
 #		self.filename = getPreferencesFilePath( 'fill.csv' )
 		self.filenamePreferences = 'fill.csv'
@@ -751,8 +834,94 @@ class FillPreferences:
 	def execute( self ):
 		"Fill button has been clicked."
 		filenames = gcodec.getGcodeDirectoryOrFile( self.directoryPreference.value, self.filenameInput.value, self.filenameInput.wasCancelled )
-		for filename in filenames:
-			fillChainFile( filename )
+		gcodec.processFiles( fillChainFile, filenames, self.directoryProcesses.value )
+
+
+class PathGrid:
+	"A grid of the points of fill paths, with the bounding rectangles of the paths, so that the path closest to a point can be found without checking every point."
+	def __init__( self ):
+		self.boundingPaths = []
+		self.cellTable = {}
+		self.cellWidth = 0.0
+		self.maximumKey = None
+		self.minimumKey = None
+		self.paths = []
+
+	def __repr__( self ):
+		"Get the string representation of this PathGrid."
+		return str( self.cellWidth ) + ' ' + str( self.paths )
+
+	def addPoint( self, pathIndex, point ):
+		"Add a point of a path to the cell it is in and to the bounding rectangle of the path."
+		cellKey = self.getCellKey( point )
+		if cellKey not in self.cellTable:
+			self.cellTable[ cellKey ] = []
+			if self.maximumKey == None:
+				self.maximumKey = cellKey
+				self.minimumKey = cellKey
+			self.maximumKey = ( max( self.maximumKey[ 0 ], cellKey[ 0 ] ), max( self.maximumKey[ 1 ], cellKey[ 1 ] ) )
+			self.minimumKey = ( min( self.minimumKey[ 0 ], cellKey[ 0 ] ), min( self.minimumKey[ 1 ], cellKey[ 1 ] ) )
+		self.cellTable[ cellKey ].append( ( pathIndex, point ) )
+		boundingPath = self.boundingPaths[ pathIndex ]
+		pointComplex = point.dropAxis( 2 )
+		boundingPath.maximum = euclidean.getComplexMaximum( boundingPath.maximum, pointComplex )
+		boundingPath.minimum = euclidean.getComplexMinimum( boundingPath.minimum, pointComplex )
+
+	def getCellKey( self, point ):
+		"Get the key of the cell which the point is in."
+		if self.cellWidth <= 0.0:
+			return ( 0, 0 )
+		return ( int( math.floor( point.x / self.cellWidth ) ), int( math.floor( point.y / self.cellWidth ) ) )
+
+	def getFromPaths( self, paths, minimumCellWidth ):
+		"Initialize from paths, with cells about as wide as the average spacing of the path points."
+		self.paths = paths
+		points = []
+		for path in paths:
+			self.boundingPaths.append( euclidean.BoundingLoop().getFromLoop( path ) )
+			points += path
+		if len( points ) < 1:
+			return self
+		span = euclidean.getComplexMaximumFromVec3List( points ) - euclidean.getComplexMinimumFromVec3List( points )
+		self.cellWidth = max( math.sqrt( span.real * span.imag / float( len( points ) ) ), minimumCellWidth )
+		for pathIndex in xrange( len( paths ) ):
+			for point in paths[ pathIndex ]:
+				self.addPoint( pathIndex, point )
+		return self
+
+	def getNearestDistanceSquaredPathIndex( self, point ):
+		"Get the distance squared to the nearest path point and the index of its path, with the first path winning a tie, or None if there are no points."
+		if self.maximumKey == None:
+			return None
+		cellKey = self.getCellKey( point )
+		maximumRing = max( cellKey[ 0 ] - self.minimumKey[ 0 ], self.maximumKey[ 0 ] - cellKey[ 0 ], cellKey[ 1 ] - self.minimumKey[ 1 ], self.maximumKey[ 1 ] - cellKey[ 1 ] )
+		nearestDistanceSquaredPathIndex = None
+		for ring in xrange( maximumRing + 1 ):
+			for x in xrange( max( cellKey[ 0 ] - ring, self.minimumKey[ 0 ] ), min( cellKey[ 0 ] + ring, self.maximumKey[ 0 ] ) + 1 ):
+				yStep = 2 * ring
+				if x == cellKey[ 0 ] - ring or x == cellKey[ 0 ] + ring:
+					yStep = 1
+				for y in xrange( cellKey[ 1 ] - ring, cellKey[ 1 ] + ring + 1, max( yStep, 1 ) ):
+					ringKey = ( x, y )
+					if ringKey in self.cellTable:
+						for pathIndexPoint in self.cellTable[ ringKey ]:
+							distanceSquaredPathIndex = ( point.distance2( pathIndexPoint[ 1 ] ), pathIndexPoint[ 0 ] )
+							if nearestDistanceSquaredPathIndex == None or distanceSquaredPathIndex < nearestDistanceSquaredPathIndex:
+								nearestDistanceSquaredPathIndex = distanceSquaredPathIndex
+			unseenDistance = ring * self.cellWidth
+			if nearestDistanceSquaredPathIndex != None and nearestDistanceSquaredPathIndex[ 0 ] < unseenDistance * unseenDistance:
+				return nearestDistanceSquaredPathIndex
+		return nearestDistanceSquaredPathIndex
+
+	def getOverlappingOtherPaths( self, pathIndex, segmentBegin, segmentEnd, outset ):
+		"Get the paths other than the path at the index whose bounding rectangles overlap the segment outset by a distance."
+		otherBoundingPaths = self.boundingPaths[ : pathIndex ] + self.boundingPaths[ pathIndex + 1 : ]
+		return euclidean.getOverlappingLoops( otherBoundingPaths, segmentBegin, segmentEnd, outset )
+
+	def insertPoint( self, pathIndex, pointIndex, point ):
+		"Insert a point into a path and add it to the grid."
+		self.paths[ pathIndex ].insert( pointIndex, point )
+		self.addPoint( pathIndex, point )
 
 
 class RotatedLayer:
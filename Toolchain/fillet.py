@@ -3,7 +3,8 @@ Fillet is a script to fillet or bevel the corners on a gcode file.
 
 Fillets rounds the corners slightly in a variety of ways.  This is to reduce corner blobbing and sudden extruder acceleration.
 The default radio button choice is 'Bevel'.  If the default choice is 'Do Not Fillet', the gcode text is handed over the next tool in the
-skeinforge chain.  To run fillet, in a shell type:
+skeinforge chain.  If 'Leave Out Unchanged Z and F Words' is chosen, the saved file leaves the Z and F words out of the
+G1 lines which have the same Z and F as the move before, which makes the file smaller.  To run fillet, in a shell type:
 > python fillet.py
 
 To run fillet, install python 2.x on your machine, which is avaliable from http://www.python.org/download/
@@ -44,7 +45,10 @@ The following examples fillet the files Hollow Square.gcode & Hollow Square.gts.
 which contains Hollow Square.gcode, Hollow Square.gts and fillet.py.  The fillet function executes the preferred fillet type, which
 can be set in the dialog or by changing the preferences file 'fillet.csv' with a text editor or a spreadsheet program set to separate
 tabs.  The functions filletChainFile and getFilletChainGcode check to see if the text has been combed, if not they call the
-getStretchChainGcode in stretch.py to fill the text; once they have the stretched text, then they fillet.
+getStretchChainGcode in stretch.py to fill the text; once they have the stretched text, then they fillet.  Each procedure in the chain saves
+its toolpath in the skeinforge_cache folder in the home directory, named by the hash of its input text and preferences, so when only
+the fillet preferences change the earlier procedures are read from the cache instead of being done again.  The cache can be turned off
+and its size limited in the cache preferences, which are set by typing 'python cache.py' in a shell.
 
 
 > pydoc -w fillet
@@ -153,7 +157,7 @@ many lines of gcode
 """
 import sys
 from vec3 import Vec3
-import cStringIO
+import cache
 import euclidean
 import gcodec
 import preferences
@@ -245,11 +249,11 @@ def filletChainFile( filename = '' ):
 	preferences.readPreferences( filletPreferences )
 	startTime = time.time()
 	print >> sys.stderr, ( 'File ' + gcodec.getSummarizedFilename( filename ) + ' is being chain filleted.' )
-	gcodeText = gcodec.getFileText( filename )
+	gcodeText = gcodec.getFileText( filename, gcodec.getReadMode( filename ) )
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_fillet.gcode'
-	gcodec.writeFileText( suffixFilename, getFilletChainGcode( gcodeText, filletPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getFilletChainToolpath( gcodeText, filletPreferences ), filletPreferences.leaveOutUnchangedWords.value )
 	print >> sys.stderr, ( 'The filleted file is saved as ' + gcodec.getSummarizedFilename( suffixFilename ) )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 	print >> sys.stderr, ( 'It took ' + str( int( round( time.time() - startTime ) ) ) + ' seconds to fillet the file.' )
@@ -273,7 +277,7 @@ def filletFile( filename = '' ):
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_fillet.gcode'
-	gcodec.writeFileText( suffixFilename, getFilletGcode( gcodeText, filletPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getFilletToolpath( gcodeText, filletPreferences ), filletPreferences.leaveOutUnchangedWords.value )
 	print >> sys.stderr, ( 'The filleted file is saved as ' + suffixFilename )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 
@@ -303,28 +307,44 @@ def getBevelGcode( filletPreferences, gcodeText ):
 
 def getFilletChainGcode( gcodeText, filletPreferences = None ):
 	"Fillet a gcode linear move text.  Chain stretch the gcode if it is not already stretched."
+	return getFilletChainToolpath( gcodeText, filletPreferences ).getvalue()
+
+def getFilletChainToolpath( gcodeText, filletPreferences = None ):
+	"Fillet a gcode linear move text or toolpath into a toolpath.  Chain stretch the gcode if it is not already stretched."
 	if not gcodec.isProcedureDone( gcodeText, 'stretch' ):
-		gcodeText = stretch.getStretchChainGcode( gcodeText )
-	return getFilletGcode( gcodeText, filletPreferences )
+		gcodeText = stretch.getStretchChainToolpath( gcodeText )
+	if filletPreferences == None:
+		filletPreferences = FilletPreferences()
+		preferences.readPreferences( filletPreferences )
+	return cache.getCachedToolpath( gcodeText, 'fillet', filletPreferences, getFilletToolpath )
 
 def getFilletGcode( gcodeText, filletPreferences = None ):
 	"Fillet a gcode linear move text."
-	if gcodeText == '':
-		return ''
-	if gcodec.isProcedureDone( gcodeText, 'fillet' ):
-		return gcodeText
+	return getFilletToolpath( gcodeText, filletPreferences ).getvalue()
+
+def getFilletToolpath( gcodeText, filletPreferences = None ):
+	"Fillet a gcode linear move text or toolpath into a toolpath."
+	toolpath = gcodec.getToolpath( gcodeText )
+	if len( toolpath.gcodeLines ) < 1:
+		return toolpath
+	if gcodec.isProcedureDone( toolpath, 'fillet' ):
+		return toolpath
 	if filletPreferences == None:
 		filletPreferences = FilletPreferences()
 		preferences.readPreferences( filletPreferences )
+	skein = None
 	if filletPreferences.arcPoint.value:
-		return getArcPointGcode( filletPreferences, gcodeText )
+		skein = ArcPointSkein()
 	elif filletPreferences.arcRadius.value:
-		return getArcRadiusGcode( filletPreferences, gcodeText )
+		skein = ArcRadiusSkein()
 	elif filletPreferences.arcSegment.value:
-		return getArcSegmentGcode( filletPreferences, gcodeText )
+		skein = ArcSegmentSkein()
 	elif filletPreferences.bevel.value:
-		return getBevelGcode( filletPreferences, gcodeText )
-	return gcodeText
+		skein = BevelSkein()
+	if skein == None:
+		return toolpath
+	skein.parseGcode( filletPreferences, toolpath )
+	return skein.output
 
 class BevelSkein:
 	"A class to bevel a skein of extrusions."
@@ -338,46 +358,33 @@ class BevelSkein:
 		self.lines = None
 		self.oldActiveLocation = None
 		self.oldLocation = None
-		self.output = cStringIO.StringIO()
+		self.output = gcodec.Toolpath()
 		self.shouldAddLine = True
 
-	def addFeedrateEnd( self ):
-		"Add the gcode feedrate and a newline to the output."
-		self.addLine(  ' F' + euclidean.getRoundedToThreePlaces( self.feedrateMinute ) )
-
 	def addLine( self, line ):
 		"Add a line of text and a newline to the output."
-		self.output.write( line + '\n' )
+		self.output.addLine( line )
 
 	def addLinearMovePoint( self, point ):
 		"Add a gcode linear move, feedrate and newline to the output."
-		self.output.write( 'G1' )
-		self.addPoint( point )
-		self.addFeedrateEnd()
-
-	def addPoint( self, point ):
-		"Add a gcode point to the output."
-		self.output.write( ' X' + euclidean.getRoundedToThreePlaces( point.x ) + ' Y' + euclidean.getRoundedToThreePlaces( point.y ) + ' Z' + euclidean.getRoundedToThreePlaces( point.z ) )
+		self.output.addLinearMove( point, self.feedrateMinute )
 
 	def getNextActive( self ):
 		"Get the next linear move where the extruder is still active.  Return none is none is found."
 		for afterIndex in range( self.lineIndex + 1, len( self.lines ) ):
-			line = self.lines[ afterIndex ]
-			splitLine = line.split( ' ' )
-			firstWord = "";
-			if len( splitLine ) > 0:
-				firstWord = splitLine[ 0 ]
+			gcodeLine = self.lines[ afterIndex ]
+			firstWord = gcodeLine.firstWord
 			if firstWord == 'G1':
-				nextActive = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
+				nextActive = gcodec.getLocationFromGcodeLine( self.oldLocation, gcodeLine )
 				return nextActive
 			if firstWord == 'M103':
 				return None
 		return None
 
-	def linearMove( self, splitLine ):
+	def linearMove( self, gcodeLine ):
 		"Bevel a linear move."
-		location = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
-		self.feedrateMinute = gcodec.getFeedrateMinute( self.feedrateMinute, splitLine )
+		location = gcodec.getLocationFromGcodeLine( self.oldLocation, gcodeLine )
+		self.feedrateMinute = gcodec.getFeedrateMinuteFromGcodeLine( self.feedrateMinute, gcodeLine )
 		if not self.extruderActive:
 			return
 		if self.oldActiveLocation != None:
@@ -388,21 +395,19 @@ class BevelSkein:
 		self.oldActiveLocation = location
 
 	def parseGcode( self, filletPreferences, gcodeText ):
-		"Parse gcode text and store the bevel gcode."
-		self.lines = gcodec.getTextLines( gcodeText )
+		"Parse gcode text or toolpath and store the bevel gcode."
+		self.lines = gcodec.getToolpath( gcodeText ).gcodeLines
 		self.parseInitialization( filletPreferences )
 		for self.lineIndex in range( self.lineIndex, len( self.lines ) ):
-			line = self.lines[ self.lineIndex ]
-			self.parseLine( line )
+			gcodeLine = self.lines[ self.lineIndex ]
+			self.parseLine( gcodeLine )
 
 	def parseInitialization( self, filletPreferences ):
 		"Parse gcode initialization and store the parameters."
 		for self.lineIndex in range( len( self.lines ) ):
-			line = self.lines[ self.lineIndex ]
-			splitLine = line.split( ' ' )
-			firstWord = ''
-			if len( splitLine ) > 0:
-				firstWord = splitLine[ 0 ]
+			gcodeLine = self.lines[ self.lineIndex ]
+			splitLine = gcodeLine.splitLine
+			firstWord = gcodeLine.firstWord
 			if firstWord == '(<extrusionWidth>':
 				self.halfExtrusionWidth = 0.5 * float( splitLine[ 1 ] ) * filletPreferences.filletRadiusOverHalfExtrusionWidth.value
 			elif firstWord == '(<bridgeExtrusionWidthOverSolid>':
@@ -410,17 +415,14 @@ class BevelSkein:
 			elif firstWord == '(<extrusionStart>':
 				self.addLine( '(<procedureDone> fillet )' )
 				return
-			self.addLine( line )
+			self.output.addGcodeLine( gcodeLine )
 
-	def parseLine( self, line ):
+	def parseLine( self, gcodeLine ):
 		"Parse a gcode line and add it to the bevel gcode."
 		self.shouldAddLine = True
-		splitLine = line.split( ' ' )
-		if len( splitLine ) < 1:
-			return 0
-		firstWord = splitLine[ 0 ]
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
-			self.linearMove( splitLine )
+			self.linearMove( gcodeLine )
 		if firstWord == 'M101':
 			self.extruderActive = True
 		if firstWord == 'M103':
@@ -431,7 +433,7 @@ class BevelSkein:
 		elif firstWord == '(<bridgeLayer>':
 			self.layerHalfExtrusionWidth = self.halfExtrusionWidth * self.bridgeExtrusionWidthOverSolid
 		if self.shouldAddLine:
-			self.addLine( line )
+			self.output.addGcodeLine( gcodeLine )
 
 	def splitPointGetAfter( self, location, nextActive, oldActiveLocation ):
 		"Bevel a point and return the end of the bevel."
@@ -522,26 +524,25 @@ class ArcPointSkein( ArcSegmentSkein ):
 		"Add an arc point to the filleted skein."
 		afterPointMinusBefore = afterPoint.minus( beforePoint )
 		centerMinusBefore = center.minus( beforePoint )
+		firstWord = 'G2'
 		if afterCenterDifferenceAngle > 0.0:
-			self.output.write( 'G3' )
-		else:
-			self.output.write( 'G2' )
-		self.addPoint( afterPointMinusBefore )
-		self.addRelativeCenter( centerMinusBefore )
-		self.addFeedrateEnd()
+			firstWord = 'G3'
+		xyzString = ' X' + euclidean.getRoundedToThreePlaces( afterPointMinusBefore.x ) + ' Y' + euclidean.getRoundedToThreePlaces( afterPointMinusBefore.y ) + ' Z' + euclidean.getRoundedToThreePlaces( afterPointMinusBefore.z )
+		feedrateString = ' F' + euclidean.getRoundedToThreePlaces( self.feedrateMinute )
+		self.addLine( firstWord + xyzString + self.getRelativeCenter( centerMinusBefore ) + feedrateString )
 
-	def addRelativeCenter( self, centerMinusBefore ):
-		"Add the relative center to a line of the arc point filleted skein."
-		self.output.write( ' I' + euclidean.getRoundedToThreePlaces( centerMinusBefore.x ) + ' J' + euclidean.getRoundedToThreePlaces( centerMinusBefore.y ) )
+	def getRelativeCenter( self, centerMinusBefore ):
+		"Get the relative center words of a line of the arc point filleted skein."
+		return ' I' + euclidean.getRoundedToThreePlaces( centerMinusBefore.x ) + ' J' + euclidean.getRoundedToThreePlaces( centerMinusBefore.y )
 
 
 class ArcRadiusSkein( ArcPointSkein ):
 	"A class to arc radius a skein of extrusions."
-	def addRelativeCenter( self, centerMinusBefore ):
-		"Add the relative center to a line of the arc radius filleted skein."
+	def getRelativeCenter( self, centerMinusBefore ):
+		"Get the relative center word of a line of the arc radius filleted skein."
 		planeCenterMinusBefore = centerMinusBefore.dropAxis( 2 )
 		radius = abs( planeCenterMinusBefore )
-		self.output.write( ' R' + euclidean.getRoundedToThreePlaces( radius ) )
+		return ' R' + euclidean.getRoundedToThreePlaces( radius )
 
 
 class FilletPreferences:
@@ -556,10 +557,12 @@ class FilletPreferences:
 		self.bevel = preferences.Radio().getFromRadio( 'Bevel', filletRadio, True )
 		self.doNotFillet = preferences.Radio().getFromRadio( 'Do Not Fillet', filletRadio, False )
 		self.filletRadiusOverHalfExtrusionWidth = preferences.FloatPreference().getFromValue( 'Fillet Radius Over Half Extrusion Width (ratio):', 0.7 )
+		self.leaveOutUnchangedWords = preferences.BooleanPreference().getFromValue( 'Leave Out Unchanged Z and F Words:', False )
+		self.directoryProcesses = preferences.IntPreference().getFromValue( 'Directory Processes (count):', 1 )
 		directoryRadio = []
 		self.directoryPreference = preferences.RadioLabel().getFromRadioLabel( 'Fillet All Unmodified Files in a Directory', 'File or Directory Choice:', directoryRadio, False )
 		self.filePreference = preferences.Radio().getFromRadio( 'Fillet File', directoryRadio, True )
-		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ) ], 'Open File to be Filleted', '' )
+		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ), ( 'STL files', '*.stl' ) ], 'Open File to be Filleted', '' )
 		#Create the archive, title of the execute button, title of the dialog & preferences filename.
 		self.archive = [
 			self.arcPoint,
@@ -568,9 +571,13 @@ class FilletPreferences:
 			self.bevel,
 			self.doNotFillet,
 			self.filletRadiusOverHalfExtrusionWidth,
+			self.leaveOutUnchangedWords,
+			self.directoryProcesses,
 			self.directoryPreference,
 			self.filePreference,
 			self.filenameInput ]
+		#The preferences which do not change the toolpath are left out of the cache key.
+		self.nonOutputArchive = [ self.leaveOutUnchangedWords, self.directoryProcesses, self.directoryPreference, self.filePreference, self.filenameInput ]
 		self.executeTitle = 'Fillet'
 #		self.filename = getPreferencesFilePath( 'fillet.csv' )
 		self.filenamePreferences = 'fillet.csv'
@@ -580,8 +587,7 @@ class FilletPreferences:
 	def execute( self ):
 		"Fillet button has been clicked."
 		filenames = gcodec.getGcodeDirectoryOrFile( self.directoryPreference.value, self.filenameInput.value, self.filenameInput.wasCancelled )
-		for filename in filenames:
-			filletChainFile( filename )
+		gcodec.processFiles( filletChainFile, filenames, self.directoryProcesses.value )
 
 
 def main( hashtable = None ):
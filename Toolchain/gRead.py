@@ -1,4 +1,5 @@
 from vec3 import *
+import gcodec
 
 # Get the entire text of a file.
 # @param  filename name of the file
@@ -33,25 +34,22 @@ def indexOfStartingWithSecond( letter, splitLine ):
 
 class gRead:
     def __init__(self,filename, layers):
-        fileText = getFileText( filename )
-        textLines = getTextLines( fileText )
+        gcodeFile = open( filename, 'r' )
         self.last_pos = vec3()
         self.layers = layers
         self.layer = None
         self.thread = None
         self.skeinforge = 0
         self.max_z = -9999999999
-        for line in textLines:
-            self.parseLine( line )
+        for gcodeLine in gcodec.getGcodeLinesFromFile( gcodeFile ):   #read one line at a time, so that large files are not held in memory
+            self.parseLine( gcodeLine )
+        gcodeFile.close()
         self.newLayer()
 
-    def parseLine(self, line):
-        splitLine = line.split( ' ' )
-        if len( splitLine ) < 1:
-            return 0
-        firstWord = splitLine[ 0 ]
+    def parseLine(self, gcodeLine):
+        firstWord = gcodeLine.firstWord
         if firstWord == 'G1':
-            self.linearMove( splitLine )
+            self.linearMove( gcodeLine )
         if firstWord == 'M110':             #filament height only sent by skeinforge at the moment
             self.skeinforge = 1
             self.newThread()
@@ -61,18 +59,6 @@ class gRead:
         if firstWord == 'G92':              #offset coordinate system
             self.newThread()                #for RepRap
 
-    # Set a point to the gcode split line.
-    def setPointComponent( self, point, splitLine ):
-        indexOfX = indexOfStartingWithSecond( "X", splitLine )
-        if indexOfX > 0:
-            point.x = getDoubleAfterFirstLetter( splitLine[ indexOfX ] )
-        indexOfY = indexOfStartingWithSecond( "Y", splitLine )
-        if indexOfY > 0:
-            point.y = getDoubleAfterFirstLetter( splitLine[ indexOfY ] )
-        indexOfZ = indexOfStartingWithSecond( "Z", splitLine )
-        if indexOfZ > 0:
-            point.z = getDoubleAfterFirstLetter( splitLine[ indexOfZ ] )
-
     def newLayer(self):
         self.newThread()
         if self.layer:
@@ -84,10 +70,13 @@ class gRead:
             self.layer.append(self.thread)
         self.thread = []
 
-    def linearMove( self, splitLine ):
+    def linearMove( self, gcodeLine ):
         if self.thread != None:
             pos = vec3().getFromVec3(self.last_pos)
-            self.setPointComponent( pos, splitLine )
+            wordTable = gcodeLine.getWordTable()
+            pos.x = wordTable.get( 'X', pos.x )
+            pos.y = wordTable.get( 'Y', pos.y )
+            pos.z = wordTable.get( 'Z', pos.z )
             if pos.z > self.max_z:
                 self.newLayer()
                 self.max_z = pos.z
@@ -15,9 +15,16 @@ many lines of text
 ..
 
 """
+import euclidean
 import sys
+import time
+import traceback
 from vec3 import Vec3
 import os
+try:
+	import multiprocessing
+except:
+	multiprocessing = None
 
 
 __author__ = "Enrique Perez (perez_enrique@yahoo.com)"
@@ -38,10 +45,28 @@ def getDoubleForLetter( letter, splitLine ):
 
 def getFeedrateMinute( feedrateMinute, splitLine ):
 	"Get the feedrate per minute if the split line has a feedrate."
-	indexOfF = indexOfStartingWithSecond( "F", splitLine )
-	if indexOfF > 0:
-		return getDoubleAfterFirstLetter( splitLine[ indexOfF ] )
-	return feedrateMinute
+	return getParsedMove( splitLine ).getFeedrateMinute( feedrateMinute )
+
+def getFeedrateMinuteFromGcodeLine( feedrateMinute, gcodeLine ):
+	"Get the feedrate per minute if the gcode line has a feedrate, without parsing the line again if its feedrate is known or it has already been parsed."
+	if gcodeLine.location == None:
+		return gcodeLine.getParsedMove().getFeedrateMinute( feedrateMinute )
+	if gcodeLine.feedrateMinute == None:
+		return feedrateMinute
+	return gcodeLine.feedrateMinute
+
+def getFileFunctionTime( fileFunctionFilename ):
+	"""Get the filename, the seconds the file function took on the file, and the traceback text if it failed or None if it succeeded, this is called in a directory process.
+
+	Keyword arguments:
+	fileFunctionFilename -- tuple of the file function and the filename"""
+	fileFunction, filename = fileFunctionFilename
+	startTime = time.time()
+	try:
+		fileFunction( filename )
+	except Exception:
+		return ( filename, time.time() - startTime, traceback.format_exc() )
+	return ( filename, time.time() - startTime, None )
 
 def getFilesWithFileTypeWithoutWords( fileType, words = [], fileInDirectory = '' ):
 	"""Get files which have a given file type, but with do not contain a word in a list.
@@ -62,13 +87,25 @@ def getFilesWithFileTypeWithoutWords( fileType, words = [], fileInDirectory = ''
 			filesWithFileType.append( joinedFilename )
 	return filesWithFileType
 
-def getFileText( filename ):
-	"""Get the entire text of a file.
+def getFileForReading( filename ):
+	"""Get a file opened for reading, or None if the file does not exist.
 
 	Keyword arguments:
 	filename -- name of the file"""
 	try:
-		file = open( filename, 'r' )
+		return open( filename, 'r' )
+	except IOError:
+		print >> sys.stderr, ( 'The file ' + filename + ' does not exist, None will be returned.' )
+		return None
+
+def getFileText( filename, readMode = 'r' ):
+	"""Get the entire text of a file.
+
+	Keyword arguments:
+	filename -- name of the file
+	readMode -- mode in which the file is opened, 'rb' for a binary file"""
+	try:
+		file = open( filename, readMode )
 		fileText = file.read()
 		file.close()
 		return fileText
@@ -76,6 +113,38 @@ def getFileText( filename ):
 		print >> sys.stderr, ( 'The file ' + filename + ' does not exist, an empty string will be returned.' )
 		return ''
 
+def getGcodeLines( gcodeText ):
+	"""Get the gcode lines of a gcode text, toolpath or file.  A file or mmap is read from its beginning, one line at a time.
+
+	Keyword arguments:
+	gcodeText -- gcode text, toolpath, file or mmap"""
+	if isinstance( gcodeText, Toolpath ):
+		return gcodeText.gcodeLines
+	if isinstance( gcodeText, str ):
+		return getGcodeLinesFromText( gcodeText )
+	gcodeText.seek( 0 )
+	return getGcodeLinesFromFile( gcodeText )
+
+def getGcodeLinesFromFile( gcodeFile ):
+	"""Get a generator of the gcode lines of a file, which reads and splits one line at a time, so that the whole file is never in memory.
+
+	Keyword arguments:
+	gcodeFile -- file, mmap or any other object with a readline method"""
+	while 1:
+		line = gcodeFile.readline()
+		if line == '':
+			return
+		for textLine in getTextLines( line.rstrip( '\r\n' ) ):
+			yield GcodeLine( textLine )
+
+def getGcodeLinesFromText( gcodeText ):
+	"""Get a generator of the gcode lines of a text.
+
+	Keyword arguments:
+	gcodeText -- gcode text"""
+	for line in getTextLines( gcodeText ):
+		yield GcodeLine( line )
+
 def getGNUGcode( fileInDirectory = '' ):
 	"Get GNU Triangulated Surface files and gcode files which are not modified."
 	return getGNUTriangulatedSurfaceFiles( fileInDirectory ) + getUnmodifiedGCodeFiles( fileInDirectory )
@@ -97,23 +166,47 @@ def getGNUDirectoryOrFile( isDirectory, filename, wasCancelled ):
 	return [ filename ]
 
 def getGNUTriangulatedSurfaceFiles( fileInDirectory = '' ):
-	"Get GNU Triangulated Surface files."
-	return getFilesWithFileTypeWithoutWords( 'gts', [], fileInDirectory )
+	"Get GNU Triangulated Surface files and STL files."
+	return getFilesWithFileTypeWithoutWords( 'gts', [], fileInDirectory ) + getFilesWithFileTypeWithoutWords( 'stl', [], fileInDirectory )
+
+def getLocationFromGcodeLine( oldLocation, gcodeLine ):
+	"Get the location of the gcode line, without parsing the line again if its location is known or it has already been parsed."
+	location = gcodeLine.location
+	if location == None:
+		return gcodeLine.getParsedMove().getLocation( oldLocation )
+	return Vec3( location.x, location.y, location.z )
 
 def getLocationFromSplitLine( oldLocation, splitLine ):
-	location = Vec3()
-	if oldLocation != None:
-		location.setToVec3( oldLocation )
-	indexOfX = indexOfStartingWithSecond( "X", splitLine )
-	if indexOfX > 0:
-		location.x = getDoubleAfterFirstLetter( splitLine[ indexOfX ] )
-	indexOfY = indexOfStartingWithSecond( "Y", splitLine )
-	if indexOfY > 0:
-		location.y = getDoubleAfterFirstLetter( splitLine[ indexOfY ] )
-	indexOfZ = indexOfStartingWithSecond( "Z", splitLine )
-	if indexOfZ > 0:
-		location.z = getDoubleAfterFirstLetter( splitLine[ indexOfZ ] )
-	return location
+	"Get the location of the split line, with the components which are not in the line from the old location."
+	return getParsedMove( splitLine ).getLocation( oldLocation )
+
+def getParsedMove( splitLine ):
+	"Get the parsed move of the split line, with the first X, Y, Z and F values after the first word found in a single pass."
+	feedrateMinute = None
+	x = None
+	y = None
+	z = None
+	for word in splitLine[ 1 : ]:
+		firstLetter = word[ : 1 ]
+		if firstLetter == 'X':
+			if x == None:
+				x = float( word[ 1 : ] )
+		elif firstLetter == 'Y':
+			if y == None:
+				y = float( word[ 1 : ] )
+		elif firstLetter == 'Z':
+			if z == None:
+				z = float( word[ 1 : ] )
+		elif firstLetter == 'F':
+			if feedrateMinute == None:
+				feedrateMinute = float( word[ 1 : ] )
+	return ParsedMove( feedrateMinute, x, y, z )
+
+def getReadMode( filename ):
+	"Get the mode in which a file is read, which is binary for an STL file so that newline translation does not change a binary STL file."
+	if filename.lower().endswith( '.stl' ):
+		return 'rb'
+	return 'r'
 
 def getSummarizedFilename( filename ):
 	"Get the filename basename if the file is in the current working directory, otherwise return the original full name."
@@ -121,6 +214,20 @@ def getSummarizedFilename( filename ):
 		return os.path.basename( filename )
 	return filename
 
+def getToolpath( gcodeText ):
+	"""Get the toolpath of a gcode text.  If the gcode text is already a toolpath, return the toolpath.
+
+	Keyword arguments:
+	gcodeText -- gcode text or toolpath"""
+	if isinstance( gcodeText, Toolpath ):
+		return gcodeText
+	toolpath = Toolpath()
+	if gcodeText == '':
+		return toolpath
+	for line in getTextLines( gcodeText ):
+		toolpath.gcodeLines.append( GcodeLine( line ) )
+	return toolpath
+
 def getTextLines( text ):
 	"""Get the all the lines of text of a text.
 
@@ -158,13 +265,13 @@ def isFileWithFileTypeWithoutWords( fileType, filename, words ):
 	return 1
 
 def isProcedureDone( gcodeText, procedure ):
-	"Determine if the procedure has been done on the gcode text."
-	lines = getTextLines( gcodeText )
-	for line in lines:
-		splitLine = line.split( ' ' )
-		firstWord = ''
-		if len( splitLine ) > 0:
-			firstWord = splitLine[ 0 ]
+	"Determine if the procedure has been done on the gcode text or toolpath.  A text is scanned line by line without making a toolpath of it."
+	if isinstance( gcodeText, Toolpath ):
+		splitLines = ( gcodeLine.splitLine for gcodeLine in gcodeText.gcodeLines )
+	else:
+		splitLines = ( line.split( ' ' ) for line in getTextLines( gcodeText ) )
+	for splitLine in splitLines:
+		firstWord = splitLine[ 0 ]
 		if firstWord == '(<procedureDone>':
 			if splitLine[ 1 ].find( procedure ) != - 1:
 				return True
@@ -172,6 +279,38 @@ def isProcedureDone( gcodeText, procedure ):
 			return False
 	return False
 
+def processFiles( fileFunction, filenames, numberOfProcesses = 1 ):
+	"""Process files with a file function, in parallel by a pool of processes if there is more than one file and process and the multiprocessing module is available.
+	A file which fails does not stop the other files.  When all the files are done, the time each took is printed.
+
+	Keyword arguments:
+	fileFunction -- module function of a filename, for example sliceFile
+	filenames -- names of the files
+	numberOfProcesses -- number of processes in the pool"""
+	if len( filenames ) < 1:
+		return
+	startTime = time.time()
+	fileFunctionFilenames = [ ( fileFunction, filename ) for filename in filenames ]
+	numberOfProcesses = min( numberOfProcesses, len( filenames ) )
+	if multiprocessing == None or numberOfProcesses < 2:
+		fileTimes = map( getFileFunctionTime, fileFunctionFilenames )
+	else:
+		pool = multiprocessing.Pool( numberOfProcesses )
+		try:
+			fileTimes = pool.map( getFileFunctionTime, fileFunctionFilenames, 1 )
+		finally:
+			pool.terminate()
+			pool.join()
+	numberOfFailures = 0
+	for filename, seconds, tracebackText in fileTimes:
+		secondsString = euclidean.getRoundedToThreePlaces( seconds )
+		if tracebackText == None:
+			print >> sys.stderr, ( 'File ' + getSummarizedFilename( filename ) + ' took ' + secondsString + ' seconds.' )
+		else:
+			numberOfFailures += 1
+			print >> sys.stderr, ( 'File ' + getSummarizedFilename( filename ) + ' failed after ' + secondsString + ' seconds with:\n' + tracebackText )
+	print >> sys.stderr, ( 'It took ' + str( int( round( time.time() - startTime ) ) ) + ' seconds to process ' + str( len( filenames ) ) + ' files, of which ' + str( numberOfFailures ) + ' failed.' )
+
 def replaceWords( filenames, wordReplacements ):
 	"Replace in files the first word of a tuple with the second word of the tuple, from a list of tuples."
 	for filename in filenames:
@@ -202,3 +341,207 @@ def writeFileText( filename, fileText ):
 		file.close()
 	except IOError:
 		print >> sys.stderr, ( 'The file ' + filename + ' can not be written to.' )
+
+def writeToolpathFile( filename, toolpath, isModal = False ):
+	"""Write a toolpath to a file, a chunk of lines at a time.
+
+	Keyword arguments:
+	filename -- name of the file
+	toolpath -- toolpath which will be written to the file
+	isModal -- if True, Z and F words which are the same as in the previous move are left out"""
+	try:
+		file = open( filename, 'w+' )
+	except IOError:
+		print >> sys.stderr, ( 'The file ' + filename + ' can not be written to.' )
+		return
+	try:
+		gcodeWriter = GcodeWriter( file, isModal )
+		gcodeWriter.addToolpath( toolpath )
+		gcodeWriter.flush()
+	except IOError:
+		print >> sys.stderr, ( 'The file ' + filename + ' can not be written to.' )
+	finally:
+		file.close()
+
+
+class GcodeLine:
+	"A gcode line split into words, with the location and feedrate of the line if they are known without parsing."
+	def __init__( self, line, location = None, feedrateMinute = None ):
+		"Initialize the gcode line."
+		self.feedrateMinute = feedrateMinute
+		self.line = line
+		self.location = location
+		self.parsedMove = None
+		self.splitLine = line.split( ' ' )
+		self.firstWord = self.splitLine[ 0 ]
+
+	def __repr__( self ):
+		"Get the string representation of this gcode line."
+		return self.line
+
+	def getParsedMove( self ):
+		"Get the parsed move of the line, which is parsed only the first time, so that the skeins which look at a line several times only parse it once."
+		if self.parsedMove == None:
+			self.parsedMove = getParsedMove( self.splitLine )
+		return self.parsedMove
+
+	def getTag( self ):
+		"Get the tag of a skeinforge comment, for example 'layerStart' for '(<layerStart> 0.4 )', or None if the line is not a skeinforge comment."
+		if not self.firstWord.startswith( '(<' ) or not self.firstWord.endswith( '>' ):
+			return None
+		return self.firstWord[ 2 : - 1 ]
+
+	def getWordTable( self ):
+		"Get the table of the values of the words after the first word, keyed by their letters, for example { 'X' : 1.0, 'F' : 600.0 } for 'G1 X1.0 F600.0'."
+		wordTable = {}
+		if self.firstWord.startswith( '(' ):
+			return wordTable
+		for word in self.splitLine[ 1 : ]:
+			if len( word ) > 1:
+				try:
+					wordTable[ word[ 0 ] ] = getDoubleAfterFirstLetter( word )
+				except ValueError:
+					pass
+		return wordTable
+
+
+class GcodeWriter:
+	"""A writer which sends gcode lines to a file or stream in chunks, optionally leaving out the modal Z and F words which have not changed.
+
+	Words are only left out of G1 lines, and only while the positioning is absolute. Any other G command except G2 and G3 forgets the last Z and F, because it might home or set the position."""
+	def __init__( self, output, isModal = False ):
+		"Initialize the writer."
+		self.chunkLines = []
+		self.feedrateWord = None
+		self.isModal = isModal
+		self.isRelative = False
+		self.numberOfChunkLines = 4096
+		self.output = output
+		self.zWord = None
+
+	def addGcodeLine( self, gcodeLine ):
+		"Add a gcode line, writing the chunk when it is full."
+		line = gcodeLine.line
+		if self.isModal:
+			line = self.getModalLine( gcodeLine )
+		self.chunkLines.append( line )
+		if len( self.chunkLines ) >= self.numberOfChunkLines:
+			self.flush()
+
+	def addToolpath( self, toolpath ):
+		"Add the gcode lines of a toolpath."
+		for gcodeLine in toolpath.gcodeLines:
+			self.addGcodeLine( gcodeLine )
+
+	def flush( self ):
+		"Write the chunk of lines to the output."
+		if len( self.chunkLines ) < 1:
+			return
+		self.output.write( '\n'.join( self.chunkLines ) + '\n' )
+		self.chunkLines = []
+
+	def getModalLine( self, gcodeLine ):
+		"Get the line without the Z and F words which are the same as in the previous move."
+		firstWord = gcodeLine.firstWord
+		if firstWord == 'G1' and not self.isRelative:
+			keptWords = [ firstWord ]
+			for word in gcodeLine.splitLine[ 1 : ]:
+				if word.startswith( 'Z' ):
+					if word == self.zWord:
+						continue
+					self.zWord = word
+				elif word.startswith( 'F' ):
+					if word == self.feedrateWord:
+						continue
+					self.feedrateWord = word
+				keptWords.append( word )
+			if len( keptWords ) == len( gcodeLine.splitLine ):
+				return gcodeLine.line
+			return ' '.join( keptWords )
+		if firstWord == 'G1' or firstWord == 'G2' or firstWord == 'G3':
+			for word in gcodeLine.splitLine[ 1 : ]:
+				if word.startswith( 'Z' ):
+					self.zWord = word
+				elif word.startswith( 'F' ):
+					self.feedrateWord = word
+			return gcodeLine.line
+		if firstWord.startswith( 'G' ):
+			self.feedrateWord = None
+			self.zWord = None
+			if firstWord == 'G90':
+				self.isRelative = False
+			elif firstWord == 'G91':
+				self.isRelative = True
+		return gcodeLine.line
+
+
+class ParsedMove( object ):
+	"A compact record of the X, Y, Z and F values of a gcode line, each of which is None if the line does not have it."
+	__slots__ = ( 'feedrateMinute', 'x', 'y', 'z' )
+	def __init__( self, feedrateMinute = None, x = None, y = None, z = None ):
+		"Initialize the parsed move."
+		self.feedrateMinute = feedrateMinute
+		self.x = x
+		self.y = y
+		self.z = z
+
+	def getFeedrateMinute( self, feedrateMinute ):
+		"Get the feedrate per minute of the move, or the old feedrate if the move does not have a feedrate."
+		if self.feedrateMinute == None:
+			return feedrateMinute
+		return self.feedrateMinute
+
+	def getLocation( self, oldLocation ):
+		"Get the location of the move, with the components which are not in the move from the old location."
+		location = Vec3()
+		if oldLocation != None:
+			location.setToVec3( oldLocation )
+		self.setPointComponents( location )
+		return location
+
+	def setPointComponents( self, point ):
+		"Set the components of the point which are in the move."
+		if self.x != None:
+			point.x = self.x
+		if self.y != None:
+			point.y = self.y
+		if self.z != None:
+			point.z = self.z
+
+
+class Toolpath:
+	"""A list of gcode lines, which is passed from one skein to the next so that the skeins do not have to format and parse the whole gcode text.
+
+	The gcode text is made once, by getvalue, after the last skein.  The toolpath is a flat list rather than layers of threads, because
+	each skein already walks the gcode line by line and keeps its own layer and thread state from the skeinforge tags."""
+	def __init__( self ):
+		"Initialize the toolpath."
+		self.gcodeLines = []
+
+	def addGcodeLine( self, gcodeLine ):
+		"Add a gcode line, which is usually from the toolpath of the previous skein."
+		self.gcodeLines.append( gcodeLine )
+
+	def addLine( self, line ):
+		"Add a line of text, which is split into several gcode lines if it has newlines."
+		for textLine in getTextLines( line ):
+			self.gcodeLines.append( GcodeLine( textLine ) )
+
+	def addLinearMove( self, point, feedrateMinute = None ):
+		"Add a linear move, keeping the rounded location and feedrate so that the next skein does not have to parse the line."
+		xString = euclidean.getRoundedToThreePlaces( point.x )
+		yString = euclidean.getRoundedToThreePlaces( point.y )
+		zString = euclidean.getRoundedToThreePlaces( point.z )
+		line = 'G1 X' + xString + ' Y' + yString + ' Z' + zString
+		if feedrateMinute != None:
+			feedrateString = euclidean.getRoundedToThreePlaces( feedrateMinute )
+			line += ' F' + feedrateString
+			feedrateMinute = float( feedrateString )
+		location = Vec3( float( xString ), float( yString ), float( zString ) )
+		self.gcodeLines.append( GcodeLine( line, location, feedrateMinute ) )
+
+	def getvalue( self ):
+		"Get the gcode text of the toolpath, with a newline after each line."
+		if len( self.gcodeLines ) < 1:
+			return ''
+		return '\n'.join( [ gcodeLine.line for gcodeLine in self.gcodeLines ] ) + '\n'
@@ -117,19 +117,24 @@ def getCentersFromOutside( isOutside, loop, radius ):
 def getCircleIntersectionsFromCircleNodes( circleNodes ):
 	"Get all the circle intersections with exist between all the circle nodes."
 	circleIntersections = []
+	circleNodeGrid = CircleNodeGrid().getFromCircleNodes( circleNodes )
 	index = 0
 	for circleNodeIndex in range( len( circleNodes ) ):
 		circleNodeBehind = circleNodes[ circleNodeIndex ]
-		for aheadIndex in range( circleNodeIndex + 1, len( circleNodes ) ):
-			circleNodeAhead = circleNodes[ aheadIndex ]
+		aheads = []
+		for circleNodeAhead in circleNodeGrid.getNeighboringCircleNodes( circleNodeBehind.circle ):
+			if circleNodeAhead.index > circleNodeBehind.index:
+				aheads.append( ( circleNodeAhead.index, circleNodeAhead ) )
+		aheads.sort()
+		for aheadIndex, circleNodeAhead in aheads:
 			if circleNodeBehind.isWithin( circleNodeAhead.circle ):
 				circleIntersectionForward = CircleIntersection().getFromCircleNodes( circleNodeAhead, index, circleNodeBehind )
-				if not circleIntersectionForward.isWithinCircles( circleNodes ):
+				if not circleIntersectionForward.isWithinCircleNodeGrid( circleNodeGrid ):
 					circleIntersections.append( circleIntersectionForward )
 					circleNodeBehind.circleIntersections.append( circleIntersectionForward )
 					index += 1
 				circleIntersectionBackward = CircleIntersection().getFromCircleNodes( circleNodeBehind, index, circleNodeAhead )
-				if not circleIntersectionBackward.isWithinCircles( circleNodes ):
+				if not circleIntersectionBackward.isWithinCircleNodeGrid( circleNodeGrid ):
 					circleIntersections.append( circleIntersectionBackward )
 					circleNodeAhead.circleIntersections.append( circleIntersectionBackward )
 					index += 1
@@ -262,6 +267,10 @@ class CircleIntersection:
 		aheadMinusBehind.add( rotatedClockwiseQuarter )
 		return aheadMinusBehind
 
+	def isWithinCircleNodeGrid( self, circleNodeGrid ):
+		"Determine if the intersection is within any of the circles near it in the circle node grid."
+		return self.isWithinCircles( circleNodeGrid.getNeighboringCircleNodes( self.getAbsolutePosition() ) )
+
 	def isWithinCircles( self, circleNodes ):
 		absolutePosition = self.getAbsolutePosition()
 		radiusSquared = self.circleNodeAhead.radiusSquared
@@ -296,3 +305,43 @@ class CircleNode:
 
 	def isWithin( self, circle ):
 		return self.circle.distance2( circle ) < self.diameterSquared
+
+
+class CircleNodeGrid:
+	"A grid of circle nodes, with cells as wide as the circle diameter, so that only the circle nodes in the cells around a point have to be checked."
+	def __init__( self ):
+		self.cellTable = {}
+		self.cellWidth = 0.0
+
+	def __repr__( self ):
+		"Get the string representation of this CircleNodeGrid."
+		return str( self.cellWidth ) + ' ' + str( self.cellTable )
+
+	def getCellKey( self, point ):
+		"Get the key of the cell which the point is in."
+		if self.cellWidth <= 0.0:
+			return ( 0, 0 )
+		return ( int( math.floor( point.x / self.cellWidth ) ), int( math.floor( point.y / self.cellWidth ) ) )
+
+	def getFromCircleNodes( self, circleNodes ):
+		"Initialize from circle nodes which all have the same radius."
+		if len( circleNodes ) < 1:
+			return self
+		self.cellWidth = 2.0 * circleNodes[ 0 ].radius
+		for circleNode in circleNodes:
+			cellKey = self.getCellKey( circleNode.circle )
+			if cellKey not in self.cellTable:
+				self.cellTable[ cellKey ] = []
+			self.cellTable[ cellKey ].append( circleNode )
+		return self
+
+	def getNeighboringCircleNodes( self, point ):
+		"Get the circle nodes in the cell of the point and in the eight cells around it."
+		cellKey = self.getCellKey( point )
+		neighboringCircleNodes = []
+		for x in xrange( cellKey[ 0 ] - 1, cellKey[ 0 ] + 2 ):
+			for y in xrange( cellKey[ 1 ] - 1, cellKey[ 1 ] + 2 ):
+				neighborKey = ( x, y )
+				if neighborKey in self.cellTable:
+					neighboringCircleNodes += self.cellTable[ neighborKey ]
+		return neighboringCircleNodes
@@ -37,6 +37,8 @@ __date__ = "$Date: 2008/23/04 $"
 __license__ = "GPL 3.0"
 
 
+globalPreferencesFileTable = {}
+
 def displayDialog( displayPreferences ):
 	"Display the preferences dialog."
 	readPreferences( displayPreferences )
@@ -52,6 +54,22 @@ def getArchiveText( preferences ):
 		archiveWriter.write( preference.name + '\t' + preference.getValueString() + '\n' )
 	return archiveWriter.getvalue()
 
+def getPreferencesFile( filename ):
+	"Get the lines and split lines of a preferences file, which are read once and then reused until the modification time or size of the file changes."
+	try:
+		fileStat = os.stat( filename )
+	except OSError:
+		return PreferencesFile().getFromText( gcodec.getFileText( filename ) )
+	fileKey = ( fileStat.st_mtime, fileStat.st_size )
+	if filename in globalPreferencesFileTable:
+		preferencesFile = globalPreferencesFileTable[ filename ]
+		if preferencesFile.fileKey == fileKey:
+			return preferencesFile
+	preferencesFile = PreferencesFile().getFromText( gcodec.getFileText( filename ) )
+	preferencesFile.fileKey = fileKey
+	globalPreferencesFileTable[ filename ] = preferencesFile
+	return preferencesFile
+
 def getPreferencesFilePath( filename, folderName ):
 	"Get the preferences file path, which is the home directory joined with the folder name and filename."
 	homeDirectoryFolder = os.path.join( os.path.expanduser( '~' ), folderName )
@@ -59,18 +77,19 @@ def getPreferencesFilePath( filename, folderName ):
 
 def readPreferences( preferences ):
 	"Set an archive to the preferences read from a file."
-	preferencesText = gcodec.getFileText( preferences.filenamePreferences )
-	lines = gcodec.getTextLines( preferencesText )
+	preferencesFile = getPreferencesFile( preferences.filenamePreferences )
 	preferenceTable = {}
 	for preference in preferences.archive:
 		preferenceTable[ preference.name ] = preference
-	for lineIndex in range( len( lines ) ):
-		setArchiveToLine( lineIndex, lines, preferenceTable )
+	for lineIndex in preferencesFile.splitLineIndexes:
+		setArchiveToSplitLine( lineIndex, preferencesFile.lines, preferenceTable, preferencesFile.splitLines[ lineIndex ] )
 
 def setArchiveToLine( lineIndex, lines, preferenceTable ):
 	"Set an archive to a preference line."
-	line = lines[ lineIndex ]
-	splitLine = line.split( '\t' )
+	setArchiveToSplitLine( lineIndex, lines, preferenceTable, lines[ lineIndex ].split( '\t' ) )
+
+def setArchiveToSplitLine( lineIndex, lines, preferenceTable, splitLine ):
+	"Set an archive to the split line of a preference line."
 	if len( splitLine ) < 2:
 		return
 	filePreferenceName = splitLine[ 0 ]
@@ -79,6 +98,8 @@ def setArchiveToLine( lineIndex, lines, preferenceTable ):
 
 def writePreferences( preferences ):
 	"Write the preferences to a file."
+	if preferences.filenamePreferences in globalPreferencesFileTable:
+		del globalPreferencesFileTable[ preferences.filenamePreferences ]
 	gcodec.writeFileText( preferences.filenamePreferences, getArchiveText( preferences ) )
 
 
@@ -296,6 +317,33 @@ class PreferencesDialog:
 		self.savePreferences()
 		self.master.destroy()
 
+
+class PreferencesFile:
+	"A class to hold the lines of a preferences file, split at the tabs, which are shared by every read of the file so they should not be modified."
+	def __init__( self ):
+		self.fileKey = None
+		self.lines = ()
+		self.splitLineIndexes = ()
+		self.splitLines = ()
+
+	def __repr__( self ):
+		"Get the string representation of this PreferencesFile."
+		return str( self.fileKey ) + ' ' + str( self.lines )
+
+	def getFromText( self, preferencesText ):
+		"Initialize from the text of a preferences file."
+		self.lines = tuple( gcodec.getTextLines( preferencesText ) )
+		splitLineIndexes = []
+		splitLines = []
+		for lineIndex in xrange( len( self.lines ) ):
+			splitLine = tuple( self.lines[ lineIndex ].split( '\t' ) )
+			splitLines.append( splitLine )
+			if len( splitLine ) > 1:
+				splitLineIndexes.append( lineIndex )
+		self.splitLineIndexes = tuple( splitLineIndexes )
+		self.splitLines = tuple( splitLines )
+		return self
+
 """
 class Dialog(Toplevel):
     def __init__(self, parent, title = None):
@@ -210,12 +210,16 @@ class axisClass:
 		self.address = address
 		self.active = False	# when scanning network, set this, then in each func below, check alive before doing anything
 		self.limit = 100000	# limit effectively disabled unless set
+		self.pos = None		# position tracked by the host, None when it is not known and has to be read from the axis
 	#move axis one step forward
 	def forward1(self):
 		if self.active:
 			p = snap.SNAPPacket( serialPort, self.address, snap.localAddress, 0, 1, [CMD_FORWARD1] ) 
 			if p.send():
+				if self.pos != None:
+					self.pos += 1
 				return True
+		self.pos = None
 		return False
 
 	#move axis one step backward
@@ -223,19 +227,24 @@ class axisClass:
 		if self.active:
 			p = snap.SNAPPacket( serialPort, self.address, snap.localAddress, 0, 1, [CMD_BACKWARD1] ) 
 			if p.send():
+				if self.pos != None:
+					self.pos -= 1
 				return True
+		self.pos = None
 		return False
 
-	#spin axis forward at given speed
+	#spin axis forward at given speed. The position is not known after spinning
 	def forward(self, speed):
+		self.pos = None
 		if self.active:
 			p = snap.SNAPPacket( serialPort, self.address, snap.localAddress, 0, 1, [CMD_FORWARD, int(speed)] ) 
 			if p.send():
 				return True
 		return False
 
-	#spin axis backward at given speed
+	#spin axis backward at given speed. The position is not known after spinning
 	def backward(self, speed):
+		self.pos = None
 		if self.active:
 			p = snap.SNAPPacket( serialPort, self.address, snap.localAddress, 0, 1, [CMD_REVERSE, int(speed)] ) 
 			if p.send():
@@ -253,7 +262,7 @@ class axisClass:
 					print data[1], data[2]
 		return False
 
-	#get current axis position
+	#get current axis position, asking the axis. This also resynchronises the tracked position
 	def getPos(self):
 		if self.active:
 			p = snap.SNAPPacket( serialPort, self.address, snap.localAddress, 0, 1, [CMD_GETPOS] )
@@ -262,20 +271,31 @@ class axisClass:
 				data = checkReplyPacket( rep, 3, CMD_GETPOS )
 				if data:
 					pos = bytes2int( data[1], data[2] )
+					self.pos = pos
 					return pos 						# return value
+		self.pos = None
 		return False
 
+	#get the position tracked by the host, asking the axis only when the position is not known
+	def getTrackedPos(self):
+		if self.pos == None:
+			return self.getPos()
+		return self.pos
+
 	#set current position (set variable not robot position)
 	def setPos(self, pos):
 		if self.active:
 			posMSB ,posLSB = int2bytes( pos )
 			p = snap.SNAPPacket( serialPort, self.address, snap.localAddress, 0, 1, [CMD_SETPOS, posMSB, posLSB] )
 			if p.send():
+				self.pos = pos
 				return True
+		self.pos = None
 		return False
 
-	#power off coils on stepper
+	#power off coils on stepper. The axis can then be moved by hand, so the position is not known
 	def free(self):
+		self.pos = None
 		if self.active:
 			p = snap.SNAPPacket( serialPort, self.address, snap.localAddress, 0, 1, [CMD_FREE] ) 
 			if p.send():
@@ -294,9 +314,12 @@ class axisClass:
 					if notif.dataBytes[0] == CMD_SEEK:
 						if printDebug: print >> sys.stderr, "    valid notification for seek"
 					else:
+						self.pos = None
 						return False
 					if printDebug: print >> sys.stderr, "    rec notif"
+				self.pos = pos
 				return True
+		self.pos = None
 		return False
 	
 	#goto 0 position. When waitArrival is True, funtion does not return until reset is compete
@@ -310,9 +333,12 @@ class axisClass:
 					if notif.dataBytes[0] == CMD_HOMERESET:
 						if printDebug: print >> sys.stderr, "    valid notification for reset"
 					else:
+						self.pos = None
 						return False
 					if printDebug: print >> sys.stderr, "reset done"
+				self.pos = 0
 				return True
+		self.pos = None
 		return False
 
 	def setNotify(self):
@@ -341,8 +367,11 @@ class axisClass:
 					if notif.dataBytes[0] == CMD_DDA:
 						if printDebug: print >> sys.stderr, "    valid notification for DDA"	# todo: add actual enforement on wrong notification
 					else:
+						self.pos = None
 						return False
+				self.pos = seekTo
 				return True
+		self.pos = None
 		return False
 	
 	def setPower( self, power ):
@@ -380,12 +409,15 @@ class cartesianClass:
 			print >> sys.stderr, "Y Reset"
 		if self.z.homeReset( speed, waitArrival ):
 			print >> sys.stderr, "Z Reset"
+		if waitArrival:
+			self.resyncPos()		# homing is the one move after which the host always asks the axies where they are
 		# add a way to collect all three notifications (in whatever order) then check they are all there. this will allow symultanious axis movement and use of waitArrival
 
 	# seek to location (all axies). When waitArrival is True, funtion does not return until all seeks are compete
 	# seek will automatically use syncSeek when it is required. Always use the seek function
+	# the current location is the one tracked by the host, so the axies are only asked where they are when it is not known
 	def seek(self, pos, speed, waitArrival = True):
-		curX, curY, curZ = self.x.getPos(), self.y.getPos(), self.z.getPos()
+		curX, curY, curZ = self.x.getTrackedPos(), self.y.getTrackedPos(), self.z.getTrackedPos()
 		x, y, z = pos
 		if x <= self.x.limit and y <= self.y.limit and z <= self.z.limit:
 			if printDebug: print >> sys.stderr, "seek from [", curX, curY, curZ, "] to [", x, y, z, "]"
@@ -403,7 +435,7 @@ class cartesianClass:
 	
 	# perform syncronised x/y movement. This is called by seek when needed.
 	def syncSeek(self, pos, speed, waitArrival = True):
-		curX, curY = self.x.getPos(), self.y.getPos()
+		curX, curY = self.x.getTrackedPos(), self.y.getTrackedPos()
 		newX, newY, nullZ = pos
 		deltaX = abs( curX - newX )		# calc delta movements
 		deltaY = abs( curY - newY )
@@ -420,7 +452,10 @@ class cartesianClass:
 			if printDebug: print >> sys.stderr, "    switching to y master"
 		if printDebug: print >> sys.stderr, "    masterPos", master.seekTo, "slaveDelta", slave.delta
 		slave.axis.setSync( slave.syncMode )
-		master.axis.DDA( speed, master.seekTo, slave.delta, True )
+		if master.axis.DDA( speed, master.seekTo, slave.delta, True ):
+			slave.axis.pos = slave.seekTo		# the slave moved with the master, so it is where it was synced to
+		else:
+			slave.axis.pos = None
 		time.sleep(0.1)
 		slave.axis.setSync( sync_none )
 		if printDebug: print >> sys.stderr, "    sync seek complete"
@@ -428,8 +463,12 @@ class cartesianClass:
 	# get current position of all three axies	
 	def getPos(self):
 		return self.x.getPos(), self.y.getPos(), self.z.getPos()
+
+	# ask all three axies where they are and track those positions from now on. Use this on demand, when the tracked position might be wrong
+	def resyncPos(self):
+		return self.getPos()
 	
-	# stop all motors
+	# stop all motors. The positions are not known after the motors were spinning
 	def stop(self):
 		self.x.forward( 0 )
 		self.y.forward( 0 )
@@ -14,8 +14,11 @@ the algorithm that spans gaps.  If the Mesh Type preference is Unproven, slice w
 problem with the gap spanning algothm is that it will span gaps, even if there actually is a gap in the model.  If the import tiny details
 preference is chosen, slice will import tiny details, even if they are thinner than the extrusion width, otherwise it won't.  Infill bridge width
 over thickness ratio is the ratio of the extrusion width over the layer thickness on a bridge layer.  If the infill in direction of bridges
-preference is chosen, the infill will be in the direction of bridges across gaps, so that the fill will be able to span a bridge easier.  To run
-slice, in a shell type:
+preference is chosen, the infill will be in the direction of bridges across gaps, so that the fill will be able to span a bridge easier.  The
+slice processes preference is the number of processes which slice the layers in parallel, if it is more than one and the multiprocessing
+module is available.  The sliced gcode is the same whatever the number of slice processes.  When all the files in a directory are sliced,
+the directory processes preference is the number of files which are sliced in parallel, and a file which fails does not stop the others.
+To run slice, in a shell type:
 > python slice.py
 
 To run slice, install python 2.x on your machine, which is avaliable from http://www.python.org/download/
@@ -31,6 +34,9 @@ To bring it into Art of Illusion, drop it into the folder ArtOfIllusion/Scripts/
 The GNU Triangulated Surface format is supported by Mesh Viewer, and it is described at:
 http://gts.sourceforge.net/reference/gts-surfaces.html#GTS-SURFACE-WRITE
 
+Slice can also read a binary or ASCII STL file directly.  The corners of the triangles in the STL file which are within a thousandth of the
+extrusion diameter of each other are welded into one vertex, and the triangles which share two vertices share an edge.
+
 To turn an STL file into sliced gcode, first import the file using the STL import plugin in the import submenu of the file menu of Art of Illusion.
 Then from the Scripts submenu in the Tools menu, choose 'Export GNU Triangulated Surface' and select the imported STL shape.  Click the
 'Export Selected' checkbox and click OK.  Then type 'python slice.py' in a shell in the folder which slice is in and when the dialog pops up, set
@@ -96,15 +102,22 @@ except:
 	pass
 from vec3 import Vec3
 import cmath
-import cStringIO
 import euclidean
+import gc
 import gcodec
 import intercircle
 import math
 import os
 import preferences
+import re
+import struct
+import sys
 import time
 import vectorwrite
+try:
+	import multiprocessing
+except:
+	multiprocessing = None
 
 
 __author__ = "Enrique Perez (perez_enrique@yahoo.com)"
@@ -144,9 +157,12 @@ def getDoubledRoundZ( overhangingSegment, segmentRoundZ ):
 	roundZLength = abs( roundZ )
 	return roundZ * roundZ / roundZLength
 
-def getLoopsFromCorrectMesh( edges, faces, vertices, z ):
+def getLoopsExtrudateLoops( z ):
+	"Get the loops and the extrudate loops of the layer around z, this is called in a slice process."
+	return globalSliceSkein.getLoopsExtrudateLoops( z )
+
+def getLoopsFromCorrectMesh( edges, faces, remainingEdgeTable, vertices, z ):
 	"Get loops from a slice of a correct mesh."
-	remainingEdgeTable = getRemainingEdgeTable( edges, vertices, z )
 	remainingValues = remainingEdgeTable.values()
 	for edge in remainingValues:
 		if edge.faceIndexFirst == None:
@@ -169,13 +185,11 @@ def getLoopsFromCorrectMesh( edges, faces, vertices, z ):
 		pathIndexes = getPathIndexesAddPath( edges, faces, loops, remainingEdgeTable, vertices, z )
 	return loops
 
-def getLoopsFromUnprovenMesh( edges, extrusionWidth, faces, vertices, slicePreferences, z ):
+def getLoopsFromUnprovenMesh( edges, extrusionWidth, faces, remainingEdgeTable, vertices, slicePreferences, z ):
 	"Get loops from a slice of an unproven mesh."
 	edgePairTable = {}
 	importRadius = slicePreferences.importCoarseness.value * extrusionWidth
 	points = []
-	remainingEdgeTable = getRemainingEdgeTable( edges, vertices, z )
-	remainingEdgeTableKeys = remainingEdgeTable.keys()
 	for remainingEdgeIndexKey in remainingEdgeTable:
 		edge = remainingEdgeTable[ remainingEdgeIndexKey ]
 		sliceIntersection = getSliceIntersectionFromEdge( edge, vertices, z )
@@ -197,17 +211,6 @@ def getLoopsFromUnprovenMesh( edges, extrusionWidth, faces, vertices, slicePrefe
 	centers = intercircle.getCentersFromCircleNodes( circleNodes )
 	return intercircle.getLoopsFromLoopsDirection( slicePreferences.importTinyDetails.value, centers )
 
-def getLowestZoneIndex( zoneArray, z ):
-	"Get the lowest zone index."
-	lowestZoneIndex = 0
-	lowestZone = 99999999.0
-	for zoneIndex in range( len( zoneArray ) ):
-		zone = zoneArray[ zoneIndex ]
-		if zone < lowestZone:
-			lowestZone = zone
-			lowestZoneIndex = zoneIndex
-	return lowestZoneIndex
-
 def getNextEdgeIndexAroundZ( edge, faces, remainingEdgeTable ):
 	"Get the next edge index in the mesh slice."
 	if edge.faceIndexFirst != None:
@@ -228,8 +231,26 @@ def getNextEdgeIndexAroundZ( edge, faces, remainingEdgeTable ):
 			return secondFace.edgeIndexThird
 	return - 1
 
-def getOverhangDirection( belowOutsetLoops, segmentBegin, segmentEnd ):
+def getNumbersFromLines( lines, numberFunction, numberOfWords ):
+	"""Get the numbers of the first words of the lines, converting the words of all the lines at once if every line has only those words.
+
+	Keyword arguments:
+	lines -- lines of space separated words
+	numberFunction -- function which converts a word to a number, for example float
+	numberOfWords -- number of words which are used from each line"""
+	words = ' '.join( lines ).split( ' ' )
+	if len( words ) != numberOfWords * len( lines ):
+		words = []
+		for line in lines:
+			splitLine = line.split( ' ', numberOfWords )
+			if len( splitLine ) < numberOfWords:
+				raise IndexError( 'The line ' + line + ' has fewer than ' + str( numberOfWords ) + ' words.' )
+			words += splitLine[ : numberOfWords ]
+	return map( numberFunction, words )
+
+def getOverhangDirection( belowOutsetBoundingLoops, outset, segmentBegin, segmentEnd ):
 	"Add to span direction from the endpoint segments which overhang the layer below."
+	belowOutsetLoops = euclidean.getOverlappingLoops( belowOutsetBoundingLoops, segmentBegin, segmentEnd, outset )
 	segment = segmentEnd.minus( segmentBegin )
 	normalizedSegment = complex( segment.x, segment.y )
 	normalizedSegment /= abs( normalizedSegment )
@@ -280,10 +301,12 @@ def getPathIndexesAddPath( edges, faces, loops, remainingEdgeTable, vertices, z
 	loops.append( getPath( edges, pathIndexes, vertices, z ) )
 	return pathIndexes
 
-def getRemainingEdgeTable( edges, vertices, z ):
-	"Get the remaining edge hashtable."
+def getRemainingEdgeTable( edges, vertices, z, edgeIndexes = None ):
+	"Get the remaining edge hashtable, checking only the edge indexes if they are given."
 	remainingEdgeTable = {}
-	for edgeIndex in range( len( edges ) ):
+	if edgeIndexes == None:
+		edgeIndexes = xrange( len( edges ) )
+	for edgeIndex in edgeIndexes:
 		edge = edges[ edgeIndex ]
 		if isZInEdge( edge, vertices, z ):
 			remainingEdgeTable[ edgeIndex ] = edge
@@ -297,16 +320,30 @@ def getSharedFace( firstEdge, faces, secondEdge ):
 		return faces[ firstEdge.faceIndexSecond ]
 	return None
 
+def getSTLCoordinates( stlText ):
+	"Get the x, y and z coordinates of each corner of each triangle of a binary or ASCII STL text, in one list."
+	if isSTLBinary( stlText ):
+		if len( stlText ) < 84:
+			raise ValueError( 'The binary STL text is truncated, it has ' + str( len( stlText ) ) + ' bytes, which is less than its 84 byte header.' )
+		numberOfTriangles = struct.unpack( '<I', stlText[ 80 : 84 ] )[ 0 ]
+		if len( stlText ) < 84 + 50 * numberOfTriangles:
+			message = 'The binary STL text is truncated, it has ' + str( len( stlText ) ) + ' bytes, but its ' + str( numberOfTriangles )
+			raise ValueError( message + ' triangles need ' + str( 84 + 50 * numberOfTriangles ) + ' bytes.' )
+		if numberOfTriangles == 0:
+			raise ValueError( 'The binary STL text has no triangles.' )
+		return list( struct.unpack( '<' + '12x9f2x' * numberOfTriangles, stlText[ 84 : 84 + 50 * numberOfTriangles ] ) )
+	words = stlText.split()
+	coordinateWords = []
+	for wordIndex in xrange( len( words ) - 3 ):
+		if words[ wordIndex ] == 'vertex':
+			coordinateWords += words[ wordIndex + 1 : wordIndex + 4 ]
+	if len( coordinateWords ) < 9:
+		raise ValueError( 'The ASCII STL text has no triangles, it has ' + str( len( coordinateWords ) / 3 ) + ' vertices.' )
+	return map( float, coordinateWords )
+
 def getSliceGcode( gnuTriangulatedSurfaceText, slicePreferences = None ):
 	"Slice a GNU Triangulated Surface text."
-	if gnuTriangulatedSurfaceText == '':
-		return ''
-	if slicePreferences == None:
-		slicePreferences = SlicePreferences()
-		preferences.readPreferences( slicePreferences )
-	skein = SliceSkein()
-	skein.parseGcode( slicePreferences, gnuTriangulatedSurfaceText )
-	return skein.output.getvalue()
+	return getSliceToolpath( gnuTriangulatedSurfaceText, slicePreferences ).getvalue()
 
 def getSliceIntersectionFromEdge( edge, loop, z ):
 	"Get the point where the slice intersects the edge."
@@ -319,12 +356,52 @@ def getSliceIntersectionFromEdge( edge, loop, z ):
 	sliceIntersection.add( firstVertex )
 	return sliceIntersection
 
+def getSliceToolpath( gnuTriangulatedSurfaceText, slicePreferences = None ):
+	"Slice a GNU Triangulated Surface text into a toolpath."
+	if gnuTriangulatedSurfaceText == '':
+		return gcodec.Toolpath()
+	if slicePreferences == None:
+		slicePreferences = SlicePreferences()
+		preferences.readPreferences( slicePreferences )
+	skein = SliceSkein()
+	skein.parseGcode( slicePreferences, gnuTriangulatedSurfaceText )
+	return skein.output
+
+def isGNUTriangulatedSurfaceText( text ):
+	"Determine if the text is from a GNU Triangulated Surface file, whose first line which is not a comment starts with the numbers of vertices, edges and faces."
+	for lineMatch in re.finditer( '[^\r\n]+', text ):
+		line = lineMatch.group()
+		if line[ : 1 ] not in '#!':
+			splitLine = line.split( ' ' )
+			return len( splitLine ) > 2 and splitLine[ 0 ].isdigit() and splitLine[ 1 ].isdigit() and splitLine[ 2 ].isdigit()
+	return False
+
+def isSTLBinary( stlText ):
+	"""Determine if the STL text is binary.
+
+	It is binary unless it starts with solid, has no null byte in the first 84 bytes, where the triangle count of a binary STL is,
+	and has a facet or endsolid keyword, so a short binary file whose header starts with solid is not read as ASCII."""
+	if stlText.lstrip()[ : 5 ] != 'solid' or '\0' in stlText[ : 84 ]:
+		return True
+	return stlText.find( 'facet' ) == - 1 and stlText.find( 'endsolid' ) == - 1
+
+def isSTLText( text ):
+	"Determine if the text is from an STL file, which it is if it starts with solid or if it does not start like a GNU Triangulated Surface file."
+	if text.lstrip()[ : 5 ] == 'solid':
+		return True
+	return not isGNUTriangulatedSurfaceText( text )
+
 def isZInEdge( edge, vertices, z ):
 	"Determine if z is inside the edge."
 	vertex1ZHigher = vertices[ edge.vertexIndexFirst ].z > z
 	vertex2ZHigher = vertices[ edge.vertexIndexSecond ].z > z
 	return vertex1ZHigher != vertex2ZHigher
 
+def setGlobalSliceSkein( sliceSkein ):
+	"Set the slice skein which the slice process gets the layer loops from."
+	global globalSliceSkein
+	globalSliceSkein = sliceSkein
+
 def sliceFile( filename = '' ):
 	"Slice a GNU Triangulated Surface file.  If no filename is specified, slice the first GNU Triangulated Surface file in this folder."
 	if filename == '':
@@ -337,18 +414,19 @@ def sliceFile( filename = '' ):
 	slicePreferences = SlicePreferences()
 	preferences.readPreferences( slicePreferences )
 	print >> sys.stderr, ( 'File ' + gcodec.getSummarizedFilename( filename ) + ' is being sliced.' )
-	gnuTriangulatedSurfaceText = gcodec.getFileText( filename )
+	gnuTriangulatedSurfaceText = gcodec.getFileText( filename, gcodec.getReadMode( filename ) )
 	if gnuTriangulatedSurfaceText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_slice.gcode'
-	gcodec.writeFileText( suffixFilename, getSliceGcode( gnuTriangulatedSurfaceText, slicePreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getSliceToolpath( gnuTriangulatedSurfaceText, slicePreferences ) )
 	print >> sys.stderr, ( 'The sliced file is saved as ' + gcodec.getSummarizedFilename( suffixFilename ) )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 	print >> sys.stderr, ( 'It took ' + str( int( round( time.time() - startTime ) ) ) + ' seconds to slice the file.' )
 
 
-class Edge:
+class Edge( object ):
 	"An edge of a triangle mesh."
+	__slots__ = ( 'faceIndexFirst', 'faceIndexSecond', 'index', 'vertexIndexFirst', 'vertexIndexSecond' )
 	def __init__( self ):
 		"Set the face indexes to None."
 		self.faceIndexFirst = None
@@ -358,6 +436,14 @@ class Edge:
 		"Get the string representation of this Edge."
 		return str( self.index ) + ' ' + str( self.faceIndexFirst ) + ' ' + str( self.faceIndexSecond ) + ' ' + str( self.vertexIndexFirst ) + ' ' + str( self.vertexIndexSecond )
 
+	def __getstate__( self ):
+		"Get the state of this Edge for pickling, because a class with slots has no __dict__."
+		return ( self.faceIndexFirst, self.faceIndexSecond, self.index, self.vertexIndexFirst, self.vertexIndexSecond )
+
+	def __setstate__( self, state ):
+		"Set the state of this Edge from pickling."
+		self.faceIndexFirst, self.faceIndexSecond, self.index, self.vertexIndexFirst, self.vertexIndexSecond = state
+
 	def addFaceIndex( self, faceIndex ):
 		"Add first None face index to input face index."
 		if self.faceIndexFirst == None:
@@ -403,8 +489,9 @@ class EdgePair:
 		return self
 
 
-class Face:
+class Face( object ):
 	"A face of a triangle mesh."
+	__slots__ = ( 'edgeIndexFirst', 'edgeIndexSecond', 'edgeIndexThird', 'index', 'vertexIndexFirst', 'vertexIndexSecond', 'vertexIndexThird' )
 	def __init__( self ):
 		"Set the edge indexes to None."
 		self.edgeIndexFirst = None
@@ -416,6 +503,14 @@ class Face:
 		representation = str( self.index ) + ' ' + str( self.edgeIndexFirst ) + ' ' + str( self.edgeIndexSecond ) + ' ' + str( self.edgeIndexThird )
 		return representation + ' ' + str( self.vertexIndexFirst ) + ' ' + str( self.vertexIndexSecond ) + ' ' + str( self.vertexIndexThird )
 
+	def __getstate__( self ):
+		"Get the state of this Face for pickling, because a class with slots has no __dict__."
+		return ( self.edgeIndexFirst, self.edgeIndexSecond, self.edgeIndexThird, self.index, self.vertexIndexFirst, self.vertexIndexSecond, self.vertexIndexThird )
+
+	def __setstate__( self, state ):
+		"Set the state of this Face from pickling."
+		self.edgeIndexFirst, self.edgeIndexSecond, self.edgeIndexThird, self.index, self.vertexIndexFirst, self.vertexIndexSecond, self.vertexIndexThird = state
+
 	def getFromEdgeIndices( self, edges, faceIndex, edgeIndexFirst, edgeIndexSecond, edgeIndexThird ):
 		"Initialize from edge indices."
 		self.index = faceIndex
@@ -438,7 +533,31 @@ class SliceSkein:
 	"A class to slice a GNU Triangulated Surface."
 	def __init__( self ):
 		self.belowLoops = None
-		self.output = cStringIO.StringIO()
+		self.output = gcodec.Toolpath()
+
+	def addExtruderPathsByProcesses( self, z ):
+		"""Add the extruder paths, with the loops of the layers sliced in parallel by a pool of slice processes.
+
+		The layer heights are guessed by assuming that the layers are not bridge layers.  After a bridge layer the heights change, so the
+		remaining guesses are thrown away and the next batch of layers is guessed from the new height."""
+		numberOfProcesses = self.slicePreferences.sliceProcesses.value
+		pool = multiprocessing.Pool( numberOfProcesses, setGlobalSliceSkein, ( self, ) )
+		batchLength = 4 * numberOfProcesses
+		try:
+			while z < self.layerTop:
+				guessedZs = []
+				guessedZ = z
+				while guessedZ < self.layerTop and len( guessedZs ) < batchLength:
+					guessedZs.append( guessedZ )
+					guessedZ += self.layerThickness
+				loopsExtrudateLoopsList = pool.map( getLoopsExtrudateLoops, guessedZs )
+				for guessedIndex in xrange( len( guessedZs ) ):
+					if guessedZs[ guessedIndex ] != z:
+						break
+					z = self.getZAddExtruderPaths( z, loopsExtrudateLoopsList[ guessedIndex ] )
+		finally:
+			pool.terminate()
+			pool.join()
 
 	def addFromFile( self, filename ):
 		"Add lines of text from the filename."
@@ -458,7 +577,7 @@ class SliceSkein:
 
 	def addGcodeMovement( self, point ):
 		"Add a movement to the output."
-		self.addLine( "G1 X%s Y%s Z%s" % ( euclidean.getRoundedToThreePlaces( point.x ), euclidean.getRoundedToThreePlaces( point.y ), euclidean.getRoundedToThreePlaces( point.z ) ) )
+		self.output.addLinearMove( point )
 
 	def addGcodeFromThread( self, thread ):
 		"Add a thread to the output."
@@ -504,7 +623,7 @@ class SliceSkein:
 
 	def addLine( self, line ):
 		"Add a line of text and a newline to the output."
-		self.output.write( line + "\n" )
+		self.output.addLine( line )
 
 	def addShutdownToOutput( self ):
 		"Add shutdown gcode to the output."
@@ -514,15 +633,6 @@ class SliceSkein:
 #		self.addLine( 'M30' ) # End gcode program.
 		self.addFromUpperLowerFile( 'End.txt' ) # Add an end file if it exists.
 
-	def addToZoneArray( self, point, zoneArray, z ):
-		"Add a height to the zone array."
-		zoneLayer = int( round( ( point.z - z ) / self.zZoneInterval ) )
-		zoneAround = 2 * int( abs( zoneLayer ) )
-		if zoneLayer < 0:
-			zoneAround -= 1
-		if zoneAround < len( zoneArray ):
-			zoneArray[ zoneAround ] += 1
-
 	def getBridgeDirection( self, layerLoops ):
 		"Get span direction for the majority of the overhanging extrusion perimeter, if any."
 		if not self.slicePreferences.infillDirectionBridge.value:
@@ -540,25 +650,52 @@ class SliceSkein:
 				if euclidean.isWiddershins( center ) == euclidean.isWiddershins( outset ):
 					if euclidean.getMaximumSpan( outset ) > self.extrusionWidth:
 						belowOutsetLoops.append( outset )
+		belowOutsetBoundingLoops = []
+		for belowOutsetLoop in belowOutsetLoops:
+			belowOutsetBoundingLoops.append( euclidean.BoundingLoop().getFromLoop( belowOutsetLoop ) )
 		bridgeDirection = complex()
+		outset = 0.01 * self.extrusionWidth
 		for loop in layerLoops:
 			for pointIndex in range( len( loop ) ):
 				previousIndex = ( pointIndex + len( loop ) - 1 ) % len( loop )
-				bridgeDirection += getOverhangDirection( belowOutsetLoops, loop[ previousIndex ], loop[ pointIndex ] )
+				bridgeDirection += getOverhangDirection( belowOutsetBoundingLoops, outset, loop[ previousIndex ], loop[ pointIndex ] )
 		if abs( bridgeDirection ) < self.halfExtrusionWidth:
 			return None
 		else:
 			bridgeDirection /= abs( bridgeDirection )
 			return cmath.sqrt( bridgeDirection )
 
+	def getExtrudateLoops( self, halfWidth, loops ):
+		"Get the extrudate loops inset by the half width from the loops."
+		doubleExtrusionWidth = 2.0 * self.extrusionWidth
+		extrudateLoops = []
+		for loop in loops:
+			circleNodes = intercircle.getCircleNodesFromLoop( loop, self.extrusionWidth )
+			centers = intercircle.getCentersFromCircleNodes( circleNodes )
+			for center in centers:
+				extrudateLoop = intercircle.getInsetFromClockwiseLoop( center, halfWidth )
+				if euclidean.isWiddershins( extrudateLoop ) == euclidean.isWiddershins( center ):
+					if euclidean.getMaximumSpan( extrudateLoop ) > doubleExtrusionWidth:
+						if euclidean.isPathInsideLoop( loop, extrudateLoop ) == euclidean.isWiddershins( loop ):
+							extrudateLoops.append( extrudateLoop )
+		return extrudateLoops
+
+	def getLoopsExtrudateLoops( self, z ):
+		"Get the loops around z and the extrudate loops of the layer, assuming that the layer is not a bridge layer."
+		loops = self.getLoopsFromMesh( z )
+		return ( loops, self.getExtrudateLoops( self.halfExtrusionWidth, loops ) )
+
 	def getLoopsFromMesh( self, z ):
 		"Get loops from a slice of a mesh."
 		loops = []
 		originalLoops = []
+		triangleMesh = self.triangleMesh
 		if self.slicePreferences.correct.value:
-			originalLoops = getLoopsFromCorrectMesh( self.triangleMesh.edges, self.triangleMesh.faces, self.triangleMesh.vertices, z )
+			remainingEdgeTable = triangleMesh.getRemainingEdgeTable( z )
+			originalLoops = getLoopsFromCorrectMesh( triangleMesh.edges, triangleMesh.faces, remainingEdgeTable, triangleMesh.vertices, z )
 		if len( originalLoops ) < 1:
-			originalLoops = getLoopsFromUnprovenMesh( self.triangleMesh.edges, self.extrusionWidth, self.triangleMesh.faces, self.triangleMesh.vertices, self.slicePreferences, z )
+			remainingEdgeTable = triangleMesh.getRemainingEdgeTable( z )
+			originalLoops = getLoopsFromUnprovenMesh( triangleMesh.edges, self.extrusionWidth, triangleMesh.faces, remainingEdgeTable, triangleMesh.vertices, self.slicePreferences, z )
 		for original in originalLoops:
 			loops.append( euclidean.getSimplifiedLoop( original, self.extrusionWidth ) )
 		for pathIndex in range( len( loops ) ):
@@ -573,35 +710,23 @@ class SliceSkein:
 				loop.reverse()
 		return loops
 
-	def getZAddExtruderPaths( self, z ):
-		"Get next z and add extruder loops."
-		zoneArray = []
-		for point in self.triangleMesh.vertices:
-			self.addToZoneArray( point, zoneArray, z )
-		lowestZoneIndex = getLowestZoneIndex( zoneArray, z )
-		halfAround = int( math.ceil( float( lowestZoneIndex ) / 2.0 ) )
-		zAround = float( halfAround ) * self.zZoneInterval
-		if lowestZoneIndex % 2 == 1:
-			zAround = - zAround
-		loops = self.getLoopsFromMesh( z + zAround )
-		centers = []
-		doubleExtrusionWidth = 2.0 * self.extrusionWidth
-		extruderPaths = []
+	def getZAddExtruderPaths( self, z, loopsExtrudateLoops = None ):
+		"""Get next z and add extruder loops.
+
+		Keyword arguments:
+		z -- height of the layer
+		loopsExtrudateLoops -- loops and extrudate loops of the layer from a slice process, or None if they have not been computed"""
+		extrudateLoops = None
+		if loopsExtrudateLoops == None:
+			loops = self.getLoopsFromMesh( z )
+		else:
+			loops, extrudateLoops = loopsExtrudateLoops
 		bridgeDirection = self.getBridgeDirection( loops )
 		self.belowLoops = loops
-		halfWidth = self.halfExtrusionWidth
 		if bridgeDirection != None:
-			halfWidth = 0.5 * self.bridgeExtrusionWidth
-		extrudateLoops = []
-		for loop in loops:
-			circleNodes = intercircle.getCircleNodesFromLoop( loop, self.extrusionWidth )
-			centers = intercircle.getCentersFromCircleNodes( circleNodes )
-			for center in centers:
-				extrudateLoop = intercircle.getInsetFromClockwiseLoop( center, halfWidth )
-				if euclidean.isWiddershins( extrudateLoop ) == euclidean.isWiddershins( center ):
-					if euclidean.getMaximumSpan( extrudateLoop ) > doubleExtrusionWidth:
-						if euclidean.isPathInsideLoop( loop, extrudateLoop ) == euclidean.isWiddershins( loop ):
-							extrudateLoops.append( extrudateLoop )
+			extrudateLoops = self.getExtrudateLoops( 0.5 * self.bridgeExtrusionWidth, loops )
+		elif extrudateLoops == None:
+			extrudateLoops = self.getExtrudateLoops( self.halfExtrusionWidth, loops )
 		self.addLine( '(<layerStart> ' + str( z ) + ' )' ) # Indicate that a new layer is starting.
 		if bridgeDirection != None:
 			self.addLine( '(<bridgeDirection> ' + str( bridgeDirection ) + ' )' ) # Indicate the bridge direction.
@@ -618,7 +743,11 @@ class SliceSkein:
 	def parseGcode( self, slicePreferences, gnuTriangulatedSurfaceText ):
 		"Parse gnu triangulated surface text and store the sliced gcode."
 		self.slicePreferences = slicePreferences
-		self.triangleMesh = TriangleMesh().getFromGNUTriangulatedSurfaceText( gnuTriangulatedSurfaceText )
+		if isSTLText( gnuTriangulatedSurfaceText ):
+			weldDistance = 0.001 * slicePreferences.extrusionDiameter.value
+			self.triangleMesh = TriangleMesh().getFromSTLText( gnuTriangulatedSurfaceText, weldDistance )
+		else:
+			self.triangleMesh = TriangleMesh().getFromGNUTriangulatedSurfaceText( gnuTriangulatedSurfaceText )
 		self.extrusionDiameter = slicePreferences.extrusionDiameter.value
 		squareSectionWidth = self.extrusionDiameter * math.sqrt( math.pi / slicePreferences.extrusionFillDensity.value ) / 2.0
 		bridgeWidthOverThicknessSquareRoot = math.sqrt( slicePreferences.infillBridgeWidthOverThickness.value )
@@ -629,8 +758,7 @@ class SliceSkein:
 		self.bridgeLayerThickness = squareSectionWidth / bridgeWidthOverThicknessSquareRoot
 		self.layerThickness = squareSectionWidth / extrusionWidthOverThicknessSquareRoot
 		self.halfThickness = 0.5 * self.layerThickness
-		self.zZoneLayers = 99
-		self.zZoneInterval = self.layerThickness / self.zZoneLayers / 100.0
+		self.triangleMesh.setZoneEdgeIndexes( self.layerThickness )
 		self.bottom = 999999999.0
 		self.top = - self.bottom
 		for point in self.triangleMesh.vertices:
@@ -640,8 +768,11 @@ class SliceSkein:
 		self.layerTop = self.top - self.halfThickness * 0.5
 		self.addInitializationToOutput()
 		z = self.layerBottom
-		while z < self.layerTop:
-			z = self.getZAddExtruderPaths( z )
+		if multiprocessing != None and slicePreferences.sliceProcesses.value > 1 and not multiprocessing.current_process().daemon:
+			self.addExtruderPathsByProcesses( z )
+		else:
+			while z < self.layerTop:
+				z = self.getZAddExtruderPaths( z )
 		self.addShutdownToOutput()
 
 
@@ -653,7 +784,7 @@ class SlicePreferences:
 		self.extrusionDiameter = preferences.FloatPreference().getFromValue( 'Extrusion Diameter (mm):', 0.6 )
 		self.extrusionFillDensity = preferences.FloatPreference().getFromValue( 'Extrusion Density (ratio):', 0.82 )
 		self.extrusionWidthOverThickness = preferences.FloatPreference().getFromValue( 'Extrusion Width Over Thickness (ratio):', 1.5 )
-		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface files', '*.gts' ) ], 'Open File to be Sliced', '' )
+		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface files', '*.gts' ), ( 'STL files', '*.stl' ) ], 'Open File to be Sliced', '' )
 		self.importCoarseness = preferences.FloatPreference().getFromValue( 'Import Coarseness (ratio):', 1.0 )
 		importRadio = []
 		self.correct = preferences.RadioLabel().getFromRadioLabel( 'Correct Mesh', 'Mesh Type:', importRadio, True )
@@ -661,6 +792,8 @@ class SlicePreferences:
 		self.importTinyDetails = preferences.BooleanPreference().getFromValue( 'Import Tiny Details:', True )
 		self.infillBridgeWidthOverThickness = preferences.FloatPreference().getFromValue( 'Infill Bridge Width Over Thickness (ratio):', 1.0 )
 		self.infillDirectionBridge = preferences.BooleanPreference().getFromValue( 'Infill in Direction of Bridges', True )
+		self.sliceProcesses = preferences.IntPreference().getFromValue( 'Slice Processes (count):', 1 )
+		self.directoryProcesses = preferences.IntPreference().getFromValue( 'Directory Processes (count):', 1 )
 		directoryRadio = []
 		self.directoryPreference = preferences.RadioLabel().getFromRadioLabel( 'Slice All GNU Triangulated Surface Files in a Directory', 'File or Directory:', directoryRadio, False )
 		self.filePreference = preferences.Radio().getFromRadio( 'Slice File', directoryRadio, True )
@@ -676,8 +809,12 @@ class SlicePreferences:
 			self.importTinyDetails,
 			self.infillBridgeWidthOverThickness,
 			self.infillDirectionBridge,
+			self.sliceProcesses,
+			self.directoryProcesses,
 			self.directoryPreference,
 			self.filePreference ]
+		#The preferences which do not change the toolpath are left out of the cache key.
+		self.nonOutputArchive = [ self.sliceProcesses, self.directoryProcesses, self.directoryPreference, self.filePreference, self.filenameInput ]
 		self.executeTitle = 'Slice'
 #		self.filename = getPreferencesFilePath( 'slice.csv' )
 		self.filenamePreferences = 'slice.csv'
@@ -687,8 +824,7 @@ class SlicePreferences:
 	def execute( self ):
 		"Slice button has been clicked."
 		filenames = gcodec.getGNUDirectoryOrFile( self.directoryPreference.value, self.filenameInput.value, self.filenameInput.wasCancelled )
-		for filename in filenames:
-			sliceFile( filename )
+		gcodec.processFiles( sliceFile, filenames, self.directoryProcesses.value )
 
 
 """
@@ -707,47 +843,178 @@ class TriangleMesh:
 		self.edges = []
 		self.faces = []
 		self.vertices = []
+		self.zoneEdgeIndexes = None
 	
 	def __repr__( self ):
 		"Get the string representation of this StretchedXSegment."
 		return str( self.vertices ) + '\n' + str( self.edges ) + '\n' + str( self.faces )
 
+	def getEdgeIndex( self, edgeTable, vertexIndexFirst, vertexIndexSecond ):
+		"Get the index of the edge between two vertices, adding the edge if it is not already in the edge table."
+		edgeKey = ( min( vertexIndexFirst, vertexIndexSecond ), max( vertexIndexFirst, vertexIndexSecond ) )
+		if edgeKey in edgeTable:
+			return edgeTable[ edgeKey ]
+		edgeIndex = len( self.edges )
+		self.edges.append( Edge().getFromVertexIndices( edgeIndex, vertexIndexFirst, vertexIndexSecond ) )
+		edgeTable[ edgeKey ] = edgeIndex
+		return edgeIndex
+
 	def getFromGNUTriangulatedSurfaceText( self, gnuTriangulatedSurfaceText ):
-		"Initialize from gnuTriangulatedSurfaceText."
-		lines = gcodec.getTextLines( gnuTriangulatedSurfaceText )
-		linesWithoutComments = []
-		for line in lines:
-			if len( line ) > 0:
-				firstCharacter = line[ 0 ]
-				if firstCharacter != '#' and firstCharacter != '!':
-					linesWithoutComments.append( line )
-		splitLine = linesWithoutComments[ 0 ].split( " " )
+		"""Initialize from gnuTriangulatedSurfaceText.
+
+		The numbers of each section are converted at once, and the garbage collector is paused while the many vertices, edges and faces are made."""
+		linesWithoutComments = [ line for line in gcodec.getTextLines( gnuTriangulatedSurfaceText ) if line[ : 1 ] not in '#!' ]
+		splitLine = linesWithoutComments[ 0 ].split( ' ' )
 		numberOfVertices = int( splitLine[ 0 ] )
 		numberOfEdges = int( splitLine[ 1 ] )
 		numberOfFaces = int( splitLine[ 2 ] )
-		faceTriples = []
-		for vertexIndex in range( numberOfVertices ):
-			line = linesWithoutComments[ vertexIndex + 1 ]
-			splitLine = line.split( " " )
-			vertex = Vec3().getFromXYZ( float( splitLine[ 0 ] ), float( splitLine[ 1 ] ), float( splitLine[ 2 ] ) )
-			self.vertices.append( vertex )
 		edgeStart = numberOfVertices + 1
-		for edgeIndex in range( numberOfEdges ):
-			line = linesWithoutComments[ edgeIndex + edgeStart ]
-			splitLine = line.split( " " )
-			edge = Edge().getFromVertexIndices( edgeIndex, int( splitLine[ 0 ] ) - 1, int( splitLine[ 1 ] ) - 1 )
-			self.edges.append( edge )
 		faceStart = edgeStart + numberOfEdges
-		for faceIndex in range( numberOfFaces ):
-			line = linesWithoutComments[ faceIndex + faceStart ]
-			splitLine = line.split( " " )
-			edgeIndexFirst = int( splitLine[ 0 ] ) - 1
-			edgeIndexSecond = int( splitLine[ 1 ] ) - 1
-			edgeIndexThird = int( splitLine[ 2 ] ) - 1
-			face = Face().getFromEdgeIndices( self.edges, faceIndex, edgeIndexFirst, edgeIndexSecond, edgeIndexThird )
-			self.faces.append( face )
+		faceEnd = faceStart + numberOfFaces
+		if len( linesWithoutComments ) < faceEnd:
+			raise IndexError( 'The GNU Triangulated Surface text has fewer lines than its vertices, edges and faces.' )
+		coordinates = getNumbersFromLines( linesWithoutComments[ 1 : edgeStart ], float, 3 )
+		edgeVertexIndexes = getNumbersFromLines( linesWithoutComments[ edgeStart : faceStart ], int, 2 )
+		faceEdgeIndexes = getNumbersFromLines( linesWithoutComments[ faceStart : faceEnd ], int, 3 )
+		wasGarbageCollecting = gc.isenabled()
+		gc.disable()
+		try:
+			for coordinateIndex in xrange( 0, len( coordinates ), 3 ):
+				self.vertices.append( Vec3( coordinates[ coordinateIndex ], coordinates[ coordinateIndex + 1 ], coordinates[ coordinateIndex + 2 ] ) )
+			for edgeIndex in xrange( numberOfEdges ):
+				vertexIndex = edgeIndex + edgeIndex
+				self.edges.append( Edge().getFromVertexIndices( edgeIndex, edgeVertexIndexes[ vertexIndex ] - 1, edgeVertexIndexes[ vertexIndex + 1 ] - 1 ) )
+			for faceIndex in xrange( numberOfFaces ):
+				edgeIndex = faceIndex + faceIndex + faceIndex
+				edgeIndexFirst = faceEdgeIndexes[ edgeIndex ] - 1
+				edgeIndexSecond = faceEdgeIndexes[ edgeIndex + 1 ] - 1
+				edgeIndexThird = faceEdgeIndexes[ edgeIndex + 2 ] - 1
+				self.faces.append( Face().getFromEdgeIndices( self.edges, faceIndex, edgeIndexFirst, edgeIndexSecond, edgeIndexThird ) )
+		finally:
+			if wasGarbageCollecting:
+				gc.enable()
+		return self
+
+	def getFromSTLText( self, stlText, weldDistance ):
+		"""Initialize from the text of a binary or ASCII STL file.
+
+		The triangle corners which are within the weld distance of each other are welded into one vertex, the triangles which share two
+		vertices share an edge, and the triangles whose corners weld together are dropped."""
+		coordinates = getSTLCoordinates( stlText )
+		edgeTable = {}
+		vertexWelder = VertexWelder().getFromVertices( self.vertices, weldDistance )
+		wasGarbageCollecting = gc.isenabled()
+		gc.disable()
+		try:
+			for coordinateIndex in xrange( 0, len( coordinates ) - 8, 9 ):
+				vertexIndexFirst = vertexWelder.getVertexIndex( coordinates[ coordinateIndex ], coordinates[ coordinateIndex + 1 ], coordinates[ coordinateIndex + 2 ] )
+				vertexIndexSecond = vertexWelder.getVertexIndex( coordinates[ coordinateIndex + 3 ], coordinates[ coordinateIndex + 4 ], coordinates[ coordinateIndex + 5 ] )
+				vertexIndexThird = vertexWelder.getVertexIndex( coordinates[ coordinateIndex + 6 ], coordinates[ coordinateIndex + 7 ], coordinates[ coordinateIndex + 8 ] )
+				if vertexIndexFirst != vertexIndexSecond and vertexIndexSecond != vertexIndexThird and vertexIndexThird != vertexIndexFirst:
+					edgeIndexFirst = self.getEdgeIndex( edgeTable, vertexIndexFirst, vertexIndexSecond )
+					edgeIndexSecond = self.getEdgeIndex( edgeTable, vertexIndexSecond, vertexIndexThird )
+					edgeIndexThird = self.getEdgeIndex( edgeTable, vertexIndexThird, vertexIndexFirst )
+					self.faces.append( Face().getFromEdgeIndices( self.edges, len( self.faces ), edgeIndexFirst, edgeIndexSecond, edgeIndexThird ) )
+		finally:
+			if wasGarbageCollecting:
+				gc.enable()
 		return self
 
+	def getRemainingEdgeTable( self, z ):
+		"Get the remaining edge hashtable, checking only the edges in the zone of z if the zones have been set."
+		if self.zoneEdgeIndexes == None:
+			return getRemainingEdgeTable( self.edges, self.vertices, z )
+		zoneIndex = int( math.floor( ( z - self.zoneBottom ) / self.zoneHeight ) )
+		if zoneIndex < 0 or zoneIndex >= len( self.zoneEdgeIndexes ):
+			return {}
+		return getRemainingEdgeTable( self.edges, self.vertices, z, self.zoneEdgeIndexes[ zoneIndex ] )
+
+	def setZoneEdgeIndexes( self, zoneHeight ):
+		"""Set the edge indexes of each zone, so that a slice only has to check the edges in the zone of its z.
+
+		Keyword arguments:
+		zoneHeight -- height of each zone, usually the layer thickness"""
+		self.zoneBottom = 999999999.0
+		zoneTop = - self.zoneBottom
+		for vertex in self.vertices:
+			self.zoneBottom = min( self.zoneBottom, vertex.z )
+			zoneTop = max( zoneTop, vertex.z )
+		self.zoneHeight = zoneHeight
+		numberOfZones = int( math.floor( ( zoneTop - self.zoneBottom ) / zoneHeight ) ) + 1
+		self.zoneEdgeIndexes = [ [] for zoneIndex in xrange( max( numberOfZones, 0 ) ) ]
+		for edgeIndex in xrange( len( self.edges ) ):
+			edge = self.edges[ edgeIndex ]
+			firstZ = self.vertices[ edge.vertexIndexFirst ].z
+			secondZ = self.vertices[ edge.vertexIndexSecond ].z
+			lowestZoneIndex = int( math.floor( ( min( firstZ, secondZ ) - self.zoneBottom ) / zoneHeight ) )
+			highestZoneIndex = int( math.floor( ( max( firstZ, secondZ ) - self.zoneBottom ) / zoneHeight ) )
+			for zoneIndex in xrange( lowestZoneIndex, highestZoneIndex + 1 ):
+				self.zoneEdgeIndexes[ zoneIndex ].append( edgeIndex )
+
+
+class VertexWelder:
+	"A hash grid of the vertices of a triangle mesh, which welds the points which are within the weld distance of a vertex to that vertex."
+	def __init__( self ):
+		"Initialize the tables."
+		self.cellTable = {}
+		self.pointTable = {}
+		self.vertices = []
+		self.weldDistance = 0.0
+
+	def __repr__( self ):
+		"Get the string representation of this VertexWelder."
+		return str( self.weldDistance ) + ' ' + str( len( self.vertices ) )
+
+	def addVertexIndex( self, x, y, z, vertexIndex ):
+		"Add a vertex index to the point table and to its cell."
+		self.pointTable[ ( x, y, z ) ] = vertexIndex
+		cellKey = self.getCellKey( x, y, z )
+		if cellKey in self.cellTable:
+			self.cellTable[ cellKey ].append( vertexIndex )
+		else:
+			self.cellTable[ cellKey ] = [ vertexIndex ]
+
+	def getCellKey( self, x, y, z ):
+		"Get the key of the cell of a point, the cells being the weld distance wide."
+		if self.weldDistance <= 0.0:
+			return ( x, y, z )
+		return ( int( math.floor( x / self.weldDistance ) ), int( math.floor( y / self.weldDistance ) ), int( math.floor( z / self.weldDistance ) ) )
+
+	def getFromVertices( self, vertices, weldDistance ):
+		"Initialize from the vertex list which will be added to, and the weld distance."
+		self.vertices = vertices
+		self.weldDistance = weldDistance
+		self.weldDistanceSquared = weldDistance * weldDistance
+		for vertexIndex in xrange( len( vertices ) ):
+			vertex = vertices[ vertexIndex ]
+			self.addVertexIndex( vertex.x, vertex.y, vertex.z, vertexIndex )
+		return self
+
+	def getVertexIndex( self, x, y, z ):
+		"Get the index of the first vertex within the weld distance of the point, adding a vertex at the point if there is none."
+		point = ( x, y, z )
+		if point in self.pointTable:
+			return self.pointTable[ point ]
+		if self.weldDistance > 0.0:
+			cellX, cellY, cellZ = self.getCellKey( x, y, z )
+			for neighborX in xrange( cellX - 1, cellX + 2 ):
+				for neighborY in xrange( cellY - 1, cellY + 2 ):
+					for neighborZ in xrange( cellZ - 1, cellZ + 2 ):
+						neighborKey = ( neighborX, neighborY, neighborZ )
+						if neighborKey in self.cellTable:
+							for vertexIndex in self.cellTable[ neighborKey ]:
+								vertex = self.vertices[ vertexIndex ]
+								separationX = vertex.x - x
+								separationY = vertex.y - y
+								separationZ = vertex.z - z
+								if separationX * separationX + separationY * separationY + separationZ * separationZ <= self.weldDistanceSquared:
+									self.pointTable[ point ] = vertexIndex
+									return vertexIndex
+		vertexIndex = len( self.vertices )
+		self.vertices.append( Vec3( x, y, z ) )
+		self.addVertexIndex( x, y, z, vertexIndex )
+		return vertexIndex
+
 
 def main( hashtable = None ):
 	"Display the slice dialog."
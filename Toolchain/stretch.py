@@ -89,8 +89,9 @@ many lines of gcode
 """
 import sys
 from vec3 import Vec3
+import bisect
+import cache
 import comb
-import cStringIO
 import euclidean
 import gcodec
 import intercircle
@@ -106,24 +107,36 @@ __license__ = "GPL 3.0"
 
 def getStretchChainGcode( gcodeText, stretchPreferences = None ):
 	"Stretch a gcode linear move text.  Chain stretch the gcode if it is not already stretched."
+	return getStretchChainToolpath( gcodeText, stretchPreferences ).getvalue()
+
+def getStretchChainToolpath( gcodeText, stretchPreferences = None ):
+	"Stretch a gcode linear move text or toolpath into a toolpath.  Chain stretch the gcode if it is not already stretched."
 	if not gcodec.isProcedureDone( gcodeText, 'comb' ):
-		gcodeText = comb.getCombChainGcode( gcodeText )
-	return getStretchGcode( gcodeText, stretchPreferences )
+		gcodeText = comb.getCombChainToolpath( gcodeText )
+	if stretchPreferences == None:
+		stretchPreferences = StretchPreferences()
+		preferences.readPreferences( stretchPreferences )
+	return cache.getCachedToolpath( gcodeText, 'stretch', stretchPreferences, getStretchToolpath )
 
 def getStretchGcode( gcodeText, stretchPreferences = None ):
 	"Stretch a gcode linear move text."
-	if gcodeText == '':
-		return ''
-	if gcodec.isProcedureDone( gcodeText, 'stretch' ):
-		return gcodeText
+	return getStretchToolpath( gcodeText, stretchPreferences ).getvalue()
+
+def getStretchToolpath( gcodeText, stretchPreferences = None ):
+	"Stretch a gcode linear move text or toolpath into a toolpath."
+	toolpath = gcodec.getToolpath( gcodeText )
+	if len( toolpath.gcodeLines ) < 1:
+		return toolpath
+	if gcodec.isProcedureDone( toolpath, 'stretch' ):
+		return toolpath
 	if stretchPreferences == None:
 		stretchPreferences = StretchPreferences()
 		preferences.readPreferences( stretchPreferences )
 	if stretchPreferences.stretchOverHalfExtrusionWidth.value <= 0.0:
-		return gcodeText
+		return toolpath
 	skein = StretchSkein()
-	skein.parseGcode( gcodeText, stretchPreferences )
-	return skein.output.getvalue()
+	skein.parseGcode( toolpath, stretchPreferences )
+	return skein.output
 
 def stretchChainFile( filename = '' ):
 	"""Stretch a gcode linear move file.  Chain stretch the gcode if it is not already stretched.
@@ -139,11 +152,11 @@ def stretchChainFile( filename = '' ):
 	preferences.readPreferences( stretchPreferences )
 	startTime = time.time()
 	print >> sys.stderr, ( 'File ' + gcodec.getSummarizedFilename( filename ) + ' is being chain stretched.' )
-	gcodeText = gcodec.getFileText( filename )
+	gcodeText = gcodec.getFileText( filename, gcodec.getReadMode( filename ) )
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_stretch.gcode'
-	gcodec.writeFileText( suffixFilename, getStretchChainGcode( gcodeText, stretchPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getStretchChainToolpath( gcodeText, stretchPreferences ) )
 	print >> sys.stderr, ( 'The stretched file is saved as ' + gcodec.getSummarizedFilename( suffixFilename ) )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 	print >> sys.stderr, ( 'It took ' + str( int( round( time.time() - startTime ) ) ) + ' seconds to stretch the file.' )
@@ -164,7 +177,7 @@ def stretchFile( filename = '' ):
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_stretch.gcode'
-	gcodec.writeFileText( suffixFilename, getStretchGcode( gcodeText, stretchPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getStretchToolpath( gcodeText, stretchPreferences ) )
 	print >> sys.stderr, ( 'The stretched file is saved as ' + suffixFilename )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 
@@ -180,18 +193,17 @@ class StretchSkein:
 		self.lineIndex = 0
 		self.lines = None
 		self.oldLocation = None
-		self.output = cStringIO.StringIO()
+		self.output = gcodec.Toolpath()
 
 	def addAlongWayLine( self, alongRatio, location ):
 		"Add stretched gcode line, along the way from the old location to the location."
 		oneMinusAlong = 1.0 - alongRatio
 		alongWayLocation = self.oldLocation.times( alongRatio ).plus( location.times( oneMinusAlong ) )
-		alongWayLine = self.getStretchedLineFromIndexLocation( self.lineIndex - 1, self.lineIndex, alongWayLocation )
-		self.addLine( alongWayLine )
+		self.addStretchedLineFromIndexLocation( self.lineIndex - 1, self.lineIndex, alongWayLocation )
 
 	def addLine( self, line ):
 		"Add a line of text and a newline to the output."
-		self.output.write( line + "\n" )
+		self.output.addLine( line )
 
 	def addStretchesBeforePoint( self, location ):
 		"Get stretched gcode line."
@@ -208,83 +220,137 @@ class StretchSkein:
 		self.addAlongWayLine( 1.0 - alongRatio, location )
 		self.addAlongWayLine( alongRatio, location )
 
-	def getRelativeStretch( self, location, lineIndexRange ):
-		"Get relative stretch for a location minus a point."
-		locationComplex = location.dropAxis( 2 )
-		lastLocationComplex = locationComplex
-		oldTotalLength = 0.0
-		pointComplex = locationComplex
-		stretchRatio = 1.0
-		totalLength = 0.0
-		if not self.extruderActive:
-			stretchRatio = self.stretchPreferences.travelOverExtrusionStretch.value
-		for lineIndex in lineIndexRange:
-			line = self.lines[ lineIndex ]
-			splitLine = line.split( ' ' )
-			firstWord = ''
-			if len( splitLine ) > 0:
-				firstWord = splitLine[ 0 ]
-			if firstWord == 'G1':
-				pointComplex = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine ).dropAxis( 2 )
-				locationMinusPoint = lastLocationComplex - pointComplex
-				locationMinusPointLength = abs( locationMinusPoint )
-				totalLength += locationMinusPointLength
-				if totalLength >= self.stretchFromDistance:
-					distanceFromRatio = ( self.stretchFromDistance - oldTotalLength ) / locationMinusPointLength
-					totalPoint = distanceFromRatio * pointComplex + ( 1.0 - distanceFromRatio ) * lastLocationComplex
-					locationMinusTotalPoint = locationComplex - totalPoint
-					return stretchRatio * locationMinusTotalPoint / self.stretchFromDistance
-				lastLocationComplex = pointComplex
-				oldTotalLength = totalLength
-			elif firstWord == 'M103':
-				stretchRatio = self.stretchPreferences.travelOverExtrusionStretch.value
-		locationMinusPoint = locationComplex - pointComplex
-		locationMinusPointLength = abs( locationMinusPoint )
-		if locationMinusPointLength > 0.0:
-			return stretchRatio * locationMinusPoint / locationMinusPointLength
-		return complex()
-
-	def getStretchedLine( self, splitLine ):
-		"Get stretched gcode line."
-		location = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
-		self.feedrateMinute = gcodec.getFeedrateMinute( self.feedrateMinute, splitLine )
+	def addStretchedLine( self, gcodeLine ):
+		"Add stretched gcode line."
+		location = gcodec.getLocationFromGcodeLine( self.oldLocation, gcodeLine )
+		self.feedrateMinute = gcodec.getFeedrateMinuteFromGcodeLine( self.feedrateMinute, gcodeLine )
 		if self.oldLocation != None:
 			self.addStretchesBeforePoint( location )
 		self.oldLocation = location
-		return self.getStretchedLineFromIndexLocation( self.lineIndex - 1, self.lineIndex + 1, location )
+		self.addStretchedLineFromIndexLocation( self.lineIndex - 1, self.lineIndex + 1, location )
 
-	def getStretchedLineFromIndexLocation( self, indexPreviousStart, indexNextStart, location ):
-		"Get stretched gcode line from line index and location."
-		nextRange = range( indexNextStart, len( self.lines ) )
-		previousRange = range( indexPreviousStart, 3, - 1 )
-		relativeStretch = self.getRelativeStretch( location, nextRange ) + self.getRelativeStretch( location, previousRange )
+	def addStretchedLineFromIndexLocation( self, indexPreviousStart, indexNextStart, location ):
+		"Add stretched gcode line from line index and location."
+		relativeStretch = self.getNextRelativeStretch( location, indexNextStart ) + self.getPreviousRelativeStretch( location, indexPreviousStart )
 		relativeStretch *= 0.8
 		relativeStretchLength = abs( relativeStretch )
 		if relativeStretchLength > 1.0:
 			relativeStretch /= relativeStretchLength
 		absoluteStretch = relativeStretch * self.maximumAbsoluteStretch
 		stretchedLocation = location.plus( Vec3( absoluteStretch.real, absoluteStretch.imag, 0.0 ) )
-		stretchedLine = "G1 X" + euclidean.getRoundedToThreePlaces( stretchedLocation.x ) + " Y" + euclidean.getRoundedToThreePlaces( stretchedLocation.y )
-		return stretchedLine + " Z" + euclidean.getRoundedToThreePlaces( stretchedLocation.z ) + ' F' + euclidean.getRoundedToThreePlaces( self.feedrateMinute )
+		self.output.addLinearMove( stretchedLocation, self.feedrateMinute )
+
+	def getNextRelativeStretch( self, location, lineIndexStart ):
+		"Get relative stretch for a location minus the points of the lines from the line index start to the end."
+		locationComplex = location.dropAxis( 2 )
+		firstPathIndex = bisect.bisect_left( self.pathLineIndexes, lineIndexStart )
+		if firstPathIndex >= len( self.pathLineIndexes ):
+			return self.getUnreachedRelativeStretch( locationComplex, locationComplex, lineIndexStart, len( self.lines ) )
+		firstLength = abs( locationComplex - self.pathComplexes[ firstPathIndex ] )
+		firstPathLength = self.pathLengths[ firstPathIndex ]
+		pathIndex = bisect.bisect_left( self.pathLengths, firstPathLength + self.stretchFromDistance - firstLength, firstPathIndex )
+		while pathIndex > firstPathIndex and firstLength + ( self.pathLengths[ pathIndex - 1 ] - firstPathLength ) >= self.stretchFromDistance:
+			pathIndex -= 1
+		while pathIndex < len( self.pathLengths ) and firstLength + ( self.pathLengths[ pathIndex ] - firstPathLength ) < self.stretchFromDistance:
+			pathIndex += 1
+		if pathIndex >= len( self.pathLengths ):
+			return self.getUnreachedRelativeStretch( locationComplex, self.pathComplexes[ - 1 ], lineIndexStart, len( self.lines ) )
+		stretchRatio = self.getStretchRatio( lineIndexStart, self.pathLineIndexes[ pathIndex ] )
+		if pathIndex == firstPathIndex:
+			return self.getReachedRelativeStretch( locationComplex, locationComplex, 0.0, self.pathComplexes[ pathIndex ], stretchRatio )
+		oldTotalLength = firstLength + ( self.pathLengths[ pathIndex - 1 ] - firstPathLength )
+		return self.getReachedRelativeStretch( locationComplex, self.pathComplexes[ pathIndex - 1 ], oldTotalLength, self.pathComplexes[ pathIndex ], stretchRatio )
+
+	def getPreviousRelativeStretch( self, location, lineIndexStart ):
+		"Get relative stretch for a location minus the points of the lines from the line index start back to the fifth line."
+		locationComplex = location.dropAxis( 2 )
+		lineIndexEnd = lineIndexStart + 1
+		lowestPathIndex = bisect.bisect_left( self.pathLineIndexes, 4 )
+		firstPathIndex = bisect.bisect_right( self.pathLineIndexes, lineIndexStart ) - 1
+		if firstPathIndex < lowestPathIndex:
+			return self.getUnreachedRelativeStretch( locationComplex, locationComplex, 4, lineIndexEnd )
+		firstLength = abs( locationComplex - self.pathComplexes[ firstPathIndex ] )
+		firstPathLength = self.pathLengths[ firstPathIndex ]
+		pathIndex = bisect.bisect_right( self.pathLengths, firstPathLength + firstLength - self.stretchFromDistance, lowestPathIndex, firstPathIndex + 1 ) - 1
+		while pathIndex < firstPathIndex and firstLength + ( firstPathLength - self.pathLengths[ pathIndex + 1 ] ) >= self.stretchFromDistance:
+			pathIndex += 1
+		while pathIndex >= lowestPathIndex and firstLength + ( firstPathLength - self.pathLengths[ pathIndex ] ) < self.stretchFromDistance:
+			pathIndex -= 1
+		if pathIndex < lowestPathIndex:
+			return self.getUnreachedRelativeStretch( locationComplex, self.pathComplexes[ lowestPathIndex ], 4, lineIndexEnd )
+		stretchRatio = self.getStretchRatio( self.pathLineIndexes[ pathIndex ] + 1, lineIndexEnd )
+		if pathIndex == firstPathIndex:
+			return self.getReachedRelativeStretch( locationComplex, locationComplex, 0.0, self.pathComplexes[ pathIndex ], stretchRatio )
+		oldTotalLength = firstLength + ( firstPathLength - self.pathLengths[ pathIndex + 1 ] )
+		return self.getReachedRelativeStretch( locationComplex, self.pathComplexes[ pathIndex + 1 ], oldTotalLength, self.pathComplexes[ pathIndex ], stretchRatio )
+
+	def getReachedRelativeStretch( self, locationComplex, lastLocationComplex, oldTotalLength, pointComplex, stretchRatio ):
+		"Get relative stretch for a location minus the point along the path at the stretch from distance, which is between the last location and the point."
+		locationMinusPointLength = abs( lastLocationComplex - pointComplex )
+		distanceFromRatio = ( self.stretchFromDistance - oldTotalLength ) / locationMinusPointLength
+		totalPoint = distanceFromRatio * pointComplex + ( 1.0 - distanceFromRatio ) * lastLocationComplex
+		locationMinusTotalPoint = locationComplex - totalPoint
+		return stretchRatio * locationMinusTotalPoint / self.stretchFromDistance
+
+	def getStretchRatio( self, lineIndexBegin, lineIndexEnd ):
+		"Get the stretch ratio, which is the travel over extrusion stretch if the extruder is off or is turned off in the lines between the indexes."
+		if not self.extruderActive:
+			return self.stretchPreferences.travelOverExtrusionStretch.value
+		if lineIndexEnd > lineIndexBegin and self.extruderOffCounts[ lineIndexEnd ] > self.extruderOffCounts[ lineIndexBegin ]:
+			return self.stretchPreferences.travelOverExtrusionStretch.value
+		return 1.0
+
+	def getUnreachedRelativeStretch( self, locationComplex, pointComplex, lineIndexBegin, lineIndexEnd ):
+		"Get relative stretch for a location minus the last point, when the path in the lines between the indexes is shorter than the stretch from distance."
+		stretchRatio = self.getStretchRatio( lineIndexBegin, lineIndexEnd )
+		locationMinusPoint = locationComplex - pointComplex
+		locationMinusPointLength = abs( locationMinusPoint )
+		if locationMinusPointLength > 0.0:
+			return stretchRatio * locationMinusPoint / locationMinusPointLength
+		return complex()
 
 	def parseGcode( self, gcodeText, stretchPreferences ):
-		"Parse gcode text and store the stretch gcode."
-		self.lines = gcodec.getTextLines( gcodeText )
+		"Parse gcode text or toolpath and store the stretch gcode."
+		self.lines = gcodec.getToolpath( gcodeText ).gcodeLines
 		self.layerIndex = - 1
 		self.stretchPreferences = stretchPreferences
+		self.parsePath()
 		for self.lineIndex in range( len( self.lines ) ):
-			line = self.lines[ self.lineIndex ]
-			self.parseStretch( line )
+			gcodeLine = self.lines[ self.lineIndex ]
+			self.parseStretch( gcodeLine )
+
+	def parsePath( self ):
+		"Parse the points of the linear moves once, with the path length up to each point, so that the stretch of each point is found without walking through the lines."
+		extruderOffCount = 0
+		location = None
+		pathLength = 0.0
+		self.extruderOffCounts = [ 0 ]
+		self.pathComplexes = []
+		self.pathLengths = []
+		self.pathLineIndexes = []
+		for lineIndex in range( len( self.lines ) ):
+			gcodeLine = self.lines[ lineIndex ]
+			firstWord = gcodeLine.firstWord
+			if firstWord == 'G1':
+				location = gcodec.getLocationFromGcodeLine( location, gcodeLine )
+				pointComplex = location.dropAxis( 2 )
+				if len( self.pathComplexes ) > 0:
+					pathLength += abs( pointComplex - self.pathComplexes[ - 1 ] )
+				self.pathComplexes.append( pointComplex )
+				self.pathLengths.append( pathLength )
+				self.pathLineIndexes.append( lineIndex )
+			elif firstWord == 'M103':
+				extruderOffCount += 1
+			self.extruderOffCounts.append( extruderOffCount )
 
-	def parseStretch( self, line ):
+	def parseStretch( self, gcodeLine ):
 		"Parse a gcode line and add it to the stretch skein."
-		splitLine = line.split( ' ' )
-		if len( splitLine ) < 1:
-			return
-		firstWord = splitLine[ 0 ]
+		splitLine = gcodeLine.splitLine
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
-			line = self.getStretchedLine( splitLine )
-		elif firstWord == 'M101':
+			self.addStretchedLine( gcodeLine )
+			return
+		if firstWord == 'M101':
 			self.extruderActive = True
 		elif firstWord == 'M103':
 			self.extruderActive = False
@@ -303,7 +369,7 @@ class StretchSkein:
 			self.layerStretchFromDistance = self.stretchFromDistance
 		elif firstWord == '(<extrusionStart>':
 			self.addLine( '(<procedureDone> stretch )' )
-		self.addLine( line )
+		self.output.addGcodeLine( gcodeLine )
 
 
 class StretchPreferences:
@@ -314,18 +380,22 @@ class StretchPreferences:
 		self.stretchFromDistanceOverExtrusionWidth = preferences.FloatPreference().getFromValue( 'Stretch From Distance Over Extrusion Width (ratio):', 2.0 )
 		self.stretchOverHalfExtrusionWidth = preferences.FloatPreference().getFromValue( 'Maximum Stretch Over Half Extrusion Width (ratio):', 0.3 )
 		self.travelOverExtrusionStretch = preferences.FloatPreference().getFromValue( 'Travel Stretch Over Extrusion Stretch (ratio):', 0.2 )
+		self.directoryProcesses = preferences.IntPreference().getFromValue( 'Directory Processes (count):', 1 )
 		directoryRadio = []
 		self.directoryPreference = preferences.RadioLabel().getFromRadioLabel( 'Stretch All Unmodified Files in a Directory', 'File or Directory Choice:', directoryRadio, False )
 		self.filePreference = preferences.Radio().getFromRadio( 'Stretch File', directoryRadio, True )
-		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ) ], 'Open File to be Stretched', '' )
+		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ), ( 'STL files', '*.stl' ) ], 'Open File to be Stretched', '' )
 		#Create the archive, title of the execute button, title of the dialog & preferences filename.
 		self.archive = [
 			self.stretchFromDistanceOverExtrusionWidth,
 			self.stretchOverHalfExtrusionWidth,
 			self.travelOverExtrusionStretch,
+			self.directoryProcesses,
 			self.directoryPreference,
 			self.filePreference,
 			self.filenameInput ]
+		#The preferences which do not change the toolpath are left out of the cache key.
+		self.nonOutputArchive = [ self.directoryProcesses, self.directoryPreference, self.filePreference, self.filenameInput ]
 		self.executeTitle = 'Stretch'
 #		self.filename = getPreferencesFilePath( 'stretch.csv' )
 		self.filenamePreferences = 'stretch.csv'
@@ -335,8 +405,7 @@ class StretchPreferences:
 	def execute( self ):
 		"Stretch button has been clicked."
 		filenames = gcodec.getGcodeDirectoryOrFile( self.directoryPreference.value, self.filenameInput.value, self.filenameInput.wasCancelled )
-		for filename in filenames:
-			stretchChainFile( filename )
+		gcodec.processFiles( stretchChainFile, filenames, self.directoryProcesses.value )
 
 
 def main( hashtable = None ):
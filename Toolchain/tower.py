@@ -88,7 +88,8 @@ many lines of gcode
 """
 
 from vec3 import Vec3
-import cStringIO
+import bisect
+import cache
 import euclidean
 import fill
 import gcodec
@@ -109,24 +110,36 @@ __license__ = "GPL 3.0"
 #make fileordirectory, All the files in the directory will be forged into a skein, because directory is the preference in fileordirectory.
 def getTowerChainGcode( gcodeText, towerPreferences = None ):
 	"Tower a gcode linear move text.  Chain tower the gcode if it is not already towered."
+	return getTowerChainToolpath( gcodeText, towerPreferences ).getvalue()
+
+def getTowerChainToolpath( gcodeText, towerPreferences = None ):
+	"Tower a gcode linear move text or toolpath into a toolpath.  Chain tower the gcode if it is not already towered."
 	if not gcodec.isProcedureDone( gcodeText, 'fill' ):
-		gcodeText = fill.getFillChainGcode( gcodeText )
-	return getTowerGcode( gcodeText, towerPreferences )
+		gcodeText = fill.getFillChainToolpath( gcodeText )
+	if towerPreferences == None:
+		towerPreferences = TowerPreferences()
+		preferences.readPreferences( towerPreferences )
+	return cache.getCachedToolpath( gcodeText, 'tower', towerPreferences, getTowerToolpath )
 
 def getTowerGcode( gcodeText, towerPreferences = None ):
 	"Tower a gcode linear move text."
-	if gcodeText == '':
-		return ''
-	if gcodec.isProcedureDone( gcodeText, 'tower' ):
-		return gcodeText
+	return getTowerToolpath( gcodeText, towerPreferences ).getvalue()
+
+def getTowerToolpath( gcodeText, towerPreferences = None ):
+	"Tower a gcode linear move text or toolpath into a toolpath."
+	toolpath = gcodec.getToolpath( gcodeText )
+	if len( toolpath.gcodeLines ) < 1:
+		return toolpath
+	if gcodec.isProcedureDone( toolpath, 'tower' ):
+		return toolpath
 	if towerPreferences == None:
 		towerPreferences = TowerPreferences()
 		preferences.readPreferences( towerPreferences )
 	if towerPreferences.maximumTowerHeight.value < 1:
-		return gcodeText
+		return toolpath
 	skein = TowerSkein()
-	skein.parseGcode( gcodeText, towerPreferences )
-	return skein.output.getvalue()
+	skein.parseGcode( toolpath, towerPreferences )
+	return skein.output
 
 def isLoopIntersectingLoop( anotherLoop, loop ):
 	"Determine if the a loop is intersecting another loop."
@@ -157,11 +170,11 @@ def towerChainFile( filename = '' ):
 	preferences.readPreferences( towerPreferences )
 	startTime = time.time()
 	print >> sys.stderr, ( 'File ' + gcodec.getSummarizedFilename( filename ) + ' is being chain towered.' )
-	gcodeText = gcodec.getFileText( filename )
+	gcodeText = gcodec.getFileText( filename, gcodec.getReadMode( filename ) )
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_tower.gcode'
-	gcodec.writeFileText( suffixFilename, getTowerChainGcode( gcodeText, towerPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getTowerChainToolpath( gcodeText, towerPreferences ) )
 	print >> sys.stderr, ( 'The towered file is saved as ' + gcodec.getSummarizedFilename( suffixFilename ) )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 	print >> sys.stderr, ( 'It took ' + str( int( round( time.time() - startTime ) ) ) + ' seconds to tower the file.' )
@@ -185,7 +198,7 @@ def towerFile( filename = '' ):
 	if gcodeText == '':
 		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '_tower.gcode'
-	gcodec.writeFileText( suffixFilename, getTowerGcode( gcodeText, towerPreferences ) )
+	gcodec.writeToolpathFile( suffixFilename, getTowerToolpath( gcodeText, towerPreferences ) )
 	print >> sys.stderr, ( 'The towered file is saved as ' + suffixFilename )
 	vectorwrite.writeSkeinforgeVectorFile( suffixFilename )
 
@@ -204,11 +217,13 @@ class TowerSkein:
 	"A class to tower a skein of extrusions."
 	def __init__( self ):
 		self.beforeExtrusionLines = None
+		self.bottomLayerIndex = 0
 		self.extruderActive = False
 		self.extrusionWidth = 0.4
 		self.feedrateMinute = 960.0
 		self.feedrateTable = {}
 		self.isEdge = False
+		self.islandIndexTable = {}
 		self.islandLayers = []
 		self.isLoop = False
 		self.lastBeforeExtrusionLines = None
@@ -219,7 +234,7 @@ class TowerSkein:
 		self.oldLocation = None
 		self.oldOrderedLocation = Vec3()
 		self.oldZ = - 999999999.0
-		self.output = cStringIO.StringIO()
+		self.output = gcodec.Toolpath()
 		self.shutdownLineIndex = sys.maxint
 		self.thread = None
 		self.threadLayer = None
@@ -228,8 +243,8 @@ class TowerSkein:
 	def addEntireLayer( self, layerIndex ):
 		"Add entire thread layer."
 		surroundingLoops = self.islandLayers[ layerIndex ]
-		for line in self.threadLayers[ layerIndex ].beforeExtrusionLines:
-			self.addLine( line )
+		for gcodeLine in self.threadLayers[ layerIndex ].beforeExtrusionLines:
+			self.output.addGcodeLine( gcodeLine )
 		euclidean.addToThreadsRemoveFromSurroundings( self.oldOrderedLocation, surroundingLoops, self )
 
 	def addGcodeFromGcodeThread( self, gcode, thread ):
@@ -254,12 +269,11 @@ class TowerSkein:
 		self.lastOutputPoint = point
 		if point in self.feedrateTable:
 			self.feedrateMinute = self.feedrateTable[ point ]
-		self.output.write( "G1 X" + euclidean.getRoundedToThreePlaces( point.x ) + " Y" + euclidean.getRoundedToThreePlaces( point.y ) )
-		self.addLine( " Z" + euclidean.getRoundedToThreePlaces( point.z ) + " F" + euclidean.getRoundedToThreePlaces( self.feedrateMinute ) )
+		self.output.addLinearMove( point, self.feedrateMinute )
 
-	def addIfTravel( self, splitLine ):
+	def addIfTravel( self, gcodeLine ):
 		"Add travel move around loops if this the extruder is off."
-		location = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
+		location = gcodec.getLocationFromGcodeLine( self.oldLocation, gcodeLine )
 		self.oldLocation = location
 
 	def addIslandLayer( self, threadLayer ):
@@ -275,17 +289,17 @@ class TowerSkein:
 		"Add gcode lines for the layer if it is different than the old bottom layer index."
 		if layerIndex != self.oldLayerIndex:
 			self.oldLayerIndex = layerIndex
-			for line in self.threadLayers[ layerIndex ].beforeExtrusionLines:
-				self.addLine( line )
+			for gcodeLine in self.threadLayers[ layerIndex ].beforeExtrusionLines:
+				self.output.addGcodeLine( gcodeLine )
 
 	def addLine( self, line ):
 		"Add a line of text and a newline to the output."
-		self.output.write( line + "\n" )
+		self.output.addLine( line )
 
 	def addShutdownToOutput( self ):
 		"Add shutdown gcode to the output."
-		for line in self.lines[ self.shutdownLineIndex : ]:
-			self.addLine( line )
+		for gcodeLine in self.lines[ self.shutdownLineIndex : ]:
+			self.output.addGcodeLine( gcodeLine )
 
 	def addToExtrusion( self, location ):
 		"Add a location to the thread."
@@ -345,12 +359,24 @@ class TowerSkein:
 			self.islandLayers[ aboveIndex ].remove( removedIsland )
 
 	def getBottomLayerIndex( self ):
-		"Get the index of the first island layer which has islands."
-		for islandLayerIndex in range( len( self.islandLayers ) ):
-			if len( self.islandLayers[ islandLayerIndex ] ) > 0:
-				return islandLayerIndex
+		"Get the index of the first island layer which has islands, starting from the last bottom layer because islands are only ever removed."
+		while self.bottomLayerIndex < len( self.islandLayers ):
+			if len( self.islandLayers[ self.bottomLayerIndex ] ) > 0:
+				return self.bottomLayerIndex
+			self.bottomLayerIndex += 1
 		return None
 
+	def getOverlappingIslands( self, layerIndex, maximum, minimum ):
+		"Get the remaining islands of the layer whose bounding rectangles overlap the rectangle from the minimum to the maximum."
+		islands = self.islandLayers[ layerIndex ]
+		if layerIndex in self.islandIndexTable:
+			islandIndex = self.islandIndexTable[ layerIndex ]
+			if len( islandIndex.islands ) == len( islands ):
+				return islandIndex.getOverlappingIslands( maximum, minimum )
+		islandIndex = IslandIndex().getFromIslands( islands )
+		self.islandIndexTable[ layerIndex ] = islandIndex
+		return islandIndex.getOverlappingIslands( maximum, minimum )
+
 	def isInsideRemovedOutsideCone( self, island, removedBoundingLoop, untilLayerIndex ):
 		"Determine if the island is entirely inside the removed bounding loop and outside the collision cone of the remaining islands."
 		if not island.boundingLoop.isEntirelyInsideAnother( removedBoundingLoop ):
@@ -358,26 +384,28 @@ class TowerSkein:
 		bottomLayerIndex = self.getBottomLayerIndex()
 		coneAngleTangent = math.tan( math.radians( self.towerPreferences.extruderPossibleCollisionConeAngle.value ) )
 		for layerIndex in range( bottomLayerIndex, untilLayerIndex ):
-			islands = self.islandLayers[ layerIndex ]
 			outsetDistance = self.extrusionWidth * ( untilLayerIndex - layerIndex ) * coneAngleTangent + 0.5 * self.extrusionWidth
-			for belowIsland in self.islandLayers[ layerIndex ]:
+			greaterThanOutsetComplex = complex( 1.01 * outsetDistance, 1.01 * outsetDistance )
+			maximum = island.boundingLoop.maximum + greaterThanOutsetComplex
+			minimum = island.boundingLoop.minimum - greaterThanOutsetComplex
+			for belowIsland in self.getOverlappingIslands( layerIndex, maximum, minimum ):
 				outsetIslandLoop = belowIsland.boundingLoop.getOutsetBoundingLoop( outsetDistance )
 				if island.boundingLoop.isIntersectingAnother( outsetIslandLoop ):
 					return False
 		return True
 
-	def linearMove( self, splitLine ):
+	def linearMove( self, gcodeLine ):
 		"Add a linear move to the loop."
-		location = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
-		self.feedrateMinute  = gcodec.getFeedrateMinute( self.feedrateMinute, splitLine )
+		location = gcodec.getLocationFromGcodeLine( self.oldLocation, gcodeLine )
+		self.feedrateMinute  = gcodec.getFeedrateMinuteFromGcodeLine( self.feedrateMinute, gcodeLine )
 		self.feedrateTable[ location ] = self.feedrateMinute
 		if self.extruderActive:
 			self.addToExtrusion( location )
 		self.oldLocation = location
 
 	def parseGcode( self, gcodeText, towerPreferences ):
-		"Parse gcode text and store the tower gcode."
-		self.lines = gcodec.getTextLines( gcodeText )
+		"Parse gcode text or toolpath and store the tower gcode."
+		self.lines = gcodec.getToolpath( gcodeText ).gcodeLines
 		self.towerPreferences = towerPreferences
 		self.parseInitialization()
 		self.oldLocation = None
@@ -393,26 +421,20 @@ class TowerSkein:
 	def parseInitialization( self ):
 		"Parse gcode initialization and store the parameters."
 		for self.lineIndex in range( len( self.lines ) ):
-			line = self.lines[ self.lineIndex ]
-			splitLine = line.split( ' ' )
-			firstWord = ''
-			if len( splitLine ) > 0:
-				firstWord = splitLine[ 0 ]
-			if firstWord == '(<extrusionStart>':
+			gcodeLine = self.lines[ self.lineIndex ]
+			if gcodeLine.firstWord == '(<extrusionStart>':
 				self.addLine( '(<procedureDone> tower )' )
-				self.addLine( line )
+				self.output.addGcodeLine( gcodeLine )
 				return
-			self.addLine( line )
+			self.output.addGcodeLine( gcodeLine )
 
 	def parseLine( self, lineIndex ):
 		"Parse a gcode line."
-		line = self.lines[ lineIndex ]
-		splitLine = line.split( ' ' )
-		if len( splitLine ) < 1:
-			return 0
-		firstWord = splitLine[ 0 ]
+		gcodeLine = self.lines[ lineIndex ]
+		splitLine = gcodeLine.splitLine
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
-			self.linearMove( splitLine )
+			self.linearMove( gcodeLine )
 			self.lastBeforeExtrusionLines = self.beforeExtrusionLines
 			self.beforeExtrusionLines = None
 		if firstWord == 'M101':
@@ -434,7 +456,7 @@ class TowerSkein:
 		elif firstWord == '(<extruderShutDown>':
 			self.shutdownLineIndex = lineIndex
 		if self.beforeExtrusionLines != None:
-			self.beforeExtrusionLines.append( line )
+			self.beforeExtrusionLines.append( gcodeLine )
 
 
 class BoundingLoop:
@@ -490,6 +512,40 @@ class BoundingLoop:
 		return False #later check for intersection on only acute angles
 
 
+class IslandIndex:
+	"A class to hold the islands of a layer sorted by the left side of their bounding rectangles, so that the islands overlapping a rectangle can be found by bisection."
+	def __repr__( self ):
+		"Get the string representation of this island index."
+		return '%s, %s' % ( self.maximumWidth, self.islands )
+
+	def getFromIslands( self, islands ):
+		"Get the island index from islands which have bounding loops."
+		self.maximumWidth = 0.0
+		leftsIslands = []
+		for island in islands:
+			boundingLoop = island.boundingLoop
+			self.maximumWidth = max( self.maximumWidth, boundingLoop.maximum.real - boundingLoop.minimum.real )
+			leftsIslands.append( ( boundingLoop.minimum.real, len( leftsIslands ), island ) )
+		leftsIslands.sort()
+		self.islands = []
+		self.lefts = []
+		for leftIsland in leftsIslands:
+			self.lefts.append( leftIsland[ 0 ] )
+			self.islands.append( leftIsland[ 2 ] )
+		return self
+
+	def getOverlappingIslands( self, maximum, minimum ):
+		"Get the islands whose bounding rectangles overlap the rectangle from the minimum to the maximum."
+		beginIndex = bisect.bisect_left( self.lefts, minimum.real - 1.01 * self.maximumWidth )
+		endIndex = bisect.bisect_right( self.lefts, maximum.real )
+		overlappingIslands = []
+		for island in self.islands[ beginIndex : endIndex ]:
+			boundingLoop = island.boundingLoop
+			if boundingLoop.maximum.real >= minimum.real and boundingLoop.maximum.imag >= minimum.imag and boundingLoop.minimum.imag <= maximum.imag:
+				overlappingIslands.append( island )
+		return overlappingIslands
+
+
 class ThreadLayer:
 	"A layer of loops and paths."
 	def __init__( self ):
@@ -511,12 +567,15 @@ class TowerPreferences:
 		self.extruderPossibleCollisionConeAngle = preferences.FloatPreference().getFromValue( 'Extruder Possible Collision Cone Angle (degrees):', 60.0 )
 		self.maximumTowerHeight = preferences.IntPreference().getFromValue( 'Maximum Tower Height (layers):', 0 )
 		self.towerStartLayer = preferences.IntPreference().getFromValue( 'Tower Start Layer (integer):', 3 )
+		self.directoryProcesses = preferences.IntPreference().getFromValue( 'Directory Processes (count):', 1 )
 		directoryRadio = []
 		self.directoryPreference = preferences.RadioLabel().getFromRadioLabel( 'Tower All Unmodified Files in a Directory', 'File or Directory Choice:', directoryRadio, False )
 		self.filePreference = preferences.Radio().getFromRadio( 'Tower File', directoryRadio, True )
-		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ) ], 'Open File to be Towered', '' )
+		self.filenameInput = preferences.Filename().getFromFilename( [ ( 'GNU Triangulated Surface text files', '*.gts' ), ( 'Gcode text files', '*.gcode' ), ( 'STL files', '*.stl' ) ], 'Open File to be Towered', '' )
 		#Create the archive, title of the execute button, title of the dialog & preferences filename.
-		self.archive = [ self.extruderPossibleCollisionConeAngle, self.maximumTowerHeight, self.towerStartLayer, self.directoryPreference, self.filePreference, self.filenameInput ]
+		self.archive = [ self.extruderPossibleCollisionConeAngle, self.maximumTowerHeight, self.towerStartLayer, self.directoryProcesses, self.directoryPreference, self.filePreference, self.filenameInput ]
+		#The preferences which do not change the toolpath are left out of the cache key.
+		self.nonOutputArchive = [ self.directoryProcesses, self.directoryPreference, self.filePreference, self.filenameInput ]
 		self.executeTitle = 'Tower'
 #		self.filename = getPreferencesFilePath( 'tower.csv' )
 		self.filenamePreferences = 'tower.csv'
@@ -526,8 +585,7 @@ class TowerPreferences:
 	def execute( self ):
 		"Tower button has been clicked."
 		filenames = gcodec.getGcodeDirectoryOrFile( self.directoryPreference.value, self.filenameInput.value, self.filenameInput.wasCancelled )
-		for filename in filenames:
-			towerChainFile( filename )
+		gcodec.processFiles( towerChainFile, filenames, self.directoryProcesses.value )
 
 
 def main( hashtable = None ):
@@ -38,8 +38,9 @@ __date__ = "$Date: 2008/21/04 $"
 __license__ = "GPL 3.0"
 
 
-class Vec3:
+class Vec3( object ):
     "A three dimensional vector class."
+    __slots__ = ( 'x', 'y', 'z' )
     def __init__( self, x = 0.0, y = 0.0, z = 0.0 ):
         self.x = x
         self.y = y
@@ -49,9 +50,13 @@ class Vec3:
         "Determine whether this vector is identical to another one."
         return self.equals( another )
 
+    def __getstate__( self ):
+        "Get the state of this Vec3 for pickling, because a class with slots has no __dict__."
+        return ( self.x, self.y, self.z )
+
     def __hash__( self ):
-        "Determine whether this vector is identical to another one."
-        return self.__repr__().__hash__()
+        "Get the hash of the components, which is the same for vectors which are identical."
+        return hash( ( self.x, self.y, self.z ) )
 
     def __ne__( self, another ):
         "Determine whether this vector is not identical to another one."
@@ -61,6 +66,10 @@ class Vec3:
         "Get the string representation of this Vec3."
         return '%s, %s, %s' % (self.x, self.y, self.z)
 
+    def __setstate__( self, state ):
+        "Set the state of this Vec3 from pickling."
+        self.x, self.y, self.z = state
+
     def add( self, another ):
         "Add another Vec3 to this one."
         self.x += another.x
@@ -102,7 +111,7 @@ class Vec3:
 
     def equals( self, another ):
         "Determine whether this vector is identical to another one."
-        if another == None:
+        if another is None:
             return False
         if self.x != another.x:
             return False
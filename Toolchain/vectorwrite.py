@@ -91,7 +91,7 @@ __license__ = "GPL 3.0"
 
 #add open webbrowser first time file is created choice
 def getVectorGcode( gcodeText, vectorwritePreferences = None ):
-	"Write a gcode text."
+	"Write a gcode text, toolpath or file."
 	if gcodeText == '':
 		return ''
 	if vectorwritePreferences == None:
@@ -119,10 +119,13 @@ def writeVectorFile( filename = '' ):
 	vectorwritePreferences = VectorwritePreferences()
 	preferences.readPreferences( vectorwritePreferences )
 	print >> sys.stderr, ( 'Scalable vector graphics are being generated for the file ' + gcodec.getSummarizedFilename( filename ) )
-	fileText = gcodec.getFileText( filename )
+	gcodeFile = gcodec.getFileForReading( filename )
+	if gcodeFile == None:
+		return
 	suffixFilename = filename[ : filename.rfind( '.' ) ] + '.svg'
 	suffixFilename = suffixFilename.replace( ' ', '_' )
-	gcodec.writeFileText( suffixFilename, getVectorGcode( fileText, vectorwritePreferences ) )
+	gcodec.writeFileText( suffixFilename, getVectorGcode( gcodeFile, vectorwritePreferences ) )
+	gcodeFile.close()
 	print >> sys.stderr, ( 'The scalable vector graphics file is saved as ' + gcodec.getSummarizedFilename( suffixFilename ) )
 
 class VectorWindow:
@@ -188,7 +191,7 @@ class VectorwriteSkein:
 		self.extrusionWidth = 0.4
 		self.fontSize = 24
 
-	def addToPath( self, location, nextLine ):
+	def addToPath( self, location, nextGcodeLine ):
 		"Add a point to travel and maybe extrusion."
 		if self.oldLocation == None:
 			return
@@ -197,17 +200,12 @@ class VectorwriteSkein:
 		colorName = 'gray'
 		if self.extruderActive:
 			colorName = self.colorNames[ self.extrusionNumber % len( self.colorNames ) ]
-		else:
-			splitLine = nextLine.split( ' ' )
-			firstWord = ''
-			if len( splitLine ) > 0:
-				firstWord = splitLine[ 0 ]
-			if firstWord != 'G1':
-				segment = endComplex - beginningComplex
-				segmentLength = abs( segment )
-				if segmentLength > 0.0:
-					truncation = 0.3 * min( segmentLength, self.extrusionWidth )
-					endComplex -= segment / segmentLength * truncation
+		elif nextGcodeLine == None or nextGcodeLine.firstWord != 'G1':
+			segment = endComplex - beginningComplex
+			segmentLength = abs( segment )
+			if segmentLength > 0.0:
+				truncation = 0.3 * min( segmentLength, self.extrusionWidth )
+				endComplex -= segment / segmentLength * truncation
 		self.vectorWindow.addColoredLine( self.scale * beginningComplex, self.scale * endComplex, colorName )
 
 	def initializeActiveLocation( self ):
@@ -224,62 +222,61 @@ class VectorwriteSkein:
 			self.cornerLow = euclidean.getPointMinimum( self.cornerLow, location )
 		self.oldLocation = location
 
-	def linearMove( self, splitLine, nextLine ):
+	def linearMove( self, splitLine, nextGcodeLine ):
 		"Get statistics for a linear move."
 		location = gcodec.getLocationFromSplitLine( self.oldLocation, splitLine )
-		self.addToPath( location, nextLine )
+		self.addToPath( location, nextGcodeLine )
 		self.oldLocation = location
 
-	def parseCorner( self, line ):
+	def parseCorner( self, gcodeLine ):
 		"Parse a gcode line and use the location to update the bounding corners."
-		splitLine = line.split( ' ' )
+		splitLine = gcodeLine.splitLine
 		if len( splitLine ) < 1:
 			return
-		firstWord = splitLine[ 0 ]
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
 			self.linearCorner( splitLine )
 		elif firstWord == 'M101':
 			self.extruderActive = True
 		elif firstWord == 'M103':
 			self.extruderActive = False
-		elif firstWord == '(<extrusionWidth>':
+		elif gcodeLine.getTag() == 'extrusionWidth':
 			self.extrusionWidth = gcodec.getDoubleAfterFirstLetter( splitLine[ 1 ] )
 
 	def parseGcode( self, gcodeText, vectorwritePreferences ):
-		"Parse gcode text and store the commented gcode."
+		"Parse gcode text, toolpath or file and store the commented gcode.  A file is read twice, one line at a time, rather than being held in memory."
 		self.initializeActiveLocation()
 		self.cornerHigh = Vec3( - 999999999.0, - 999999999.0, - 999999999.0 )
 		self.cornerLow = Vec3( 999999999.0, 999999999.0, 999999999.0 )
-		lines = gcodec.getTextLines( gcodeText )
-		for line in lines:
-			self.parseCorner( line )
+		for gcodeLine in gcodec.getGcodeLines( gcodeText ):
+			self.parseCorner( gcodeLine )
 		self.initializeActiveLocation()
 		self.colorNames = [ 'brown', 'red', 'orange', 'yellow', 'green', 'blue', 'purple' ]
 		self.scale = vectorwritePreferences.pixelsWidthExtrusion.value / self.extrusionWidth
 		self.vectorWindow = VectorWindow()
 		self.vectorWindow.setPaneCorners( self.scale * self.cornerLow.dropAxis( 2 ), self.scale * self.cornerHigh.dropAxis( 2 ) )
-		for lineIndex in range( len( lines ) ):
-			line = lines[ lineIndex ]
-			nextLine = ''
-			nextIndex = lineIndex + 1
-			if nextIndex < len( lines ):
-				nextLine = lines[ nextIndex ]
-			self.parseLine( line, nextLine )
-
-	def parseLine( self, line, nextLine ):
+		previousGcodeLine = None
+		for gcodeLine in gcodec.getGcodeLines( gcodeText ):
+			if previousGcodeLine != None:
+				self.parseLine( previousGcodeLine, gcodeLine )
+			previousGcodeLine = gcodeLine
+		if previousGcodeLine != None:
+			self.parseLine( previousGcodeLine, None )
+
+	def parseLine( self, gcodeLine, nextGcodeLine ):
 		"Parse a gcode line and add it to the commented gcode."
-		splitLine = line.split( ' ' )
+		splitLine = gcodeLine.splitLine
 		if len( splitLine ) < 1:
 			return
-		firstWord = splitLine[ 0 ]
+		firstWord = gcodeLine.firstWord
 		if firstWord == 'G1':
-			self.linearMove( splitLine, nextLine )
+			self.linearMove( splitLine, nextGcodeLine )
 		elif firstWord == 'M101':
 			self.extruderActive = True
 			self.extrusionNumber += 1
 		elif firstWord == 'M103':
 			self.extruderActive = False
-		elif firstWord == '(<layerStart>':
+		elif gcodeLine.getTag() == 'layerStart':
 			self.extrusionNumber = 0
 			if self.layerIndex > 0:
 				self.vectorWindow.addFontHeight( self.fontSize )